@@ -163,9 +163,97 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Asia/Kolkata"
 
 
+# Cache (shared by web and Celery processes)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_CACHE_URL", "redis://localhost:6379/1"),
+    },
+    # LLM responses; run this Redis with maxmemory + maxmemory-policy allkeys-lru
+    # so the least recently used responses are evicted once it is full
+    "llm": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("LLM_CACHE_URL", os.getenv("REDIS_CACHE_URL", "redis://localhost:6379/1")),
+        "KEY_PREFIX": "llm",
+    },
+}
+
+# Extracted PDF/DOCX/DOC text is cached by SHA-256 of the file bytes
+DOCUMENT_TEXT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Max concurrent Gemini calls when one request uploads several resumes
+RESUME_EXTRACTION_CONCURRENCY = int(os.getenv("RESUME_EXTRACTION_CONCURRENCY", "4"))
+
+# Structured resume extraction results, keyed by resume text hash + prompt version
+RESUME_EXTRACTION_CACHE_TTL = timedelta(days=30)
+RESUME_EXTRACTION_CACHE_MAX_ENTRIES = 20000
+
+# Approximate token budget for the resume text sent to the extraction prompt
+RESUME_PROMPT_TOKEN_BUDGET = int(os.getenv("RESUME_PROMPT_TOKEN_BUDGET", "3000"))
+
+
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL")
 
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# LLM gateway (myapp/llm.py)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))           # seconds per Gemini request
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = 0.5                                         # seconds, doubled per attempt
+LLM_BACKOFF_MAX = 8.0
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5                              # consecutive failures before failing fast
+LLM_CIRCUIT_RESET_TIMEOUT = 30                                 # seconds before a trial call is allowed
+LLM_CACHE_ALIAS = "llm"
+LLM_CACHE_TIMEOUT = int(os.getenv("LLM_CACHE_TIMEOUT", str(60 * 60 * 24)))
+LLM_CACHE_MAX_TEMPERATURE = 0.2                                # only near-deterministic calls are cached
+
+# Cluster-wide Gemini quota (myapp/llm_quota.py); match these to the project's API limits
+LLM_RATE_LIMIT_URL = os.getenv("LLM_RATE_LIMIT_URL", os.getenv("REDIS_CACHE_URL", "redis://localhost:6379/1"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "250000"))
+LLM_BACKGROUND_RESERVE = 0.2                                   # share of each bucket background calls may not use
+LLM_OUTPUT_TOKEN_ESTIMATE = 1024                               # response tokens assumed before the real count is known
+LLM_RATE_LIMIT_MAX_WAIT = {"interactive": 20, "background": 300}  # seconds a caller waits for capacity
+
+# Quick interviews draw their questions from a per-requirement pool generated in the background
+QUESTION_POOL_SIZE = 40
+QUICK_INTERVIEW_QUESTION_COUNT = 10
+# Longest a pool generation (with its retry backoff) may hold the per-requirement in-flight marker
+QUESTION_POOL_LOCK_TIMEOUT = 15 * 60
+
+# Load the emotion models in each Celery worker process at boot (tasks.warm_up_worker_models) instead of
+# on its first photo. Off by default: every child would hold ~0.5 GB even if it only sends email or calls
+# the LLM. Set EMOTION_MODEL_WARMUP=1 for workers dedicated to photo analysis.
+EMOTION_MODEL_WARMUP = os.getenv("EMOTION_MODEL_WARMUP", "0") == "1"
+# Photos still unanalyzed when an interview completes are split into Celery tasks of this many photos,
+# analyzed in parallel by the worker pool; this many or fewer are analyzed in the evaluation task itself
+EMOTION_ANALYSIS_PHOTOS_PER_TASK = int(os.getenv("EMOTION_ANALYSIS_PHOTOS_PER_TASK", "16"))
+EMOTION_ANALYSIS_BATCH_SIZE = 32       # photos decoded and classified together
+# Emotion classifier (myapp/emotion_backends.py): "fer" runs the fer package (TensorFlow) and is the
+# reference; "tflite" runs fer's quantized model on LiteRT, "onnx" an ONNX export on ONNX Runtime.
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "fer")
+EMOTION_MODEL_PATH = os.getenv("EMOTION_MODEL_PATH") or None   # required for onnx; tflite defaults to fer's model
+# Face detectors tried per photo, cheapest first (myapp/face_analysis.py). The next stage runs only when a
+# stage finds fewer than min_faces faces, or a face falls below the stage's threshold: min_confidence for
+# detectors that report a face confidence (MTCNN with the tflite/onnx backends), else min_emotion_score.
+# The latter is the top-emotion softmax score, not a detection score: a clear face with mixed emotions
+# scores 0.35-0.45 (3 of the 10 frames in photos/ with tflite) and at 0.5 went through every stage. Over 7
+# emotions a crop the classifier can't read sits near 1/7, so 0.25 only escalates those.
+# Tune the order and thresholds from `manage.py emotion_detector_stats`.
+EMOTION_DETECTOR_CASCADE = [
+    {"detector": "fer", "min_faces": 1, "min_emotion_score": 0.25},    # FER's OpenCV face detector
+    {"detector": "haar", "min_faces": 1, "min_emotion_score": 0.25},   # looser Haar pass, classifies each crop
+    {"detector": "mtcnn", "min_faces": 1, "min_confidence": 0.9},      # slowest, most robust
+]
+# Frames whose perceptual hash is at most this many bits (of 64) from an analyzed frame of the
+# same candidate reuse its result instead of running FER; negative disables the check
+PHOTO_DEDUPE_MAX_DISTANCE = int(os.getenv("PHOTO_DEDUPE_MAX_DISTANCE", "4"))
+
+# Chat sessions (myapp/chat.py): recent turns sent verbatim, older ones summarised
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+CHAT_SUMMARY_MAX_WORDS = 200
+
 
 # settings.py
 
@@ -177,6 +265,13 @@ EMAIL_HOST_USER = 'Shineinfosoft61@gmail.com'
 EMAIL_HOST_PASSWORD = 'yvnn ncyx iwdh ylfp'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Email outbox (myapp/mail.py): queued mail is sent by Celery in batches over one SMTP connection
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_DELAY = 5          # seconds to collect mail before a drain, so bursts share a connection
+EMAIL_OUTBOX_RETRY_BASE = 60    # seconds, doubled per failed attempt
+EMAIL_OUTBOX_STALE_AFTER = 15 * 60  # "Sending" rows older than this are assumed lost and retried
+
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
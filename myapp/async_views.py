@@ -0,0 +1,293 @@
+"""
+Async versions of the LLM-bound endpoints, mounted under async/ in urls.py.
+
+DRF's APIView has no async support, so these are plain Django async views
+served by interviewbot/asgi.py. While a request waits on Gemini it holds no
+thread, so one ASGI worker serves many concurrent LLM requests; only the
+database and file parsing steps are handed to sync_to_async. Request and
+response bodies match the sync views, and prompts and parsing come from the
+same modules (prompts, resumes, chat).
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import chat, llm
+from .documents import UnsupportedDocumentError, extract_document_text
+from .models import Requirement
+from .prompts import (REQUIREMENT_FIELDS, jd_analysis_prompt, jd_field_extraction_prompt, jd_fields_from_request,
+                      jd_generation_prompt, merge_missing_fields, parse_json_response, requirement_extraction_prompt,
+                      short_technology)
+from .resumes import ResumeError, aextract_many_resume_fields, create_candidates, ensure_email_available, read_resume_text
+from .serializers import ChatAiSerializer, HrSerializer, RequirementSerializer
+from .streaming import sse_response
+from .tasks import queue_question_pool
+
+
+def _error(message, status_code, **extra):
+    return JsonResponse({"error": message, **extra}, status=status_code)
+
+
+def _request_data(request):
+    """JSON or form body as a dict-like object; None when the JSON is malformed."""
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+    return request.POST
+
+
+def _wants_stream(request, data):
+    value = request.GET.get('stream', data.get('stream', ''))
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+async def _authenticate(request):
+    """Same JWT authentication as the DRF views; returns the user or None, raises AuthenticationFailed."""
+    result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    return result[0] if result else None
+
+
+def _authentication_error(exc):
+    """The 401 DRF's exception handler returns for the same failure."""
+    data = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+    response = JsonResponse(data, status=status.HTTP_401_UNAUTHORIZED)
+    response["WWW-Authenticate"] = JWTAuthentication().authenticate_header(None)
+    return response
+
+
+def _serialize(serializer_class, instance, many=False):
+    return serializer_class(instance, many=many).data
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncLLMView(View):
+    """JWT-authenticated async POST endpoint answering with JSON."""
+    http_method_names = ["post"]
+    require_auth = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await _authenticate(request) or AnonymousUser()
+        except exceptions.AuthenticationFailed as e:
+            return _authentication_error(e)
+        if self.require_auth and not request.user.is_authenticated:
+            return _authentication_error(exceptions.NotAuthenticated())
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncChatAiView(AsyncLLMView):
+    require_auth = False
+
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return _error("Malformed JSON body", status.HTTP_400_BAD_REQUEST)
+        serializer = ChatAiSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_message = serializer.validated_data['question']
+        session_id = serializer.validated_data.get('session_id')
+        if session_id:
+            session = await sync_to_async(chat.get_session)(session_id, request.user)
+            if session is None:
+                return _error("Chat session not found", status.HTTP_404_NOT_FOUND)
+        else:
+            session = await sync_to_async(chat.create_session)(request.user)
+
+        async def finish(reply):
+            await sync_to_async(chat.record_turn)(session, user_message, reply)
+            return {"data": {"session_id": str(session.id), "question": user_message, "response": reply}}
+
+        if _wants_stream(request, data):
+            return sse_response(
+                llm.stream(chat.prompt_contents(session, user_message)), lambda reply: finish(reply.strip()),
+            )
+
+        try:
+            reply = await llm.asend_chat(user_message, history=chat.history_contents(session))
+        except llm.LLMError as e:
+            return _error(f"Chat failed: {str(e)}", status.HTTP_503_SERVICE_UNAVAILABLE)
+        return JsonResponse(await finish(reply), status=status.HTTP_200_OK)
+
+
+class AsyncJDAssistantView(AsyncLLMView):
+    async def post(self, request, action):
+        data = _request_data(request)
+        if data is None:
+            return _error("Malformed JSON body", status.HTTP_400_BAD_REQUEST)
+        if action == 'analyze':
+            return await self.analyze_input(data)
+        elif action == 'generate':
+            return await self.generate_jd(request, data)
+        elif action == 'save':
+            return await self.save_jd(data)
+        return _error("Invalid action", status.HTTP_400_BAD_REQUEST)
+
+    async def analyze_input(self, data):
+        message = data.get('message', '')
+        if not message:
+            return _error("Message is required", status.HTTP_400_BAD_REQUEST)
+        try:
+            result_text = await llm.agenerate(jd_analysis_prompt(message), response_mime_type="application/json", cache=True)
+            if not result_text:
+                return _error("Failed to analyze input", status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse(parse_json_response(result_text), status=status.HTTP_200_OK)
+        except Exception as e:
+            return _error(f"Analysis failed: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def generate_jd(self, request, data):
+        fields = jd_fields_from_request(data)
+        if not fields.get('experience') or not fields.get('technology'):
+            return _error(
+                "Missing required fields",
+                status.HTTP_400_BAD_REQUEST,
+                details="Fields 'experience' and 'technology' are required to generate JD.",
+            )
+        prompt = jd_generation_prompt(fields)
+
+        if _wants_stream(request, data):
+            return sse_response(
+                llm.stream(prompt, temperature=0.3),
+                lambda jd_text: {"fields": fields, "jd_text": jd_text.strip()},
+            )
+
+        try:
+            jd_text = await llm.agenerate(prompt, temperature=0.3, response_mime_type="text/plain")
+        except Exception as e:
+            return _error(f"Generation failed: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if not jd_text:
+            return _error("Failed to generate job description", status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({"fields": fields, "jd_text": jd_text.strip()}, status=status.HTTP_200_OK)
+
+    async def save_jd(self, data):
+        fields = data.get('fields', {})
+        jd_text = data.get('jd_text', '')
+
+        if (not fields.get('experience') or not fields.get('technology')) and jd_text:
+            try:
+                result_text = await llm.agenerate(
+                    jd_field_extraction_prompt(jd_text), response_mime_type="application/json", cache=True,
+                )
+                if result_text:
+                    merge_missing_fields(fields, parse_json_response(result_text))
+            except Exception as e:
+                print("JD save extraction failed:", e)
+
+        experience = fields.get('experience')
+        technology = fields.get('technology')
+        if not experience or not technology:
+            return _error(
+                "Missing required fields",
+                status.HTTP_400_BAD_REQUEST,
+                details="Could not infer 'experience' and 'technology' from JD text.",
+            )
+        if not fields.get('name'):
+            fields["name"] = f"{technology} Developer"
+
+        try:
+            requirement = await Requirement.objects.acreate(
+                name=fields.get('name', ''),
+                experience=experience or '',
+                technology=short_technology(technology) or '',
+                No_of_openings=fields.get('No_of_openings'),
+                notice_period=fields.get('notice_period'),
+                priority=fields.get('priority', False),
+                base_text=jd_text,
+            )
+            await sync_to_async(queue_question_pool)(requirement)
+            payload = await sync_to_async(_serialize)(RequirementSerializer, requirement)
+        except Exception as e:
+            return _error(f"Save failed: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse(payload, status=status.HTTP_201_CREATED)
+
+
+class AsyncRequirementView(AsyncLLMView):
+    async def post(self, request):
+        file = request.FILES.get('file')
+        if not file:
+            return _error("No file provided", status.HTTP_400_BAD_REQUEST)
+
+        try:
+            text = await sync_to_async(extract_document_text, thread_sensitive=False)(file, ('docx', 'doc', 'pdf'))
+        except UnsupportedDocumentError:
+            return _error("Unsupported file type. Please upload .docx, .doc, or .pdf", status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return _error(f"Failed to read document: {str(e)}", status.HTTP_400_BAD_REQUEST)
+        if not text.strip():
+            return _error("Could not extract any text from the uploaded file", status.HTTP_400_BAD_REQUEST)
+
+        result_text = None
+        try:
+            result_text = await llm.agenerate(
+                requirement_extraction_prompt(text), response_mime_type="application/json", cache=True,
+            )
+            data = parse_json_response(result_text)
+        except json.JSONDecodeError as e:
+            return _error(f"Failed to parse AI response: {str(e)}", status.HTTP_422_UNPROCESSABLE_ENTITY, raw_response=result_text)
+        except llm.LLMError as e:
+            return _error(f"Failed to process requirement: {str(e)}", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        if not any(data.get(key) for key in REQUIREMENT_FIELDS):
+            return _error("Could not extract fields from Document.", status.HTTP_422_UNPROCESSABLE_ENTITY, details="")
+
+        try:
+            requirement = await Requirement.objects.acreate(
+                file=file,
+                base_text=text,
+                name=data.get('name'),
+                experience=data.get('experience'),
+                technology=data.get('technology'),
+                No_of_openings=data.get('No_of_openings'),
+                notice_period=data.get('notice_period'),
+                priority=bool(data.get('priority', False)),
+            )
+            await sync_to_async(queue_question_pool)(requirement)
+            payload = await sync_to_async(_serialize)(RequirementSerializer, requirement)
+        except Exception as e:
+            return _error(f"Failed to process requirement: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse(payload, status=status.HTTP_201_CREATED)
+
+
+def _check_emails(results):
+    seen_emails = set()
+    for data in results:
+        if isinstance(data, ResumeError):
+            raise data
+        ensure_email_available(data, seen_emails)
+
+
+class AsyncCandidateView(AsyncLLMView):
+    """
+    Synchronous resume upload (hr/ without async=true). Background ingestion
+    with async=true already returns immediately, so it stays on hr/.
+    """
+
+    async def post(self, request):
+        files = request.FILES.getlist('upload_doc')
+        if not files:
+            return _error("No file uploaded", status.HTTP_400_BAD_REQUEST)
+
+        try:
+            texts = [await sync_to_async(read_resume_text, thread_sensitive=False)(file) for file in files]
+        except ResumeError as e:
+            return JsonResponse(e.as_response_data(), status=e.status_code)
+
+        results = await aextract_many_resume_fields(texts)
+        try:
+            await sync_to_async(_check_emails)(results)
+        except ResumeError as e:
+            return JsonResponse(e.as_response_data(), status=e.status_code)
+
+        created_records = await sync_to_async(create_candidates)(list(zip(files, texts, results)))
+        records = await sync_to_async(_serialize)(HrSerializer, created_records, many=True)
+        return JsonResponse({"records": records}, status=status.HTTP_201_CREATED)
@@ -0,0 +1,142 @@
+"""
+Server-side chat sessions for ChatAiView.
+
+A session keeps recent turns verbatim and everything older as a running
+summary. Only the summary plus the turns that fit CHAT_HISTORY_TOKEN_BUDGET
+are sent with each message, so the prompt stays the same size however long
+the conversation gets. Rolling old turns into the summary costs an LLM call,
+so it runs in Celery after the turn is saved.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import llm
+from .models import ChatSession
+from .resume_sections import estimate_tokens
+
+SUMMARY_PROMPT = """
+Update the summary of a conversation between a recruiter and an AI assistant.
+Keep facts, names, numbers, decisions and open questions; drop small talk.
+Write at most {max_words} words of plain text.
+
+Current summary:
+{summary}
+
+Older messages to fold into the summary:
+{messages}
+"""
+
+
+def get_session(session_id, user):
+    """Return the caller's session, or None when it does not exist or belongs to someone else."""
+    session = ChatSession.objects.filter(pk=session_id).first()
+    if session is None or (session.user_id and session.user_id != getattr(user, "id", None)):
+        return None
+    return session
+
+
+def create_session(user):
+    return ChatSession.objects.create(user=user if user.is_authenticated else None)
+
+
+def _turn_tokens(turn):
+    return estimate_tokens(turn["text"])
+
+
+def _recent_turns(history, budget):
+    """The newest turns that fit within `budget` tokens, oldest first."""
+    recent = []
+    for turn in reversed(history):
+        budget -= _turn_tokens(turn)
+        if budget < 0:
+            break
+        recent.append(turn)
+    recent.reverse()
+    # Gemini expects the history to start with a user turn
+    while recent and recent[0]["role"] != "user":
+        recent.pop(0)
+    return recent
+
+
+def history_contents(session):
+    """Bounded Gemini history for the next message: summary first, then recent turns."""
+    contents = []
+    if session.summary:
+        contents.append({"role": "user", "parts": [f"Summary of our conversation so far:\n{session.summary}"]})
+        contents.append({"role": "model", "parts": ["Understood."]})
+    for turn in _recent_turns(session.history, settings.CHAT_HISTORY_TOKEN_BUDGET):
+        contents.append({"role": turn["role"], "parts": [turn["text"]]})
+    return contents
+
+
+def prompt_contents(session, message):
+    """history_contents() plus the new user message, for llm.stream()."""
+    return history_contents(session) + [{"role": "user", "parts": [message]}]
+
+
+def _overflow(history):
+    """The oldest turns that no longer fit CHAT_HISTORY_TOKEN_BUDGET."""
+    recent = _recent_turns(history, settings.CHAT_HISTORY_TOKEN_BUDGET)
+    return history[:len(history) - len(recent)]
+
+
+def compact_session(session_id):
+    """
+    Fold the turns that no longer fit the token budget into the summary.
+    Runs in Celery (tasks.compact_chat_session) so no request waits on the
+    summary call. The row is only locked to store the result: turns recorded
+    while the summary was generated are kept, and the result is dropped if
+    another compaction already folded the same turns.
+    """
+    session = ChatSession.objects.filter(pk=session_id).first()
+    if session is None:
+        return
+    overflow = _overflow(session.history)
+    if not overflow:
+        return
+    messages = "\n".join(f"{turn['role']}: {turn['text']}" for turn in overflow)
+    prompt = SUMMARY_PROMPT.format(
+        max_words=settings.CHAT_SUMMARY_MAX_WORDS,
+        summary=session.summary or "(none)",
+        messages=messages,
+    )
+    try:
+        summary = llm.generate(prompt, model=llm.LITE_MODEL, temperature=0.1, priority=llm.BACKGROUND)
+    except llm.LLMError as e:
+        # Keep the turns; history_contents() still only sends what fits, and the next turn retries
+        print(f"Chat summary failed for session {session_id}: {e}")
+        return
+    if not summary:
+        return
+
+    with transaction.atomic():
+        current = ChatSession.objects.select_for_update().get(pk=session_id)
+        if current.summary != session.summary or current.history[:len(overflow)] != overflow:
+            return
+        current.summary = summary
+        current.history = current.history[len(overflow):]
+        current.save(update_fields=["summary", "history", "updated_at"])
+
+
+def record_turn(session, message, reply):
+    """
+    Append one exchange to the session. The row is locked while the turn is
+    added, so concurrent turns of one session cannot overwrite each other;
+    once the history outgrows the token budget, compaction is queued.
+    """
+    from .tasks import compact_chat_session
+
+    with transaction.atomic():
+        current = ChatSession.objects.select_for_update().get(pk=session.pk)
+        current.history = current.history + [
+            {"role": "user", "text": message},
+            {"role": "model", "text": reply},
+        ]
+        current.turn_count += 1
+        current.save(update_fields=["history", "turn_count", "updated_at"])
+        if _overflow(current.history):
+            transaction.on_commit(lambda: compact_chat_session.delay(str(current.pk)))
+
+    session.summary = current.summary
+    session.history = current.history
+    session.turn_count = current.turn_count
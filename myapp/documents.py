@@ -0,0 +1,90 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+import docx
+from PyPDF2 import PdfReader
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import textract  # optional, only needed for legacy .doc files
+except ImportError:
+    textract = None
+
+
+class UnsupportedDocumentError(ValueError):
+    """Raised when an uploaded file's extension is not accepted by the caller."""
+
+
+def _pdf_text(data):
+    reader = PdfReader(BytesIO(data))
+    pages = (page.extract_text() for page in reader.pages)
+    return "".join(f"{page}\n" for page in pages if page)
+
+
+def _docx_text(data):
+    document = docx.Document(BytesIO(data))
+    return "".join(f"{para.text}\n" for para in document.paragraphs if para.text.strip())
+
+
+def _doc_text(data):
+    if textract is None:
+        raise RuntimeError("Reading .doc files requires textract to be installed.")
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.doc') as temp_file:
+        temp_file.write(data)
+        temp_file_path = temp_file.name
+    try:
+        return textract.process(temp_file_path).decode('utf-8')
+    finally:
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+
+
+def _txt_text(data):
+    return data.decode('utf-8', errors='ignore')
+
+
+EXTRACTORS = {
+    'pdf': _pdf_text,
+    'docx': _docx_text,
+    'doc': _doc_text,
+    'txt': _txt_text,
+}
+
+
+def file_extension(file):
+    return file.name.rsplit('.', 1)[-1].lower() if '.' in file.name else ''
+
+
+def extract_document_text(file, allowed_extensions):
+    """
+    Return the plain text of an uploaded PDF/DOCX/DOC/TXT file.
+
+    Results are cached by the SHA-256 of the file bytes, so re-uploading the
+    same resume or JD skips parsing entirely. The file is rewound afterwards
+    so callers can still save it to a FileField.
+    """
+    extension = file_extension(file)
+    if extension not in allowed_extensions or extension not in EXTRACTORS:
+        raise UnsupportedDocumentError(f"Unsupported file type: .{extension}")
+
+    data = file.read()
+    file.seek(0)
+
+    cache_key = f"document-text:{extension}:{hashlib.sha256(data).hexdigest()}"
+    try:
+        text = cache.get(cache_key)
+    except Exception as e:
+        print("document text cache unavailable:", e)
+        text = None
+    if text is not None:
+        return text
+
+    text = EXTRACTORS[extension](data)
+    try:
+        cache.set(cache_key, text, settings.DOCUMENT_TEXT_CACHE_TIMEOUT)
+    except Exception as e:
+        print("document text cache unavailable:", e)
+    return text
@@ -0,0 +1,172 @@
+"""
+Emotion classifiers that run FER's model without FER itself.
+
+The fer package imports the whole TensorFlow runtime just to classify 64x64
+face crops. These backends run the same classifier on a small CPU runtime
+instead, and take every face crop of a batch of photos in one call:
+
+- "tflite": fer's packaged emotion_model_quantized.tflite (the model FER
+  itself uses by default) on the standalone LiteRT / tflite-runtime
+  interpreter.
+- "onnx": fer's emotion_model.hdf5 exported to ONNX, on ONNX Runtime:
+      python -m tf2onnx.convert --keras <fer>/data/emotion_model.hdf5 --output emotion_model.onnx
+
+Cropping and normalisation reproduce FER.detect_emotions exactly, so the
+scores match the FER reference path (see the parity tests in tests.py).
+Like face_analysis, nothing here imports Django.
+"""
+import importlib.util
+import os
+
+try:
+    import cv2
+    import numpy as np
+except Exception as e:
+    print("OpenCV/NumPy import failed:", e)
+    cv2 = None
+    np = None
+
+# Index order of the model's output, as in FER._get_labels
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+
+# FER.detect_emotions preprocessing constants
+PADDING = 40
+OFFSETS = (10, 10)
+TARGET_SIZE = (64, 64)
+
+
+def fer_data_file(name):
+    """Path of a file shipped in fer/data, found without importing fer (and with it TensorFlow)."""
+    spec = importlib.util.find_spec("fer")
+    if spec is None or not spec.submodule_search_locations:
+        raise FileNotFoundError(f"fer is not installed; set EMOTION_MODEL_PATH to a copy of {name}")
+    return os.path.join(list(spec.submodule_search_locations)[0], "data", name)
+
+
+def padded_gray(image):
+    """FER.pad of the grayscale image: a PADDING border filled with the mean of the bottom two rows."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    rows, cols = gray.shape[:2]
+    mean = cv2.mean(gray[rows - 2:rows, 0:cols])[0]
+    return cv2.copyMakeBorder(
+        gray, top=PADDING, bottom=PADDING, left=PADDING, right=PADDING,
+        borderType=cv2.BORDER_CONSTANT, value=[mean, mean, mean],
+    )
+
+
+def _tosquare(box):
+    x, y, w, h = (int(v) for v in box)
+    if h > w:
+        diff = h - w
+        x -= diff // 2
+        w += diff
+    elif w > h:
+        diff = w - h
+        y -= diff // 2
+        h += diff
+    return x, y, w, h
+
+
+def face_crop(padded, box):
+    """The 64x64 grayscale crop FER classifies for `box` (x, y, w, h); None where FER skips the face."""
+    x, y, w, h = _tosquare(box)
+    x1 = max(0, x - OFFSETS[0] + PADDING)
+    y1 = max(0, y - OFFSETS[1] + PADDING)
+    x2 = x + w + OFFSETS[0] + PADDING
+    y2 = y + h + OFFSETS[1] + PADDING
+    try:
+        return cv2.resize(padded[y1:y2, x1:x2], TARGET_SIZE)
+    except Exception:
+        return None
+
+
+def classify_faces(backend, faces):
+    """
+    Emotion scores for each (image, box) in `faces`, with one backend call
+    for all of them. Returns {label: score rounded to 2 places} per face, or
+    None where FER would skip the face.
+    """
+    padded = {}
+    crops, indexes = [], []
+    for index, (image, box) in enumerate(faces):
+        if id(image) not in padded:
+            padded[id(image)] = padded_gray(image)
+        crop = face_crop(padded[id(image)], box)
+        if crop is not None:
+            crops.append(crop)
+            indexes.append(index)
+
+    scores = [None] * len(faces)
+    if crops:
+        batch = np.array(crops, dtype="float32")
+        batch = batch / 255.0
+        batch = (batch - 0.5) * 2.0
+        for index, prediction in zip(indexes, backend.predict(batch)):
+            scores[index] = {EMOTION_LABELS[i]: round(float(score), 2) for i, score in enumerate(prediction)}
+    return scores
+
+
+def _tflite_interpreter(model_path):
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            # Works, but loads the TensorFlow runtime this backend is meant to avoid
+            from tensorflow.lite import Interpreter
+    return Interpreter(model_path=model_path)
+
+
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, model_path=None):
+        self.interpreter = _tflite_interpreter(model_path or fer_data_file("emotion_model_quantized.tflite"))
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self._batch_size = self.interpreter.get_input_details()[0]["shape"][0]
+
+    def predict(self, faces):
+        """(n, 64, 64) normalised crops -> (n, 7) scores."""
+        faces = np.ascontiguousarray(faces[..., np.newaxis], dtype=np.float32)
+        if faces.shape[0] != self._batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, faces.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = faces.shape[0]
+        self.interpreter.set_tensor(self.input_index, faces)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).copy()
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_path=None):
+        import onnxruntime
+
+        if not model_path:
+            raise ValueError("The onnx emotion backend needs EMOTION_MODEL_PATH (see emotion_backends docstring)")
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exports with a fixed batch dimension take the crops in slices of that size
+        self.max_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+    def predict(self, faces):
+        faces = np.ascontiguousarray(faces[..., np.newaxis], dtype=np.float32)
+        step = self.max_batch or len(faces)
+        return np.concatenate([
+            self.session.run(None, {self.input_name: faces[start:start + step]})[0]
+            for start in range(0, len(faces), step)
+        ])
+
+
+BACKENDS = {backend.name: backend for backend in (TFLiteBackend, OnnxBackend)}
+
+
+def load_backend(name, model_path=None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown emotion backend {name!r}; choose fer, {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_path)
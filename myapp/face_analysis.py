@@ -0,0 +1,425 @@
+"""
+Face detection and emotion classification for interview photos.
+
+This module deliberately imports nothing from Django; utils passes it the
+configured cascade and backend (utils.emotion_analysis_options).
+
+With the "fer" emotion backend every detector stage is the fer package
+itself; that is the reference implementation. The other backends (see
+emotion_backends) find faces the same way FER does but classify all crops
+of a batch of photos in one call, without loading TensorFlow.
+"""
+import threading
+import time
+
+from PIL import Image
+
+from . import emotion_backends
+
+try:
+    import cv2
+    import numpy as np
+except Exception as e:
+    print("OpenCV import failed:", e)
+    cv2 = None
+    np = None
+
+FER_BACKEND = "fer"
+
+
+# Per-process model registry: loading FER (TensorFlow + MTCNN weights), an
+# emotion backend or the Haar cascade takes seconds and up to a few hundred
+# MB, so each process loads them once and reuses them for every candidate.
+# Not shared across fork(); Celery workers can warm up in worker_process_init
+# (see tasks.warm_up_worker_models).
+_models = {}
+_models_lock = threading.RLock()  # loaders may load other models (get_fer_class)
+
+
+def available(backend=FER_BACKEND):
+    if cv2 is None:
+        return False
+    return backend != FER_BACKEND or get_fer_class() is not None
+
+
+def _load_once(key, loader):
+    if key not in _models:
+        with _models_lock:
+            if key not in _models:
+                _models[key] = loader()
+    return _models[key]
+
+
+def get_fer_class():
+    """fer.fer.FER, imported on first use because it loads TensorFlow; None if unavailable."""
+    def load():
+        try:
+            from fer.fer import FER
+        except Exception as e:
+            print("FER import failed:", e)
+            return None
+        return FER
+    return _load_once("fer-class", load)
+
+
+def get_fer_detector(mtcnn=True):
+    """The process-wide FER detector; raises if it cannot be built."""
+    return _load_once(("fer", mtcnn), lambda: get_fer_class()(mtcnn=mtcnn))
+
+
+def get_fallback_detector():
+    """FER without MTCNN, or None when it cannot be built (the failure is remembered)."""
+    def load():
+        try:
+            return get_fer_class()(mtcnn=False)
+        except Exception:
+            return None
+    return _load_once(("fer", "fallback"), load)
+
+
+def get_face_cascade():
+    return _load_once(
+        "haar", lambda: cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    )
+
+
+def get_mtcnn():
+    """facenet-pytorch MTCNN as FER(mtcnn=True) builds it, for the lightweight backends."""
+    def load():
+        from facenet_pytorch import MTCNN
+        return MTCNN(keep_all=True)
+    return _load_once("mtcnn", load)
+
+
+def get_emotion_backend(backend, model_path=None):
+    return _load_once(("backend", backend, model_path), lambda: emotion_backends.load_backend(backend, model_path))
+
+
+def warm_up_emotion_models(backend=FER_BACKEND, model_path=None, cascade=None):
+    """Load every detector now so the first analysis only pays for inference."""
+    if not available(backend):
+        return False
+    started = time.monotonic()
+    if backend == FER_BACKEND:
+        get_fer_detector(mtcnn=True)
+        get_fallback_detector()
+    else:
+        get_emotion_backend(backend, model_path)
+        if any(stage["detector"] == "mtcnn" for stage in cascade or DEFAULT_CASCADE):
+            get_mtcnn()
+    get_face_cascade()
+    print(f"Emotion models loaded in {time.monotonic() - started:.1f}s")
+    return True
+
+
+def image_dhash(image):
+    """
+    64-bit difference hash of an image (path or file object) as 16 hex chars:
+    near-identical webcam frames get hashes a few bits apart. None if the
+    image cannot be read.
+    """
+    try:
+        with Image.open(image) as img:
+            pixels = list(img.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    except Exception:
+        return None
+    finally:
+        if hasattr(image, "seek"):
+            image.seek(0)
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def load_image(img_path):
+    """Read a photo as RGB, resized so detectors get a workable size; None if unreadable."""
+    img = cv2.imread(img_path)
+    if img is None:
+        return None
+
+    # Convert BGR (OpenCV) to RGB (expected by FER/MTCNN)
+    try:
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    except Exception:
+        img_rgb = img
+
+    # Resize very large images to speed up and help detection; upscale very small ones
+    try:
+        h, w = img_rgb.shape[:2]
+        max_side = max(h, w)
+        min_side = min(h, w)
+        # downscale overly large images
+        if max_side > 1280:
+            scale = 1280.0 / max_side
+            new_w, new_h = int(w * scale), int(h * scale)
+            img_rgb = cv2.resize(img_rgb, (new_w, new_h))
+        # upscale very small images to help detectors
+        elif min_side < 400:
+            scale = 400.0 / float(min_side)
+            new_w, new_h = int(w * scale), int(h * scale)
+            img_rgb = cv2.resize(img_rgb, (new_w, new_h))
+    except Exception:
+        pass
+    return img_rgb
+
+
+def _detect_mtcnn(img_rgb):
+    return get_fer_detector(mtcnn=True).detect_emotions(img_rgb)
+
+
+def _detect_fer(img_rgb):
+    fallback_detector = get_fallback_detector()
+    return fallback_detector.detect_emotions(img_rgb) if fallback_detector is not None else []
+
+
+def _detect_haar(img_rgb):
+    """Haar Cascade face detection + per-face emotion on crops."""
+    fallback_detector = get_fallback_detector()
+    face_cascade = get_face_cascade()
+    gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
+    print("haar_faces", len(faces))
+    crop_results = []
+    for (x, y, w, h) in faces:
+        # pad a bit to include context
+        pad = int(0.1 * max(w, h))
+        x0 = max(0, x - pad)
+        y0 = max(0, y - pad)
+        x1 = min(img_rgb.shape[1], x + w + pad)
+        y1 = min(img_rgb.shape[0], y + h + pad)
+        face_crop = img_rgb[y0:y1, x0:x1]
+        if face_crop.size == 0:
+            continue
+        # Use the best available FER (fallback without mtcnn preferred on crops)
+        emotion = None
+        score = 0.0
+        try:
+            if fallback_detector is not None:
+                emotion, score = fallback_detector.top_emotion(face_crop)
+            else:
+                emotion, score = get_fer_detector(mtcnn=True).top_emotion(face_crop)
+        except Exception:
+            pass
+        if emotion:
+            crop_results.append({"box": [int(x0), int(y0), int(x1 - x0), int(y1 - y0)], "emotions": {emotion: score}})
+    return crop_results
+
+
+DETECTORS = {"mtcnn": _detect_mtcnn, "fer": _detect_fer, "haar": _detect_haar}
+
+# The original fixed order: MTCNN, then FER without MTCNN, then Haar, each tried only when the previous found nothing
+DEFAULT_CASCADE = [{"detector": "mtcnn"}, {"detector": "fer"}, {"detector": "haar"}]
+
+
+def _confidence(results):
+    """Lowest top-emotion score among the faces; 0 without faces."""
+    scores = [max(face["emotions"].values()) for face in results if face.get("emotions")]
+    return min(scores) if scores else 0.0
+
+
+def _face_qualifies(face, stage):
+    """
+    Gate on the face detector's own confidence where it reports one (MTCNN
+    in the lightweight backends). Otherwise the only score is the emotion
+    softmax, which is low for any face showing mixed emotions, so it only
+    screens out crops the classifier can't read at all.
+    """
+    if face.get("confidence") is not None:
+        return face["confidence"] >= stage.get("min_confidence", 0.0)
+    emotions = face.get("emotions") or {}
+    return bool(emotions) and max(emotions.values()) >= stage.get("min_emotion_score", 0.0)
+
+
+class _CascadeRun:
+    """Escalation state of one image going through the detector cascade."""
+
+    def __init__(self):
+        self.best, self.best_key, self.used = [], None, None
+        self.stages = []
+        self.done = False
+
+    def add(self, stage, results, seconds):
+        """Record a stage's faces; True when they satisfy the stage and the cascade stops."""
+        name = stage["detector"]
+        confidence = _confidence(results)
+        accepted = (
+            bool(results) and len(results) >= stage.get("min_faces", 1)
+            and all(_face_qualifies(face, stage) for face in results)
+        )
+        self.stages.append({"detector": name, "seconds": seconds, "faces": len(results), "accepted": accepted})
+        if accepted:
+            self.best, self.used, self.done = results, name, True
+        elif results and (self.best_key is None or (len(results), confidence) > self.best_key):
+            self.best, self.best_key, self.used = results, (len(results), confidence), name
+        return accepted
+
+    def result(self):
+        return self.best, self.used, self.stages
+
+
+def detect_emotions(img_rgb, cascade=None):
+    """
+    Run the detector cascade (settings.EMOTION_DETECTOR_CASCADE, default
+    DEFAULT_CASCADE) until a stage finds at least `min_faces` faces, each
+    with a detector confidence of at least `min_confidence` or, when the
+    detector reports none, a top-emotion score of at least
+    `min_emotion_score`. When no stage qualifies the best result seen is used
+    (most faces, then highest top-emotion score).
+
+    Returns (faces with emotion scores, detector that found them or None,
+    per-stage timings for utils.record_detector_stats).
+    """
+    run = _CascadeRun()
+    for stage in cascade or DEFAULT_CASCADE:
+        name = stage["detector"]
+        started = time.perf_counter()
+        try:
+            results = DETECTORS[name](img_rgb)
+        except Exception as e:
+            print(f"{name}_detector_error", e)
+            results = []
+        if run.add(stage, results, time.perf_counter() - started):
+            break
+    return run.result()
+
+
+# Face finding for the lightweight backends, mirroring what each FER detector stage does
+
+def _find_faces_opencv(img):
+    """FER(mtcnn=False).find_faces."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    faces = get_face_cascade().detectMultiScale(
+        gray, scaleFactor=1.1, minNeighbors=5, flags=cv2.CASCADE_SCALE_IMAGE, minSize=(50, 50),
+    )
+    return list(faces)
+
+
+def _faces_fer(img_rgb):
+    return [(img_rgb, box, box, False, None) for box in _find_faces_opencv(img_rgb)]
+
+
+def _faces_mtcnn(img_rgb):
+    """FER(mtcnn=True).find_faces, keeping MTCNN's face probabilities."""
+    boxes, probabilities = get_mtcnn().detect(img_rgb)
+    if not isinstance(boxes, np.ndarray):
+        return []
+    return [
+        (img_rgb, box, box, False, float(probability))
+        for box, probability in zip(
+            ([int(f[0]), int(f[1]), int(f[2]) - int(f[0]), int(f[3]) - int(f[1])] for f in boxes), probabilities,
+        )
+    ]
+
+
+def _faces_haar(img_rgb):
+    """_detect_haar: padded Haar crops, each scored by the first face FER finds in it."""
+    gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+    faces = get_face_cascade().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
+    print("haar_faces", len(faces))
+    found = []
+    for (x, y, w, h) in faces:
+        pad = int(0.1 * max(w, h))
+        x0 = max(0, x - pad)
+        y0 = max(0, y - pad)
+        x1 = min(img_rgb.shape[1], x + w + pad)
+        y1 = min(img_rgb.shape[0], y + h + pad)
+        face_crop = img_rgb[y0:y1, x0:x1]
+        if face_crop.size == 0:
+            continue
+        inner = _find_faces_opencv(face_crop)
+        if inner:
+            found.append((face_crop, inner[0], [int(x0), int(y0), int(x1 - x0), int(y1 - y0)], True, None))
+    return found
+
+
+# name -> image -> [(image to crop from, face box in it, box to report, keep only the top emotion,
+#                    detector confidence or None)]
+FACE_FINDERS = {"mtcnn": _faces_mtcnn, "fer": _faces_fer, "haar": _faces_haar}
+
+
+def detect_emotions_batch(images, backend, cascade=None):
+    """
+    detect_emotions for several images with a lightweight emotion backend:
+    each cascade stage finds faces in every image still escalating, then
+    classifies all of their crops in one backend call.
+    """
+    runs = [_CascadeRun() for _ in images]
+    for stage in cascade or DEFAULT_CASCADE:
+        active = [i for i, run in enumerate(runs) if not run.done]
+        if not active:
+            break
+        name = stage["detector"]
+        jobs, seconds = [], {}
+        for i in active:
+            started = time.perf_counter()
+            try:
+                found = FACE_FINDERS[name](images[i])
+            except Exception as e:
+                print(f"{name}_detector_error", e)
+                found = []
+            seconds[i] = time.perf_counter() - started
+            jobs.extend((i, *face) for face in found)
+
+        started = time.perf_counter()
+        try:
+            scores = emotion_backends.classify_faces(backend, [(image, box) for _, image, box, _, _, _ in jobs])
+        except Exception as e:
+            print("emotion_classifier_error", e)
+            scores = [None] * len(jobs)
+        per_face = (time.perf_counter() - started) / len(jobs) if jobs else 0.0
+
+        results = {i: [] for i in active}
+        for (i, _, _, box, top_only, confidence), emotions in zip(jobs, scores):
+            seconds[i] += per_face
+            if not emotions:
+                continue
+            if top_only:
+                top = max(emotions, key=emotions.get)
+                emotions = {top: emotions[top]}
+            face = {"box": [int(v) for v in box], "emotions": emotions}
+            if confidence is not None:
+                face["confidence"] = confidence
+            results[i].append(face)
+        for i in active:
+            runs[i].add(stage, results[i], seconds[i])
+    return [run.result() for run in runs]
+
+
+def _photo_result(results, detector, stages):
+    print("detected_faces_count", len(results))
+    top_emotions = []
+    for face in results:
+        emotions = face.get("emotions", {})
+        if not emotions:
+            continue
+        top_emotions.append(max(emotions, key=emotions.get))
+    return {"faces": len(results), "emotions": top_emotions, "detector": detector, "stages": stages}
+
+
+def analyze_photo_batch(paths, cascade=None, backend=FER_BACKEND, model_path=None):
+    """
+    Analyze photo files. Returns, in order, {"faces": number of faces,
+    "emotions": top emotion of each face that has scores, "detector": stage
+    that found them, "stages": detect_emotions timings} per photo, or None
+    for a photo that cannot be read.
+    """
+    images = [load_image(path) for path in paths]
+    readable = [i for i, image in enumerate(images) if image is not None]
+    if backend == FER_BACKEND:
+        detections = [detect_emotions(images[i], cascade) for i in readable]
+    else:
+        detections = detect_emotions_batch(
+            [images[i] for i in readable], get_emotion_backend(backend, model_path), cascade,
+        )
+
+    results = [None] * len(paths)
+    for i, detection in zip(readable, detections):
+        results[i] = _photo_result(*detection)
+    return results
+
+
+def analyze_photo_file(img_path, cascade=None, backend=FER_BACKEND, model_path=None):
+    """analyze_photo_batch for a single photo."""
+    return analyze_photo_batch([img_path], cascade, backend, model_path)[0]
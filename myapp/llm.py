@@ -0,0 +1,450 @@
+"""
+Single gateway for every Gemini call made by the web app and Celery workers.
+
+- Model handles are built once per (model, generation config) and reused.
+- Every call has a per-request deadline.
+- Transient failures are retried with exponential backoff and full jitter.
+- A per-process circuit breaker fails fast while Gemini is degraded, instead
+  of tying up every worker on requests that are going to time out anyway.
+- Low-temperature calls can opt into a shared Redis response cache, so an
+  identical prompt is answered without spending quota.
+- Every attempt that the breaker lets through then takes capacity from the
+  cluster-wide quota buckets in llm_quota, waiting for it rather than
+  hitting Gemini's 429s.
+- stream() yields text chunks as Gemini produces them, for SSE responses.
+- agenerate() is the coroutine version of generate() for the async views.
+"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+
+import google.generativeai as genai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from google.api_core import exceptions as google_exceptions
+
+from .llm_quota import BACKGROUND, INTERACTIVE, QuotaWaitTimeout, limiter
+
+genai.configure(api_key=settings.GEMINI_API_KEY)
+
+DEFAULT_MODEL = "models/gemini-2.5-flash"
+LITE_MODEL = "models/gemini-2.5-flash-lite"
+
+# Errors worth retrying: the request may well succeed a moment later
+RETRYABLE_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    TimeoutError,
+    ConnectionError,
+)
+# Quota errors: retrying immediately only burns more quota
+QUOTA_ERRORS = (google_exceptions.TooManyRequests,)
+
+
+class LLMError(Exception):
+    """A Gemini call failed after retries."""
+
+
+class LLMQuotaError(LLMError):
+    """Gemini rejected the call because the API quota is exhausted (HTTP 429)."""
+
+
+class LLMUnavailableError(LLMError):
+    """The circuit breaker is open; Gemini is treated as down for now."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and rejects
+    calls for `reset_timeout` seconds. After that, one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """Raise while the circuit is open; returns True when this call is the half-open trial."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise LLMUnavailableError("Gemini is temporarily unavailable, please retry shortly.")
+            self._trial_in_flight = True
+            return True
+
+    def release_trial(self):
+        """
+        End the trial call however it finished. Callers do this in a finally
+        block: a trial that is cancelled or interrupted before record_success
+        or record_failure would otherwise keep every later call rejected.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_TIMEOUT)
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(model_name, temperature=0.1, response_mime_type="text/plain"):
+    """Return a cached GenerativeModel bound to the given generation config."""
+    key = (model_name, temperature, response_mime_type)
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(
+                    model_name,
+                    generation_config=genai.types.GenerationConfig(
+                        temperature=temperature,
+                        response_mime_type=response_mime_type,
+                    ),
+                )
+                _models[key] = model
+    return model
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _response_text(response):
+    try:
+        return (response.text or "").strip()
+    except ValueError:
+        # No candidates / blocked response
+        return ""
+
+
+def _estimate_tokens(contents):
+    """Rough prompt size (~4 characters per token) plus the expected response."""
+    if isinstance(contents, str):
+        chars = len(contents)
+    else:
+        chars = sum(len(str(part)) for turn in contents for part in turn["parts"])
+    return chars // 4 + settings.LLM_OUTPUT_TOKEN_ESTIMATE
+
+
+def _used_tokens(response):
+    count = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+    return count if isinstance(count, int) else None
+
+
+def _acquire_quota(tokens, priority):
+    try:
+        limiter.acquire(tokens, priority=priority, max_wait=settings.LLM_RATE_LIMIT_MAX_WAIT[priority])
+    except QuotaWaitTimeout as e:
+        raise LLMQuotaError(str(e)) from e
+
+
+def _call_with_retries(call, timeout=None, retries=None, tokens=0, priority=INTERACTIVE):
+    timeout = timeout or settings.LLM_TIMEOUT
+    retries = settings.LLM_MAX_RETRIES if retries is None else retries
+
+    last_error = None
+    for attempt in range(retries + 1):
+        # Open circuit: fail before waiting for quota
+        trial = breaker.before_call()
+        try:
+            _acquire_quota(tokens, priority)
+            response = call({"timeout": timeout})
+        except LLMQuotaError:
+            raise  # no local capacity; Gemini was not called
+        except QUOTA_ERRORS as e:
+            breaker.record_success()  # the service answered; quota is not an outage
+            raise LLMQuotaError(str(e)) from e
+        except RETRYABLE_ERRORS as e:
+            breaker.record_failure()
+            last_error = e
+            print(f"LLM attempt {attempt + 1} failed: {e}")
+            if attempt < retries:
+                time.sleep(_backoff(attempt))
+            continue
+        except Exception as e:
+            # Not evidence either way (bad request, blocked prompt, bug); leave the breaker as it is
+            raise LLMError(str(e)) from e
+        else:
+            breaker.record_success()
+        finally:
+            if trial:
+                breaker.release_trial()
+        used = _used_tokens(response)
+        if used:
+            limiter.debit(used - tokens)
+        return response
+    raise LLMError(str(last_error)) from last_error
+
+
+CACHE_HITS_KEY = "llm-cache:hits"
+CACHE_MISSES_KEY = "llm-cache:misses"
+
+
+def _response_cache_key(prompt, model, temperature, response_mime_type, cache=True):
+    """Cache key for a cacheable call, or None when the call must not be cached."""
+    if not cache or temperature is None or temperature > settings.LLM_CACHE_MAX_TEMPERATURE:
+        return None
+    digest = hashlib.sha256(f"{model}\n{temperature}\n{response_mime_type}\n{prompt}".encode('utf-8')).hexdigest()
+    return f"llm-response:{digest}"
+
+
+def _count(key):
+    response_cache = caches[settings.LLM_CACHE_ALIAS]
+    try:
+        response_cache.add(key, 0, timeout=None)
+        response_cache.incr(key)
+    except Exception as e:
+        print("LLM cache counter unavailable:", e)
+
+
+def _cached_response(cache_key):
+    try:
+        return caches[settings.LLM_CACHE_ALIAS].get(cache_key)
+    except Exception as e:
+        print("LLM cache unavailable:", e)
+        return None
+
+
+def _store_response(cache_key, text):
+    try:
+        caches[settings.LLM_CACHE_ALIAS].set(cache_key, text, settings.LLM_CACHE_TIMEOUT)
+    except Exception as e:
+        print("LLM cache unavailable:", e)
+
+
+def usage():
+    """Current quota bucket levels and response cache counters."""
+    return {"quota": limiter.usage(), "cache": cache_stats()}
+
+
+def cache_stats():
+    """Hit/miss counters of the response cache, shared by every web and Celery process."""
+    try:
+        counters = caches[settings.LLM_CACHE_ALIAS].get_many([CACHE_HITS_KEY, CACHE_MISSES_KEY])
+    except Exception as e:
+        print("LLM cache unavailable:", e)
+        counters = {}
+    hits = counters.get(CACHE_HITS_KEY, 0)
+    misses = counters.get(CACHE_MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 4) if total else None}
+
+
+async def _acall_with_retries(call, timeout=None, retries=None, tokens=0, priority=INTERACTIVE):
+    """_call_with_retries for coroutine calls; quota waits and backoff never block the event loop."""
+    timeout = timeout or settings.LLM_TIMEOUT
+    retries = settings.LLM_MAX_RETRIES if retries is None else retries
+
+    last_error = None
+    for attempt in range(retries + 1):
+        trial = breaker.before_call()
+        try:
+            await sync_to_async(_acquire_quota, thread_sensitive=False)(tokens, priority)
+            response = await call({"timeout": timeout})
+        except LLMQuotaError:
+            raise
+        except QUOTA_ERRORS as e:
+            breaker.record_success()
+            raise LLMQuotaError(str(e)) from e
+        except RETRYABLE_ERRORS as e:
+            breaker.record_failure()
+            last_error = e
+            print(f"LLM attempt {attempt + 1} failed: {e}")
+            if attempt < retries:
+                await asyncio.sleep(_backoff(attempt))
+            continue
+        except Exception as e:
+            # Not evidence either way (bad request, blocked prompt, bug); leave the breaker as it is
+            raise LLMError(str(e)) from e
+        else:
+            breaker.record_success()
+        finally:
+            # CancelledError (the ASGI request went away) skips the record_* calls
+            if trial:
+                breaker.release_trial()
+        used = _used_tokens(response)
+        if used:
+            await sync_to_async(limiter.debit, thread_sensitive=False)(used - tokens)
+        return response
+    raise LLMError(str(last_error)) from last_error
+
+
+def generate(
+    prompt, model=DEFAULT_MODEL, temperature=0.1, response_mime_type="text/plain",
+    timeout=None, retries=None, cache=False, priority=INTERACTIVE,
+):
+    """
+    Run one generate_content call through the gateway and return the stripped response text.
+
+    With cache=True and a temperature at or below LLM_CACHE_MAX_TEMPERATURE, the
+    response is cached by (model, generation config, prompt) for LLM_CACHE_TIMEOUT.
+    Empty responses are never cached.
+
+    `priority` is INTERACTIVE for requests an HR user is waiting on and
+    BACKGROUND for Celery work, which yields to interactive calls under load.
+    """
+    cache_key = _response_cache_key(prompt, model, temperature, response_mime_type, cache)
+    if cache_key:
+        cached = _cached_response(cache_key)
+        if cached is not None:
+            _count(CACHE_HITS_KEY)
+            return cached
+        _count(CACHE_MISSES_KEY)
+
+    handle = get_model(model, temperature, response_mime_type)
+    response = _call_with_retries(
+        lambda request_options: handle.generate_content(prompt, request_options=request_options),
+        timeout=timeout,
+        retries=retries,
+        tokens=_estimate_tokens(prompt),
+        priority=priority,
+    )
+    text = _response_text(response)
+    if cache_key and text:
+        _store_response(cache_key, text)
+    return text
+
+
+async def agenerate(
+    prompt, model=DEFAULT_MODEL, temperature=0.1, response_mime_type="text/plain",
+    timeout=None, retries=None, cache=False, priority=INTERACTIVE,
+):
+    """generate() for async views: the request waits on Gemini without holding a thread."""
+    cache_key = _response_cache_key(prompt, model, temperature, response_mime_type, cache)
+    if cache_key:
+        cached = await sync_to_async(_cached_response, thread_sensitive=False)(cache_key)
+        if cached is not None:
+            await sync_to_async(_count, thread_sensitive=False)(CACHE_HITS_KEY)
+            return cached
+        await sync_to_async(_count, thread_sensitive=False)(CACHE_MISSES_KEY)
+
+    handle = get_model(model, temperature, response_mime_type)
+    response = await _acall_with_retries(
+        lambda request_options: handle.generate_content_async(prompt, request_options=request_options),
+        timeout=timeout,
+        retries=retries,
+        tokens=_estimate_tokens(prompt),
+        priority=priority,
+    )
+    text = _response_text(response)
+    if cache_key and text:
+        await sync_to_async(_store_response, thread_sensitive=False)(cache_key, text)
+    return text
+
+
+def send_chat(message, history=None, model=DEFAULT_MODEL, temperature=None, timeout=None, retries=None, priority=INTERACTIVE):
+    """
+    Send one chat turn. `history` is a list of {"role": "user"|"model", "parts": [text]}
+    dicts; the call is stateless so any process can serve any turn.
+    """
+    handle = get_model(model, temperature, "text/plain")
+    contents = list(history or []) + [{"role": "user", "parts": [message]}]
+    response = _call_with_retries(
+        lambda request_options: handle.generate_content(contents, request_options=request_options),
+        timeout=timeout,
+        retries=retries,
+        tokens=_estimate_tokens(contents),
+        priority=priority,
+    )
+    return _response_text(response)
+
+
+async def asend_chat(message, history=None, model=DEFAULT_MODEL, temperature=None, timeout=None, retries=None, priority=INTERACTIVE):
+    """send_chat() for async views."""
+    handle = get_model(model, temperature, "text/plain")
+    contents = list(history or []) + [{"role": "user", "parts": [message]}]
+    response = await _acall_with_retries(
+        lambda request_options: handle.generate_content_async(contents, request_options=request_options),
+        timeout=timeout,
+        retries=retries,
+        tokens=_estimate_tokens(contents),
+        priority=priority,
+    )
+    return _response_text(response)
+
+
+async def stream(contents, model=DEFAULT_MODEL, temperature=None, timeout=None, priority=INTERACTIVE):
+    """
+    Async generator over the text chunks of one streamed generate_content call.
+    `contents` is a prompt string or chat history list as accepted by send_chat.
+
+    Quota and the circuit breaker apply as for generate(), but nothing is
+    retried: once the first chunk has gone out the call cannot be replayed.
+    """
+    handle = get_model(model, temperature, "text/plain")
+    tokens = _estimate_tokens(contents)
+    trial = breaker.before_call()
+    try:
+        await sync_to_async(_acquire_quota, thread_sensitive=False)(tokens, priority)
+        response = await handle.generate_content_async(
+            contents, stream=True, request_options={"timeout": timeout or settings.LLM_TIMEOUT},
+        )
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+    except LLMQuotaError:
+        raise
+    except QUOTA_ERRORS as e:
+        breaker.record_success()
+        raise LLMQuotaError(str(e)) from e
+    except RETRYABLE_ERRORS as e:
+        breaker.record_failure()
+        raise LLMError(str(e)) from e
+    except Exception as e:
+        # Not evidence either way (bad request, blocked prompt, bug); leave the breaker as it is
+        raise LLMError(str(e)) from e
+    else:
+        breaker.record_success()
+    finally:
+        # A client disconnect throws GeneratorExit / CancelledError in at the yield
+        if trial:
+            breaker.release_trial()
+
+    used = _used_tokens(response)
+    if used:
+        await sync_to_async(limiter.debit, thread_sensitive=False)(used - tokens)
+
+
+def _chunk_text(chunk):
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
@@ -0,0 +1,152 @@
+"""
+Cluster-wide Gemini quota, shared by every web and Celery process through Redis.
+
+Two token buckets (requests/minute and tokens/minute) refill continuously and
+are checked and debited atomically by one Lua script. Background callers must
+leave a reserved share of both buckets untouched, so interactive HR requests
+still get through while bulk rating drains the quota.
+
+If Redis is unreachable the limiter fails open: Gemini's own 429s are then the
+only limit, which is how the app behaved before.
+"""
+import time
+
+import redis
+from django.conf import settings
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# KEYS: requests bucket, tokens bucket
+# ARGV: requests/min, tokens/min, request cost, token cost, reserved fraction, force (1 = debit without checking)
+# Returns {milliseconds to wait (0 = granted), requests left, tokens left}
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+
+local function current(key, capacity)
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1])
+    local ts = tonumber(state[2])
+    if level == nil or ts == nil then
+        return capacity
+    end
+    return math.min(capacity, level + (now - ts) * capacity / 60000)
+end
+
+local request_capacity = tonumber(ARGV[1])
+local token_capacity = tonumber(ARGV[2])
+local request_cost = tonumber(ARGV[3])
+local token_cost = tonumber(ARGV[4])
+local reserve = tonumber(ARGV[5])
+
+local requests = current(KEYS[1], request_capacity)
+local tokens = current(KEYS[2], token_capacity)
+
+if ARGV[6] ~= '1' then
+    local wait = 0
+    local request_need = request_cost + reserve * request_capacity
+    local token_need = token_cost + reserve * token_capacity
+    if requests < request_need then
+        wait = math.max(wait, (request_need - requests) * 60000 / request_capacity)
+    end
+    if tokens < token_need then
+        wait = math.max(wait, (token_need - tokens) * 60000 / token_capacity)
+    end
+    if wait > 0 then
+        return {math.ceil(wait), tostring(requests), tostring(tokens)}
+    end
+end
+
+requests = requests - request_cost
+tokens = tokens - token_cost
+redis.call('HSET', KEYS[1], 'level', tostring(requests), 'ts', now)
+redis.call('HSET', KEYS[2], 'level', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+redis.call('PEXPIRE', KEYS[2], 120000)
+return {0, tostring(requests), tostring(tokens)}
+"""
+
+
+class QuotaWaitTimeout(Exception):
+    """No Gemini capacity became available within the caller's wait limit."""
+
+
+class TokenBucketLimiter:
+    def __init__(self, url, requests_per_minute, tokens_per_minute, background_reserve=0.0, key_prefix="llm-quota"):
+        self.url = url
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.background_reserve = background_reserve
+        self.keys = [f"{key_prefix}:requests", f"{key_prefix}:tokens"]
+        self._script = None
+
+    def _get_script(self):
+        if self._script is None:
+            client = redis.Redis.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+            self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+    def _run(self, request_cost, token_cost, reserve=0.0, force=False):
+        wait_ms, requests, tokens = self._get_script()(
+            keys=self.keys,
+            args=[self.requests_per_minute, self.tokens_per_minute, request_cost, token_cost, reserve, int(force)],
+        )
+        return int(wait_ms) / 1000, float(requests), float(tokens)
+
+    def _reserve_for(self, priority):
+        return self.background_reserve if priority == BACKGROUND else 0.0
+
+    def acquire(self, tokens, priority=INTERACTIVE, max_wait=None):
+        """
+        Take one request and `tokens` tokens from the shared buckets, sleeping
+        until they are available. Returns the seconds spent waiting; raises
+        QuotaWaitTimeout when that would exceed `max_wait`.
+        """
+        reserve = self._reserve_for(priority)
+        # A single call larger than the usable bucket would otherwise wait forever
+        tokens = min(tokens, self.tokens_per_minute * (1 - reserve))
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        started = time.monotonic()
+        while True:
+            try:
+                wait, _, _ = self._run(1, tokens, reserve)
+            except redis.RedisError as e:
+                print("LLM rate limiter unavailable, allowing call:", e)
+                return 0.0
+            if wait <= 0:
+                return time.monotonic() - started
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise QuotaWaitTimeout(f"Gemini quota exhausted; next slot in {wait:.1f}s")
+            time.sleep(wait)
+
+    def debit(self, tokens):
+        """Correct the token bucket once the real usage of a call is known (negative refunds)."""
+        if not tokens:
+            return
+        try:
+            self._run(0, tokens, force=True)
+        except redis.RedisError as e:
+            print("LLM rate limiter unavailable:", e)
+
+    def usage(self):
+        """Current bucket levels; None when Redis is unreachable."""
+        try:
+            _, requests, tokens = self._run(0, 0, force=True)
+        except redis.RedisError as e:
+            print("LLM rate limiter unavailable:", e)
+            return None
+        return {
+            "requests": {"available": int(requests), "limit_per_minute": self.requests_per_minute},
+            "tokens": {"available": int(tokens), "limit_per_minute": self.tokens_per_minute},
+            "background_reserve": self.background_reserve,
+        }
+
+
+limiter = TokenBucketLimiter(
+    settings.LLM_RATE_LIMIT_URL,
+    settings.LLM_REQUESTS_PER_MINUTE,
+    settings.LLM_TOKENS_PER_MINUTE,
+    background_reserve=settings.LLM_BACKGROUND_RESERVE,
+)
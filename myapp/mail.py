@@ -0,0 +1,115 @@
+"""
+Outbox for candidate emails.
+
+Views only insert an OutboundEmail row; a Celery task later claims due rows
+in batches and sends them over a single SMTP connection, so an HR user
+scheduling many interviews does not pay one TLS handshake per email inside
+the request. Each row keeps its own status, so one rejected address does not
+fail the rest of the batch, and failed sends are retried with backoff.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+def queue_email(subject, message, recipient_list, from_email=None):
+    """Store an email for background delivery and make sure a drain is scheduled."""
+    from .tasks import schedule_email_drain
+
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+    transaction.on_commit(schedule_email_drain)
+    return email
+
+
+def _due_emails():
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_OUTBOX_STALE_AFTER)
+    return OutboundEmail.objects.filter(
+        Q(status="Pending", send_after__lte=now) | Q(status="Sending", updated_at__lt=stale)
+    )
+
+
+def claim_batch(limit):
+    """
+    Mark up to `limit` due emails as Sending and return them. Rows locked by a
+    concurrent drain are skipped, so two workers never send the same email.
+    Rows stuck in Sending (worker died mid-batch) are claimed again.
+    """
+    with transaction.atomic():
+        ids = list(
+            _due_emails().select_for_update(skip_locked=True).order_by("send_after").values_list("id", flat=True)[:limit]
+        )
+        OutboundEmail.objects.filter(id__in=ids).update(
+            status="Sending", attempts=F("attempts") + 1, updated_at=timezone.now(),
+        )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by("send_after"))
+
+
+def _mark_failed(email, error):
+    email.last_error = str(error)[:1000]
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = "Failed"
+        print(f"Email sending failed permanently ({email.to}): {error}")
+    else:
+        email.status = "Pending"
+        email.send_after = timezone.now() + timedelta(
+            seconds=settings.EMAIL_OUTBOX_RETRY_BASE * 2 ** (email.attempts - 1)
+        )
+        print(f"Email sending failed ({email.to}), retrying at {email.send_after}: {error}")
+    email.save(update_fields=["status", "send_after", "last_error", "updated_at"])
+
+
+def send_pending_emails(batch_size=None):
+    """
+    Send one batch of due emails over a single connection. Returns the number
+    of emails claimed; a full batch means more may be waiting.
+    """
+    batch = claim_batch(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in batch:
+            _mark_failed(email, e)
+        return len(batch)
+
+    try:
+        for email in batch:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                _mark_failed(email, e)
+                continue
+            email.status = "Sent"
+            email.sent_at = timezone.now()
+            email.last_error = None
+            email.save(update_fields=["status", "sent_at", "last_error", "updated_at"])
+    finally:
+        try:
+            connection.close()
+        except Exception as e:
+            print("Closing SMTP connection failed:", e)
+    return len(batch)
+
+
+def next_retry_delay():
+    """Seconds until the earliest pending email is due, or None when the outbox is empty."""
+    next_email = OutboundEmail.objects.filter(status="Pending").order_by("send_after").first()
+    if next_email is None:
+        return None
+    return max(0, (next_email.send_after - timezone.now()).total_seconds())
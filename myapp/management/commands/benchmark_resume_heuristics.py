@@ -0,0 +1,69 @@
+import random
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.resume_heuristics import extract_fields
+
+
+def sample_resumes(seed=7):
+    """Synthetic corpus: tidy resumes, long multi-job resumes and messy PDF-dump text."""
+    rng = random.Random(seed)
+    companies = ["Acme Technologies", "Globex Solutions", "Initech Systems", "Umbrella Services Ltd", "Hooli Inc"]
+    techs = ["Python", "Java", "React", ".NET", "Go"]
+    corpus = []
+    for i in range(20):
+        jobs = "\n".join(
+            f"{rng.choice(companies)}\nSoftware Engineer, Jan {2015 + j} - Dec {2016 + j}\nWorked at {rng.choice(companies)} from {2015 + j}"
+            for j in range(rng.randint(1, 6))
+        )
+        corpus.append(
+            f"Candidate {i}\ncandidate{i}@example.com\n+91 98765 43{i:03d}\n"
+            f"Skills: {', '.join(rng.sample(techs, 3))}\n\nExperience\n{jobs}\n\nEducation\nB.Tech 2014\n"
+        )
+    # Long resume with many jobs and repeated headers
+    corpus.append("\n".join(corpus[:10]) * 5)
+    # Messy extraction output: no punctuation, run-together words, long alnum runs
+    words = ["experience", "company", "solutions", "project", "developer", "systems", "team", "2021"]
+    corpus.append(" ".join(rng.choice(words) for _ in range(20000)))
+    corpus.append(("Acme " * 3000) + "\n" + ("1 2 3 4 5 6 7 8 9 " * 500))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the heuristic resume extractor over a sample corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus-dir", help="Directory of .txt resumes to use instead of the built-in corpus.")
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument("--max-ms", type=float, help="Fail if any single resume takes longer than this (ms).")
+
+    def handle(self, *args, **options):
+        if options["corpus_dir"]:
+            corpus = [p.read_text(errors="ignore") for p in sorted(Path(options["corpus_dir"]).glob("*.txt"))]
+            if not corpus:
+                raise CommandError("No .txt files found in corpus directory.")
+        else:
+            corpus = sample_resumes()
+
+        timings = []
+        worst = (0.0, 0)
+        for index, text in enumerate(corpus):
+            samples = []
+            for _ in range(options["iterations"]):
+                start = time.perf_counter()
+                extract_fields(text)
+                samples.append((time.perf_counter() - start) * 1000)
+            best = min(samples)
+            timings.append(best)
+            if best > worst[0]:
+                worst = (best, index)
+
+        self.stdout.write(
+            f"resumes={len(corpus)} chars={sum(len(t) for t in corpus)} "
+            f"median={statistics.median(timings):.2f}ms max={worst[0]:.2f}ms (resume #{worst[1]}, {len(corpus[worst[1]])} chars)"
+        )
+        if options["max_ms"] is not None and worst[0] > options["max_ms"]:
+            raise CommandError(f"Heuristic extraction regression: {worst[0]:.2f}ms > {options['max_ms']}ms")
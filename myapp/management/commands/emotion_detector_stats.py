@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from myapp.utils import detector_stats, reset_detector_stats
+
+
+class Command(BaseCommand):
+    help = "Show per-stage hit rates and latency of the face detector cascade (EMOTION_DETECTOR_CASCADE)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Clear the counters after printing them.")
+
+    def handle(self, *args, **options):
+        for detector, stats in detector_stats().items():
+            if not stats["runs"]:
+                self.stdout.write(f"{detector}: runs=0")
+                continue
+            self.stdout.write(
+                f"{detector}: runs={stats['runs']} found={stats['found_rate']:.1%} "
+                f"accepted={stats['accept_rate']:.1%} mean_latency={stats['mean_latency_ms']}ms"
+            )
+        if options["reset"]:
+            reset_detector_stats()
+            self.stdout.write("Counters reset.")
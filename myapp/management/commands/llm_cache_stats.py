@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from myapp import llm
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the shared LLM response cache."
+
+    def handle(self, *args, **options):
+        stats = llm.cache_stats()
+        hit_rate = "n/a" if stats["hit_rate"] is None else f"{stats['hit_rate']:.1%}"
+        self.stdout.write(f"hits={stats['hits']} misses={stats['misses']} hit_rate={hit_rate}")
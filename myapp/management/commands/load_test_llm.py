@@ -0,0 +1,67 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent POST requests at an endpoint and report throughput and latency, "
+        "e.g. to compare chat/ under WSGI with async/chat/ under ASGI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Full endpoint URL, e.g. http://localhost:8000/async/chat/")
+        parser.add_argument("--body", default='{"question": "Summarise the SOLID principles in one line each."}',
+                            help="JSON request body.")
+        parser.add_argument("--token", help="JWT access token sent as 'Authorization: Bearer <token>'.")
+        parser.add_argument("--requests", type=int, default=50, help="Total requests to send.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once.")
+        parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds.")
+
+    def _send(self, url, body, headers, timeout):
+        request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                code = response.status
+        except urllib.error.HTTPError as e:
+            code = e.code
+        except Exception as e:
+            code = type(e).__name__
+        return code, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        try:
+            body = json.dumps(json.loads(options["body"])).encode("utf-8")
+        except ValueError as e:
+            raise CommandError(f"--body is not valid JSON: {e}")
+        headers = {"Content-Type": "application/json"}
+        if options["token"]:
+            headers["Authorization"] = f"Bearer {options['token']}"
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(
+                lambda _: self._send(options["url"], body, headers, options["timeout"]),
+                range(options["requests"]),
+            ))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        codes = Counter(str(code) for code, _ in results)
+        self.stdout.write(
+            f"requests={len(results)} concurrency={options['concurrency']} elapsed={elapsed:.2f}s "
+            f"throughput={len(results) / elapsed:.2f} req/s"
+        )
+        self.stdout.write(
+            f"latency p50={statistics.median(latencies):.2f}s p95={p95:.2f}s max={latencies[-1]:.2f}s"
+        )
+        self.stdout.write("status " + " ".join(f"{code}={count}" for code, count in sorted(codes.items())))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_candidate_is_quick'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['created_at', 'id'], name='candidate_created_id_idx'),
+        ),
+    ]
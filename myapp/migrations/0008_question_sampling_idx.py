@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_candidate_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['technology', 'difficulty_level', 'id'], name='question_sampling_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:58
+
+import hashlib
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of question_bank.normalize_question_text / question_text_hash as of
+# this migration, so later changes to the app code cannot change what it does
+_NUMBERING_RE = re.compile(r'^\s*(?:q(?:uestion)?\s*)?\d+\s*[\).:-]\s*', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def question_text_hash(text):
+    text = _NUMBERING_RE.sub('', text or '')
+    text = _WHITESPACE_RE.sub(' ', text).strip().lower().rstrip('?.!: ')
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def backfill_text_hash(apps, schema_editor):
+    Question = apps.get_model('myapp', 'Question')
+    batch = []
+    for question in Question.objects.exclude(text__isnull=True).only('id', 'text').iterator(chunk_size=2000):
+        question.text_hash = question_text_hash(question.text)
+        batch.append(question)
+        if len(batch) >= 2000:
+            Question.objects.bulk_update(batch, ['text_hash'])
+            batch = []
+    if batch:
+        Question.objects.bulk_update(batch, ['text_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_question_sampling_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='text_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_text_hash, migrations.RunPython.noop),
+    ]
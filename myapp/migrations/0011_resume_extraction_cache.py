@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_resume_ingest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumeExtractionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64)),
+                ('prompt_version', models.CharField(max_length=32)),
+                ('data', models.JSONField(default=dict)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('text_hash', 'prompt_version'), name='unique_resume_extraction')],
+            },
+        ),
+    ]
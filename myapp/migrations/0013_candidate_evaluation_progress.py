@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_chat_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidate',
+            name='evaluation_progress',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='candidate',
+            name='evaluation_status',
+            field=models.CharField(blank=True, choices=[('Pending', 'Pending'), ('Processing', 'Processing'), ('Completed', 'Completed'), ('Failed', 'Failed')], max_length=20, null=True),
+        ),
+    ]
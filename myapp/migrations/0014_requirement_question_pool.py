@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_candidate_evaluation_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='requirement',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='question_pool', to='myapp.requirement'),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='question_pool_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
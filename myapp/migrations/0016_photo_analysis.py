@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:23
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoAnalysis',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Processing', 'Processing'), ('Completed', 'Completed'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('face_count', models.IntegerField(default=0)),
+                ('emotions', models.JSONField(default=list)),
+                ('detector', models.CharField(blank=True, max_length=20, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photo_analyses', to='myapp.candidate')),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analyses', to='myapp.photo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('photo', 'candidate'), name='unique_photo_analysis')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:23
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def release_duplicate_bank_hashes(apps, schema_editor):
+    # Bank rows added one at a time before this constraint may share a hash. The oldest keeps it;
+    # the others stay (answers can point at them) but no longer take part in the dedupe.
+    Question = apps.get_model('myapp', 'Question')
+    bank = Question.objects.filter(requirement__isnull=True, candidate__isnull=True, text_hash__isnull=False)
+    duplicates = bank.values('text_hash').annotate(rows=Count('id'), first_id=Min('id')).filter(rows__gt=1)
+    for duplicate in duplicates.iterator():
+        bank.filter(text_hash=duplicate['text_hash']).exclude(id=duplicate['first_id']).update(text_hash=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_photo_phash'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_duplicate_bank_hashes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(condition=models.Q(('candidate__isnull', True), ('requirement__isnull', True)), fields=('text_hash',), name='unique_bank_question_text'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext as _
 from .managers import CustomUserManager
 
@@ -22,6 +23,27 @@ USER_CHOICES = [
         ('Normal', 'Normal'),
     ]
 
+INGEST_STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Processing', 'Processing'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+EVALUATION_STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Processing', 'Processing'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+EMAIL_STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Sending', 'Sending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    ]
+
 INTERVIEW_CHOICES = [
         ('Pending', 'Pending'),
         ('Completed', 'Completed'),
@@ -59,6 +81,7 @@ class Requirement(models.Model):
     notice_period = models.IntegerField(null=True, blank=True)
     priority = models.BooleanField(default=False)
     base_text = models.TextField(null=True, blank=True)
+    question_pool_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)  # requirement text the pool was built from
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -85,6 +108,8 @@ class Candidate(models.Model):
     photos = models.ManyToManyField('Photo', related_name='candidate_records', blank=True)
     emotion_summary = models.JSONField(blank=True, null=True)
     communication = models.JSONField(default=dict)
+    evaluation_status = models.CharField(max_length=20, choices=EVALUATION_STATUS_CHOICES, blank=True, null=True)
+    evaluation_progress = models.IntegerField(default=0)  # percent of the post-interview evaluation done
     company = models.JSONField(default=list)
     base_text = models.TextField(null=True, blank=True)
     is_selected = models.BooleanField(null=True, blank=True)
@@ -92,13 +117,22 @@ class Candidate(models.Model):
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='candidate_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.email})"
 
 
 class Question(models.Model):
     text = models.TextField(null=True, blank=True)
+    text_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True, editable=False)
     candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, related_name="questions",null=True, blank=True)
+    # Set on quick-interview pool questions; candidates get copies of pool rows
+    requirement = models.ForeignKey(Requirement, on_delete=models.CASCADE, related_name="question_pool", null=True, blank=True)
     technology = models.CharField(max_length=50, choices=TECHNOLOGY_CHOICES,null=True, blank=True)
     difficulty_level = models.CharField(
         max_length=20, choices=DIFFICULTY_CHOICES, default='medium',null=True, blank=True
@@ -108,15 +142,59 @@ class Question(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['technology', 'difficulty_level', 'id'], name='question_sampling_idx'),
+        ]
+        constraints = [
+            # Bank questions (not pool rows or candidate copies) are unique by normalized text
+            models.UniqueConstraint(
+                fields=['text_hash'],
+                condition=models.Q(requirement__isnull=True, candidate__isnull=True),
+                name='unique_bank_question_text',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .question_bank import question_text_hash
+
+        self.text_hash = question_text_hash(self.text) if self.text else None
+        super().save(*args, **kwargs)
+
 class Photo(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     image = models.ImageField(upload_to='photos/')
+    phash = models.CharField(max_length=16, blank=True, null=True)  # face_analysis.image_dhash, for skipping near-duplicate frames
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     def __str__(self):
         return f"Photo {self.id}"
 
 
+class PhotoAnalysis(models.Model):
+    """Emotion analysis of one uploaded photo; its counts are already folded into Candidate.emotion_summary."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name='analyses')
+    candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, related_name='photo_analyses')
+    status = models.CharField(max_length=20, choices=EVALUATION_STATUS_CHOICES, default="Pending")
+    face_count = models.IntegerField(default=0)
+    emotions = models.JSONField(default=list)  # top emotion of each detected face
+    detector = models.CharField(max_length=20, blank=True, null=True)  # mtcnn / fer / haar
+    error = models.TextField(blank=True, null=True)
+    # Set when the photo was a near-duplicate frame and this analysis's result was copied
+    reused_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='reuses')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['photo', 'candidate'], name='unique_photo_analysis'),
+        ]
+
+    def __str__(self):
+        return f"Analysis of photo {self.photo_id} ({self.status})"
+
+
 class QuestionAnswer(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name="answers",null=True, blank=True)
     candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, related_name="answers",null=True, blank=True)
@@ -129,5 +207,73 @@ class QuestionAnswer(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
 
+class ResumeIngestJob(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=INGEST_STATUS_CHOICES, default="Pending")
+    total_files = models.IntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="resume_ingest_jobs", null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    def __str__(self):
+        return f"Ingest job {self.id} ({self.status})"
+
+
+class ResumeIngestItem(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job = models.ForeignKey(ResumeIngestJob, on_delete=models.CASCADE, related_name="items")
+    file = models.FileField(upload_to='uploads/')
+    file_name = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=INGEST_STATUS_CHOICES, default="Pending")
+    candidate = models.ForeignKey(Candidate, on_delete=models.SET_NULL, related_name="+", null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ResumeExtractionCache(models.Model):
+    text_hash = models.CharField(max_length=64)
+    prompt_version = models.CharField(max_length=32)
+    data = models.JSONField(default=dict)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['text_hash', 'prompt_version'], name='unique_resume_extraction'),
+        ]
 
 
+class ChatSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_sessions", null=True, blank=True)
+    summary = models.TextField(blank=True, default="")
+    history = models.JSONField(default=list)  # [{"role": "user"|"model", "text": "..."}], oldest first
+    turn_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    def __str__(self):
+        return f"Chat session {self.id}"
+
+
+class OutboundEmail(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=EMAIL_STATUS_CHOICES, default="Pending")
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
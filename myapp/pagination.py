@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CandidateCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the HR candidate listing.
+
+    Pages are addressed by an opaque cursor over (created_at, id) so every
+    page is a single indexed range scan, no matter how deep the client pages.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,217 @@
+"""
+Prompts and response parsing for the requirement / JD endpoints, shared by
+the sync DRF views and their async counterparts in async_views, and for the
+post-interview evaluation tasks.
+"""
+import json
+import re
+
+REQUIREMENT_FIELDS = ["name", "experience", "technology", "No_of_openings", "notice_period", "priority"]
+
+
+def parse_json_response(result_text):
+    """Parse a JSON model response, tolerating ```json fences. Raises json.JSONDecodeError."""
+    clean_text = re.sub(r"```json|```", "", result_text).strip()
+    return json.loads(clean_text)
+
+
+def requirement_extraction_prompt(text):
+    return """
+    Extract the following fields from the given job requirement text:
+    - name: Job title/requirement name
+    - experience: Required experience (e.g., "2-5 years")
+    - technology: Main technology/stack required (e.g., "Python", "React")
+    - No_of_openings: Number of open positions (extract as integer)
+    - notice_period: Notice period in days (extract as integer)
+    - priority: Boolean indicating if this is a high priority requirement (true/false)
+
+    Return only a valid JSON object with these fields. If a field cannot be determined, use null.
+    Example output:
+    {
+        "name": "Senior Python Developer",
+        "experience": "2-5 years",
+        "technology": "Python",
+        "No_of_openings": 3,
+        "notice_period": 30,
+        "priority": true
+    }
+
+    Here is the requirement text to analyze:
+    """ + text
+
+
+def jd_analysis_prompt(message):
+    return f"""
+    Analyze this job description request and extract structured information.
+
+    Required fields to extract:
+    - name (Job title/position name)  -- this is OPTIONAL, you may infer it from technology/experience
+    - experience (Required experience in years or range)
+    - technology (Primary technology stack)
+    - No_of_openings (Number of positions, integer)
+    - notice_period (Notice period in days, integer)
+    - priority (Boolean: true if urgent/high priority)
+
+    User message: "{message}"
+
+    Return only valid JSON with this format:
+    {{
+        "status": "ready" or "need_more_info",
+        "fields": {{
+            "name": "extracted JD name or null",
+            "experience": "extracted value or null",
+            "technology": "extracted value or null",
+            "No_of_openings": extracted_integer_or_null,
+            "notice_period": extracted_integer_or_null,
+            "priority": true_or_false_or_null
+        }},
+        "missing_fields": ["list", "of", "missing", "field", "names"]
+    }}
+
+    Rules:
+    - REQUIRED fields are only: experience and technology
+    - The JD name (field "name") is OPTIONAL. If possible, infer a good JD name, otherwise leave it null.
+    - Set status to "ready" only if experience AND technology are provided
+    - Set status to "need_more_info" if either experience or technology is missing
+    - For No_of_openings, notice_period: extract numbers or set null
+    - For priority: detect words like "urgent", "immediate", "high priority" as true
+    - Include ONLY the actually missing required fields (experience, technology) in missing_fields array
+    """
+
+
+def jd_fields_from_request(data):
+    """
+    The JD fields of a generate request. Accepts either `fields` (preferred) or
+    `analysis_data` from the frontend, which is either the analyze response
+    ({status, fields, missing_fields}) or the flat fields dict.
+    """
+    raw_fields = data.get('fields')
+    analysis_data = data.get('analysis_data')
+    if not raw_fields and isinstance(analysis_data, dict):
+        inner_fields = analysis_data.get('fields')
+        raw_fields = inner_fields if isinstance(inner_fields, dict) else analysis_data
+    return raw_fields or {}
+
+
+def jd_generation_prompt(fields):
+    """Prompt for a full JD. Fills in a suggested `name` on `fields` when it is missing."""
+    technology = fields.get('technology')
+    if not fields.get('name') and technology:
+        fields["name"] = f"{technology} Developer"
+
+    return f"""
+    Generate a comprehensive job description based on these details:
+
+    Job Title: {fields.get('name')}
+    Experience Required: {fields.get('experience')}
+    Technology: {technology}
+    Number of Openings: {fields.get('No_of_openings', 'Not specified')}
+    Notice Period: {fields.get('notice_period', 'Not specified')} days
+    Priority: {'High Priority' if fields.get('priority') else 'Normal'}
+
+    Generate a complete job description with:
+    1. Job Summary
+    2. Responsibilities
+    3. Requirements (technical and soft skills)
+    4. Nice-to-have skills
+    5. What we offer
+
+    Format as clean text without markdown formatting.
+    """
+
+
+def jd_field_extraction_prompt(jd_text):
+    return f"""
+    From the following job description text, extract structured fields.
+
+    VERY IMPORTANT INSTRUCTIONS FOR THE "technology" FIELD:
+    - Return ONLY the 1 to 3 MAIN technologies / stacks.
+    - Each technology name must be short (for example: "Python", "AWS", "React").
+    - Do NOT include versions, frameworks in brackets, long tool lists or full stacks.
+    - Do NOT return more than 3 items.
+    - If there are many skills, pick only the top 2-3 most central technologies.
+    - Join them in a single short comma-separated string, for example: "Python, AWS".
+
+    JD Text:
+    {jd_text}
+
+    Return ONLY valid JSON in this format:
+    {{
+        "name": "Job title or null",
+        "experience": "Experience requirement or null",
+        "technology": "1-3 short main technologies as a comma-separated string or null",
+        "No_of_openings": integer_or_null,
+        "notice_period": integer_or_null,
+        "priority": true_or_false_or_null
+    }}
+    """
+
+
+def merge_missing_fields(fields, extracted):
+    """Copy extracted values into `fields` where the caller left them empty."""
+    for key in REQUIREMENT_FIELDS:
+        if not fields.get(key) and extracted.get(key) is not None:
+            fields[key] = extracted.get(key)
+    return fields
+
+
+def communication_evaluation_prompt(answers):
+    return (
+        "Evaluate the candidate's communication skills based on the provided answers.\n"
+        "Return ONLY a valid JSON object named communication_point containing:\n"
+        "- Grammar: integer score (0-10)\n"
+        "- ProfessionalLanguage: integer score (0-10)\n"
+        "- OverallGrammarExplanation: short paragraph explaining the grammar score.\n"
+        "- OverallProfessionalLanguageExplanation: short paragraph explaining the professional language score.\n"
+        "- OverallLanguageUsed: describe which language(s) the candidate used (e.g., English, Hindi, mixed).\n\n"
+        "Example format:\n"
+        "{\n"
+        '  "communication_point": {\n'
+        '    "Grammar": 8,\n'
+        '    "ProfessionalLanguage": 7,\n'
+        '    "OverallGrammarExplanation": "Grammar was mostly correct, with few minor sentence structure issues.",\n'
+        '    "OverallProfessionalLanguageExplanation": "The candidate used formal language but with occasional informal phrases.",\n'
+        '    "OverallLanguageUsed": "English"\n'
+        "  }\n"
+        "}\n\n"
+        f"Answers: {json.dumps(answers)}"
+    )
+
+
+def question_pool_prompt(requirement, count):
+    return f"""
+    You are an expert technical interviewer.
+
+    Generate {count} short, clear, challenging interview questions for candidates applying to this role.
+
+    ### Requirement / Job Description
+    Title: {requirement.name or 'Not specified'}
+    Experience: {requirement.experience or 'Not specified'}
+    Technology: {requirement.technology or 'Not specified'}
+    {requirement.base_text or ''}
+
+    ### Rules:
+    - Focus questions on required technologies, tools, frameworks & experience level
+    - Include mix of theoretical + practical scenario questions
+    - Make questions specific, not generic
+    - Avoid yes/no questions
+    - Do NOT repeat similar questions
+    - Keep each question under 20 words
+
+    ### Output JSON Format ONLY:
+    {{
+    "questions": [
+        "Question 1",
+        "Question 2",
+        ...
+    ]
+    }}
+    """
+
+
+def short_technology(technology):
+    """At most 3 comma-separated items of 20 chars each, so it fits Requirement.technology (max_length=50)."""
+    if not isinstance(technology, str):
+        return technology
+    parts = [p.strip() for p in technology.split(',') if p.strip()][:3]
+    return ", ".join(p[:20] for p in parts)[:50]
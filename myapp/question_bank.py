@@ -0,0 +1,230 @@
+import hashlib
+import random
+import re
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Question
+from .serializers import QuestionSerializer
+
+# Leading "1.", "2)", "Q3:", "Question 4 -" style numbering
+_NUMBERING_RE = re.compile(r'^\s*(?:q(?:uestion)?\s*)?\d+\s*[\).:-]\s*', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+# Random ids probed per query: enough for a typical draw in one round, small enough for an IN list
+SAMPLE_PROBE_MIN = 32
+SAMPLE_PROBE_MAX = 2000
+SAMPLE_PROBE_ROUNDS = 4
+
+
+def _seek_question_ids(ids_qs, low, high, count, picked):
+    """First matching id at or after a random pivot (wrapping around), one indexed seek per question."""
+    for _ in range(count):
+        remaining = ids_qs.exclude(id__in=picked)
+        pivot = random.randint(low, high)
+        question_id = remaining.filter(id__gte=pivot).first() or remaining.first()
+        if question_id is None:
+            break  # bank exhausted
+        picked.append(question_id)
+    return picked
+
+
+def sample_question_ids(queryset, count):
+    """
+    Pick up to `count` distinct random question ids from `queryset` without
+    loading or counting the bank.
+
+    Random ids are drawn from the table's [first id, last id] range (two
+    LIMIT 1 primary key seeks) and probed in one `id IN (...)` query; the
+    ones that exist and match the filters are kept. Every matching question is equally
+    likely, whatever gaps deleted or filtered rows leave, and each probe is a
+    primary key lookup, so the cost does not grow with the bank. The probe
+    size adapts to the hit rate of the previous round. When the filters match
+    too few of the ids for that to finish in SAMPLE_PROBE_ROUNDS rounds, the
+    rest are taken with random-pivot seeks on question_sampling_idx, which
+    slightly favour questions after id gaps.
+    """
+    all_ids = queryset.model._default_manager.order_by('id').values_list('id', flat=True)
+    low, high = all_ids.first(), all_ids.last()
+    if low is None or count <= 0:
+        return []
+
+    ids_qs = queryset.order_by('id').values_list('id', flat=True)
+    picked = []
+    probes = max(SAMPLE_PROBE_MIN, 2 * count)
+    for _ in range(SAMPLE_PROBE_ROUNDS):
+        needed = count - len(picked)
+        probe_ids = {random.randint(low, high) for _ in range(min(probes, high - low + 1))}
+        hits = [question_id for question_id in ids_qs.filter(id__in=probe_ids) if question_id not in picked]
+        random.shuffle(hits)
+        picked.extend(hits[:needed])
+        if len(picked) >= count:
+            return picked
+        # Aim the next round at the observed hit rate, with some slack
+        rate = len(hits) / len(probe_ids)
+        probes = SAMPLE_PROBE_MAX if not rate else min(SAMPLE_PROBE_MAX, int(2 * (count - len(picked)) / rate) + 1)
+    return _seek_question_ids(ids_qs, low, high, count - len(picked), picked)
+
+
+def sample_questions(queryset, count):
+    """Return up to `count` random Question objects from `queryset` in random order."""
+    ids = sample_question_ids(queryset, count)
+    questions = list(queryset.filter(id__in=ids))
+    random.shuffle(questions)
+    return questions
+
+
+def normalize_question_text(text):
+    """Lowercase, strip numbering/trailing punctuation and collapse whitespace."""
+    text = _NUMBERING_RE.sub('', text or '')
+    text = _WHITESPACE_RE.sub(' ', text).strip().lower()
+    return text.rstrip('?.!: ')
+
+
+def question_text_hash(text):
+    """SHA-256 of the normalized question text, used to detect duplicates in the bank."""
+    return hashlib.sha256(normalize_question_text(text).encode('utf-8')).hexdigest()
+
+
+def _existing_hashes(hashes, chunk_size=1000):
+    hashes = list(hashes)
+    existing = set()
+    for start in range(0, len(hashes), chunk_size):
+        chunk = hashes[start:start + chunk_size]
+        existing.update(
+            Question.objects.filter(text_hash__in=chunk, requirement__isnull=True, candidate__isnull=True)
+            .values_list('text_hash', flat=True)
+        )
+    return existing
+
+
+def import_questions(files_questions, extra_data=None, batch_size=500):
+    """
+    Bulk import extracted questions into the bank.
+
+    `files_questions` is a list of (file_name, [question_text, ...]) pairs.
+    Every question is validated in memory through QuestionSerializer, hashed,
+    and skipped when the same normalized text is already in the bank or
+    earlier in this upload. New rows are inserted with bulk_create inside one
+    transaction; the unique_bank_question_text constraint drops rows another
+    import inserted concurrently (those are still counted as inserted).
+
+    Returns one dict per file with `inserted`, `skipped` and `invalid` counts.
+    """
+    extra_data = extra_data or {}
+    prepared = []  # (file_index, text_hash, validated_data)
+    report = [{"file": name, "inserted": 0, "skipped": 0, "invalid": 0} for name, _ in files_questions]
+
+    for index, (_, texts) in enumerate(files_questions):
+        for text in texts:
+            serializer = QuestionSerializer(data={**extra_data, 'text': text})
+            if not serializer.is_valid():
+                report[index]["invalid"] += 1
+                continue
+            prepared.append((index, question_text_hash(text), serializer.validated_data))
+
+    with transaction.atomic():
+        existing = _existing_hashes({text_hash for _, text_hash, _ in prepared})
+        new_questions = []
+        for index, text_hash, validated_data in prepared:
+            if text_hash in existing:
+                report[index]["skipped"] += 1
+                continue
+            existing.add(text_hash)
+            report[index]["inserted"] += 1
+            new_questions.append(Question(text_hash=text_hash, **validated_data))
+        Question.objects.bulk_create(new_questions, batch_size=batch_size, ignore_conflicts=True)
+    return report
+
+
+def requirement_text_hash(requirement):
+    """Hash of the requirement fields a question pool is generated from."""
+    source = "\n".join(str(value or '') for value in (
+        requirement.name, requirement.experience, requirement.technology, requirement.base_text,
+    ))
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def question_pool_is_current(requirement):
+    return (
+        requirement.question_pool_hash == requirement_text_hash(requirement)
+        and requirement.question_pool.exists()
+    )
+
+
+def replace_question_pool(requirement, texts):
+    """Store `texts` (deduplicated) as the requirement's pool, replacing the previous one."""
+    pool = []
+    seen = set()
+    for text in texts:
+        text = (text or '').strip()
+        text_hash = question_text_hash(text)
+        if not text or text_hash in seen:
+            continue
+        seen.add(text_hash)
+        pool.append(Question(requirement=requirement, text=text, text_hash=text_hash))
+
+    with transaction.atomic():
+        requirement.question_pool.all().delete()
+        Question.objects.bulk_create(pool)
+        requirement.question_pool_hash = requirement_text_hash(requirement)
+        requirement.save(update_fields=['question_pool_hash', 'updated_at'])
+    return pool
+
+
+def assign_pool_questions(requirement, candidate, count):
+    """
+    Copy `count` pool questions to the candidate, least used first (ties broken
+    at random), so candidates on the same requirement get spread-out subsets.
+    Returns the created questions; empty when the pool is empty.
+    """
+    pool = list(requirement.question_pool.only('id', 'text', 'text_hash', 'technology', 'difficulty_level', 'time_limit'))
+    if not pool:
+        return []
+
+    usage = dict(
+        Question.objects.filter(candidate__requirement=requirement, text_hash__in=[q.text_hash for q in pool])
+        .values('text_hash').annotate(uses=Count('id')).values_list('text_hash', 'uses')
+    )
+    random.shuffle(pool)
+    pool.sort(key=lambda question: usage.get(question.text_hash, 0))
+
+    copies = [
+        Question(
+            candidate=candidate,
+            text=question.text,
+            text_hash=question.text_hash,
+            technology=question.technology,
+            difficulty_level=question.difficulty_level,
+            time_limit=question.time_limit,
+        )
+        for question in pool[:count]
+    ]
+    return Question.objects.bulk_create(copies)
+
+
+def assign_bank_questions(candidate, count):
+    """
+    Copy `count` random general-bank questions to the candidate, matching its
+    technology when the bank has any. The fallback for quick interviews whose
+    requirement pool could not be generated.
+    """
+    bank = Question.objects.exclude(candidate=candidate).filter(requirement__isnull=True)
+    technology = (candidate.technology or '').strip().lower()
+    if technology and bank.filter(technology=technology).exists():
+        bank = bank.filter(technology=technology)
+
+    copies = [
+        Question(
+            candidate=candidate,
+            text=question.text,
+            text_hash=question.text_hash,
+            technology=question.technology,
+            difficulty_level=question.difficulty_level,
+            time_limit=question.time_limit,
+        )
+        for question in sample_questions(bank, count)
+    ]
+    return Question.objects.bulk_create(copies)
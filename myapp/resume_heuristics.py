@@ -0,0 +1,84 @@
+"""
+Heuristic resume field extraction, used when the LLM is unavailable or
+returns something unparseable. Patterns are compiled once and run line by
+line, so cost stays linear in the resume length.
+"""
+import re
+
+EMAIL_RE = re.compile(r"[\w\.-]+@[\w\.-]+\.[a-zA-Z]{2,}")
+PHONE_RE = re.compile(r"(\+?\d[\d \t\-\(\)]{7,20}\d)")
+
+# Checked in priority order; the first keyword present wins
+TECH_KEYWORDS = ("python", ".net", "java", "react")
+
+_COMPANY_NAME = r"[A-Za-z0-9][A-Za-z0-9 \t&]{0,80}?"
+_COMPANY_SUFFIX = r"(?:technologies|solutions|systems|services|limited|ltd|inc|corp)"
+_COMPANY_END = r"(?=,|\.|[ \t]+from\b|[ \t]+since\b|[ \t]+to\b|[ \t]+till\b|[ \t]+-|[ \t]*\(|[ \t]*[0-9]{4}|[ \t]*$)"
+
+# Same three strategies as before, each applied to a single line
+COMPANY_PATTERNS = (
+    re.compile(
+        r"(?:worked at|employed by|experience at|company|private|limited|ltd|inc|corp|technologies|solutions|systems|services)[ \t]+"
+        rf"({_COMPANY_NAME}){_COMPANY_END}",
+        re.IGNORECASE,
+    ),
+    re.compile(rf"\b({_COMPANY_NAME}{_COMPANY_SUFFIX})\b[ \t]*{_COMPANY_END}", re.IGNORECASE),
+)
+COMPANY_HEADING_RE = re.compile(r"^[ \t]*([A-Za-z0-9 \t&]{2,50}?)[ \t]*$")
+DATE_HINT_RE = re.compile(r"[0-9]{4}|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec", re.IGNORECASE)
+
+MAX_COMPANIES = 5
+# Lines longer than this are table dumps or run-together text, not company lines
+MAX_LINE_LENGTH = 400
+
+
+def find_technology(lowered_text):
+    for keyword in TECH_KEYWORDS:
+        if keyword in lowered_text:
+            return keyword
+    return ""
+
+
+def _company_candidates(lines):
+    """Yield raw company names in the order the original multi-pattern scan produced them."""
+    for pattern in COMPANY_PATTERNS:
+        for line in lines:
+            for match in pattern.finditer(line):
+                yield match.group(1)
+
+    # A short title line followed by a line mentioning a year or month
+    for line, next_line in zip(lines, lines[1:]):
+        heading = COMPANY_HEADING_RE.match(line)
+        if heading and DATE_HINT_RE.search(next_line):
+            yield heading.group(1)
+
+
+def find_companies(text, limit=MAX_COMPANIES):
+    lines = [line for line in text.splitlines() if len(line) <= MAX_LINE_LENGTH]
+    companies = []
+    seen = set()
+    for name in _company_candidates(lines):
+        name = name.strip()
+        key = name.lower()
+        if not 2 < len(name) < 100 or key in seen:
+            continue
+        seen.add(key)
+        companies.append({"company_name": name, "start_date": None, "end_date": None})
+        if len(companies) >= limit:
+            break
+    return companies
+
+
+def extract_fields(text):
+    """Best-effort name/email/phone/technology/companies from raw resume text."""
+    email_match = EMAIL_RE.search(text)
+    phone_match = PHONE_RE.search(text)
+    first_line = next((ln.strip() for ln in text.splitlines() if ln and len(ln.strip()) > 1), "")
+
+    return {
+        "name": first_line[:100],
+        "email": email_match.group(0) if email_match else "",
+        "phone": phone_match.group(0) if phone_match else "",
+        "technology": find_technology(text.lower()),
+        "companies": find_companies(text),
+    }
@@ -0,0 +1,103 @@
+"""
+Section-aware trimming of resume text before it is sent to the LLM.
+
+The resume is split on recognised headings. Sections the extraction prompt
+needs (contact block, personal details, experience, skills, ...) are kept in
+priority order until the token budget is used. Hobbies, references,
+declarations and repeated page headers are dropped. Text that already fits
+the budget is sent as is.
+"""
+import re
+from collections import Counter
+
+SECTION_HEADINGS = {
+    "summary": ("summary", "profile", "professional summary", "career objective", "objective", "about me"),
+    "experience": (
+        "experience", "work experience", "professional experience", "employment", "employment history",
+        "work history", "career history", "internship", "internships",
+    ),
+    "skills": (
+        "skills", "technical skills", "key skills", "core competencies", "technologies", "tech stack",
+        "tools", "tools and technologies", "technical expertise",
+    ),
+    "projects": ("projects", "key projects", "academic projects", "personal projects"),
+    "education": ("education", "academic qualifications", "qualifications", "educational qualifications"),
+    "certifications": ("certifications", "certificates", "courses", "achievements", "awards"),
+    "hobbies": ("hobbies", "interests", "hobbies and interests", "extra curricular activities", "extracurricular activities"),
+    "references": ("references", "referees"),
+    "declaration": ("declaration",),
+    "personal": ("personal details", "personal information", "personal profile", "languages known"),
+}
+
+# Sections worth sending, most important first; anything else is dropped. Personal details
+# often hold the only email/phone, which candidate creation and duplicate checks need.
+RELEVANT_SECTIONS = ("contact", "personal", "experience", "skills", "summary", "education", "projects", "certifications")
+
+_HEADING_LOOKUP = {alias: name for name, aliases in SECTION_HEADINGS.items() for alias in aliases}
+_HEADING_RE = re.compile(r"^[\W_]*([A-Za-z][A-Za-z &/]{1,40}?)[ \t]*(?:[:\-–][ \t]*(.*))?$")
+_REPEATED_LINE_MIN = 3
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English prose)."""
+    return (len(text) + 3) // 4
+
+
+def _heading(line):
+    """Return the section name when the line is a section heading (optionally with inline content)."""
+    if len(line) > 80:
+        return None
+    match = _HEADING_RE.match(line)
+    if not match:
+        return None
+    title = re.sub(r"\s+", " ", match.group(1).replace("&", "and")).strip().lower()
+    return _HEADING_LOOKUP.get(title)
+
+
+def split_sections(text):
+    """Split resume text into [(section name, text)] in document order; the preamble is "contact"."""
+    lines = [line.rstrip() for line in text.splitlines()]
+    counts = Counter(line.strip() for line in lines if line.strip())
+
+    sections = [["contact", []]]
+    seen = set()
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        # Page headers/footers repeated on every page: keep the first occurrence only
+        if counts[stripped] >= _REPEATED_LINE_MIN:
+            if stripped in seen:
+                continue
+            seen.add(stripped)
+        name = _heading(stripped)
+        if name:
+            sections.append([name, [stripped]])
+            continue
+        sections[-1][1].append(stripped)
+    return [(name, "\n".join(body)) for name, body in sections if body]
+
+
+def trim_resume(text, token_budget):
+    """
+    Keep the relevant sections of a resume within `token_budget` tokens.
+    Falls back to a plain truncation when no headings are recognised.
+    """
+    if estimate_tokens(text) <= token_budget:
+        return text
+    sections = split_sections(text)
+    if len(sections) <= 1:
+        return text[:token_budget * 4]
+
+    char_budget = token_budget * 4
+    keep = {}
+    for wanted in RELEVANT_SECTIONS:
+        for index, (name, body) in enumerate(sections):
+            if name != wanted or char_budget <= 0:
+                continue
+            piece = body[:char_budget]
+            keep[index] = piece
+            char_budget -= len(piece) + 2
+
+    # Emit in document order so dates and companies stay next to each other
+    return "\n\n".join(keep[index] for index in sorted(keep))
@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+
+from . import llm, resume_heuristics
+from .documents import UnsupportedDocumentError, extract_document_text
+from .resume_sections import estimate_tokens, trim_resume
+from .models import Candidate, ResumeExtractionCache
+
+RESUME_EXTENSIONS = ('pdf', 'docx')
+
+FRONTEND_BASE = "http://localhost:5173"
+
+RESUME_EXTRACTION_PROMPT = """
+Extract the following fields from this resume text:
+- name
+- email
+- phone
+- technology (take only one main technology)
+- experience (total experience)
+- companies (array of objects with company_name, start_date, end_date)
+
+Date Requirements:
+- Convert ALL dates to YYYY-MM format (e.g., 2024-07, 2025-03)
+- If only year is available, use YYYY format (e.g., 2024)
+- If date is unclear, use null
+- Handle various formats: "July 2024", "12/03/2022", "2022-2024", etc.
+- IMPORTANT: If candidate is currently working at company (end date shows "present", "current", "till date", "ongoing", etc.), set end_date = "running"
+
+Return only valid JSON (no explanations, no ```json blocks) with this format:
+{{
+    "name": "John Doe",
+    "email": "john@example.com",
+    "phone": "+1234567890",
+    "technology": "React",
+    "experience": "2 years 3 months",
+    "companies": [
+        {{
+            "company_name": "Tech Corp",
+            "start_date": "2022-01",
+            "end_date": "2024-03"
+        }},
+        {{
+            "company_name": "Current Company Inc",
+            "start_date": "2024-04",
+            "end_date": "running"
+        }}
+    ]
+}}
+
+Resume text:
+{text}
+"""
+
+RESUME_EXTRACTION_MODEL = llm.DEFAULT_MODEL
+
+# Bump when resume_sections changes what gets sent to the LLM
+RESUME_TRIMMING_VERSION = 2
+
+# Changes whenever the prompt, model or trimming changes, which invalidates cached extractions
+RESUME_PROMPT_VERSION = hashlib.sha256(
+    f"{RESUME_EXTRACTION_MODEL}\n{RESUME_TRIMMING_VERSION}:{settings.RESUME_PROMPT_TOKEN_BUDGET}\n{RESUME_EXTRACTION_PROMPT}".encode('utf-8')
+).hexdigest()[:16]
+
+
+class ResumeError(Exception):
+    """A resume could not be turned into a Candidate; carries the HTTP status to report."""
+
+    def __init__(self, message, details="", status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.status_code = status_code
+
+    def as_response_data(self):
+        data = {"error": self.message}
+        if self.details:
+            data["details"] = self.details
+        return data
+
+
+def read_resume_text(file):
+    """Extract the text of an uploaded resume, raising ResumeError when it is unusable."""
+    try:
+        text = extract_document_text(file, RESUME_EXTENSIONS)
+    except UnsupportedDocumentError:
+        raise ResumeError("Unsupported file type. Please upload .pdf or .docx")
+    except Exception as e:
+        raise ResumeError(f"Failed to read resume: {str(e)}")
+
+    if not text.strip():
+        raise ResumeError("Could not extract any readable text from the uploaded document.")
+    return text
+
+
+def _extraction_prompt(text):
+    trimmed = trim_resume(text, settings.RESUME_PROMPT_TOKEN_BUDGET)
+    prompt = RESUME_EXTRACTION_PROMPT.format(text=trimmed)
+    print(
+        f"Resume extraction prompt: ~{estimate_tokens(prompt)} tokens "
+        f"(resume ~{estimate_tokens(text)} -> ~{estimate_tokens(trimmed)} tokens after trimming)"
+    )
+    return prompt
+
+
+def _parse_extraction(result_text, last_error):
+    data = None
+    if result_text:
+        try:
+            clean_text = re.sub(r"```json|```", "", result_text).strip()
+            data = json.loads(clean_text)
+        except Exception as e:
+            # fall back to heuristic parsing if LLM output is malformed
+            last_error = e
+    return data, last_error
+
+
+def _llm_extract(text, priority=llm.INTERACTIVE):
+    """Ask Gemini for the structured fields. Returns (data or None, last_error)."""
+    result_text = None
+    last_error = None
+    try:
+        result_text = llm.generate(
+            _extraction_prompt(text), model=RESUME_EXTRACTION_MODEL, response_mime_type="application/json", priority=priority,
+        )
+    except llm.LLMError as e:
+        last_error = str(e)
+    return _parse_extraction(result_text, last_error)
+
+
+async def _allm_extract(text):
+    """_llm_extract for the async views."""
+    result_text = None
+    last_error = None
+    try:
+        result_text = await llm.agenerate(
+            _extraction_prompt(text), model=RESUME_EXTRACTION_MODEL, response_mime_type="application/json",
+        )
+    except llm.LLMError as e:
+        last_error = str(e)
+    return _parse_extraction(result_text, last_error)
+
+
+def resume_text_hash(text):
+    """SHA-256 of the resume text with whitespace collapsed, so re-exports of the same file match."""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def get_cached_extraction(text_hash):
+    """Return the cached LLM extraction for this resume and prompt version, or None."""
+    cutoff = timezone.now() - settings.RESUME_EXTRACTION_CACHE_TTL
+    entry = (
+        ResumeExtractionCache.objects
+        .filter(text_hash=text_hash, prompt_version=RESUME_PROMPT_VERSION, created_at__gte=cutoff)
+        .only('id', 'data')
+        .first()
+    )
+    if entry is None:
+        return None
+    ResumeExtractionCache.objects.filter(id=entry.id).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return entry.data
+
+
+def store_extraction(text_hash, data):
+    """Cache an LLM extraction and evict expired or least recently used entries."""
+    now = timezone.now()
+    try:
+        ResumeExtractionCache.objects.update_or_create(
+            text_hash=text_hash,
+            prompt_version=RESUME_PROMPT_VERSION,
+            defaults={"data": data, "hits": 0, "created_at": now, "last_used_at": now},
+        )
+    except IntegrityError:
+        return  # stored concurrently by another worker
+
+    ResumeExtractionCache.objects.filter(created_at__lt=now - settings.RESUME_EXTRACTION_CACHE_TTL).delete()
+    max_entries = settings.RESUME_EXTRACTION_CACHE_MAX_ENTRIES
+    boundary = (
+        ResumeExtractionCache.objects.order_by('-last_used_at')
+        .values_list('last_used_at', flat=True)[max_entries:max_entries + 1]
+    )
+    if boundary:
+        ResumeExtractionCache.objects.filter(last_used_at__lte=boundary[0]).delete()
+
+
+def extract_resume_fields(text, priority=llm.INTERACTIVE):
+    """
+    Turn resume text into the Candidate fields (name, email, phone, technology,
+    experience, companies). Uses Gemini and falls back to regex heuristics.
+    Raises ResumeError when neither produces anything useful.
+
+    Successful LLM extractions are cached by resume text hash and prompt
+    version, so re-uploads of the same resume skip the LLM entirely.
+    Background ingestion passes priority=llm.BACKGROUND.
+    """
+    text_hash = resume_text_hash(text)
+    data = get_cached_extraction(text_hash)
+    if data:
+        return data
+
+    data, last_error = _llm_extract(text, priority)
+    if data:
+        store_extraction(text_hash, data)
+        return data
+    return _heuristic_fields(text, last_error)
+
+
+async def aextract_resume_fields(text):
+    """extract_resume_fields for the async views; only the Gemini call is awaited natively."""
+    text_hash = resume_text_hash(text)
+    data = await sync_to_async(get_cached_extraction)(text_hash)
+    if data:
+        return data
+
+    data, last_error = await _allm_extract(text)
+    if data:
+        await sync_to_async(store_extraction)(text_hash, data)
+        return data
+    return _heuristic_fields(text, last_error)
+
+
+def _heuristic_fields(text, last_error):
+    data = resume_heuristics.extract_fields(text)
+    if not any([data.get("name"), data.get("email"), data.get("phone"), data.get("technology")]):
+        # If even fallback got nothing useful, respond gracefully with 503 if provider failed, else 422
+        raise ResumeError(
+            "Could not extract fields from resume.",
+            details=str(last_error) if last_error else "",
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE if last_error else status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return data
+
+
+def _extract_or_error(text):
+    try:
+        return extract_resume_fields(text)
+    except ResumeError as e:
+        return e
+
+
+def _extract_in_worker_thread(text):
+    try:
+        return _extract_or_error(text)
+    finally:
+        # Pool threads open their own DB connections for the extraction cache
+        connections.close_all()
+
+
+def extract_many_resume_fields(texts):
+    """
+    Run extract_resume_fields over several resumes on a bounded thread pool,
+    so N uploads take roughly as long as the slowest LLM call instead of the
+    sum of all of them. Results keep the order of `texts`; a failed resume
+    yields its ResumeError instead of a dict.
+    """
+    if len(texts) <= 1:
+        return [_extract_or_error(text) for text in texts]
+    workers = max(1, min(settings.RESUME_EXTRACTION_CONCURRENCY, len(texts)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_extract_in_worker_thread, texts))
+
+
+async def aextract_many_resume_fields(texts):
+    """extract_many_resume_fields on the event loop, with the same concurrency bound."""
+    semaphore = asyncio.Semaphore(max(1, settings.RESUME_EXTRACTION_CONCURRENCY))
+
+    async def extract(text):
+        async with semaphore:
+            try:
+                return await aextract_resume_fields(text)
+            except ResumeError as e:
+                return e
+
+    return await asyncio.gather(*(extract(text) for text in texts))
+
+
+def ensure_email_available(data, seen_emails=None):
+    """Reject a resume whose email already belongs to a Candidate (or to an earlier file of the same upload)."""
+    email = data.get("email")
+    if not email:
+        return
+    if (seen_emails is not None and email in seen_emails) or Candidate.objects.filter(email=email).exists():
+        raise ResumeError("Email already exists.", details="Email already exists.")
+    if seen_emails is not None:
+        seen_emails.add(email)
+
+
+def create_candidates(entries):
+    """
+    Create Candidates for (upload_doc, text, data) entries in one transaction.
+    The UUID primary key is assigned up front, so the interview share link is
+    set before the insert instead of with a second UPDATE per row.
+    """
+    candidates = []
+    for upload_doc, text, data in entries:
+        print(f"Extracted companies: {data.get('companies', [])}")
+        hr_obj = Candidate(
+            upload_doc=upload_doc,
+            name=data.get("name", ""),
+            email=data.get("email", ""),
+            phone=data.get("phone", ""),
+            experience=data.get("experience", ""),
+            technology=data.get("technology", ""),
+            company=data.get("companies", []),
+            base_text=text,  # Store raw document text instead of LLM response
+        )
+        hr_obj.shine_link = f"{FRONTEND_BASE}/{hr_obj.id}/"
+        candidates.append(hr_obj)
+
+    with transaction.atomic():
+        Candidate.objects.bulk_create(candidates)
+    return candidates
+
+
+def create_candidate(upload_doc, text, data):
+    """Create the Candidate for one extracted resume."""
+    return create_candidates([(upload_doc, text, data)])[0]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Question, QuestionAnswer, Candidate, Photo, Requirement, User
+from .models import Question, QuestionAnswer, Candidate, Photo, Requirement, User, ResumeIngestJob, ResumeIngestItem
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -39,8 +39,42 @@ class PhotoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Photo
         fields = '__all__'
+        read_only_fields = ['phash']
 
 class HrSerializer(serializers.ModelSerializer):
+    answers = AnswerHrSerializer(many=True, read_only=True)
+    photos = PhotoSerializer(many=True, read_only=True)
+    class Meta:
+        model = Candidate
+        fields = '__all__'
+        read_only_fields = ['evaluation_status', 'evaluation_progress']
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that takes an extra `fields` argument restricting
+    which fields are rendered.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+# Columns shown in the HR grid; large text/JSON columns are left out
+CANDIDATE_SUMMARY_FIELDS = [
+    'id', 'name', 'email', 'technology', 'experience', 'interview_status',
+    'is_selected', 'is_quick', 'requirement', 'time', 'created_at',
+]
+CANDIDATE_EXPANDABLE_FIELDS = ['answers', 'photos']
+
+REQUIREMENT_SUMMARY_FIELDS = [
+    'id', 'name', 'experience', 'technology', 'No_of_openings',
+    'notice_period', 'priority', 'created_at',
+]
+REQUIREMENT_EXPANDABLE_FIELDS = ['candidates']
+
+class CandidateListSerializer(DynamicFieldsModelSerializer):
     answers = AnswerHrSerializer(many=True, read_only=True)
     photos = PhotoSerializer(many=True, read_only=True)
     class Meta:
@@ -57,9 +91,40 @@ class RequirementSerializer(serializers.ModelSerializer):
         model = Requirement
         fields = '__all__'
 
+class RequirementListSerializer(DynamicFieldsModelSerializer):
+    candidates = CandidateListSerializer(many=True, read_only=True, fields=CANDIDATE_SUMMARY_FIELDS)
+    class Meta:
+        model = Requirement
+        fields = '__all__'
+
 class InstagramDownloadSerializer(serializers.Serializer):
     url = serializers.URLField(required=True)
 
 
 class ChatAiSerializer(serializers.Serializer):
     question = serializers.CharField()
+    session_id = serializers.UUIDField(required=False)
+
+
+class ResumeIngestItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ResumeIngestItem
+        fields = ['id', 'file_name', 'status', 'candidate', 'error', 'updated_at']
+
+class ResumeIngestJobSerializer(serializers.ModelSerializer):
+    items = ResumeIngestItemSerializer(many=True, read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ResumeIngestJob
+        fields = ['id', 'status', 'total_files', 'progress', 'items', 'created_at', 'updated_at']
+
+    def get_progress(self, obj):
+        counts = {"Pending": 0, "Processing": 0, "Completed": 0, "Failed": 0}
+        for item in obj.items.all():
+            counts[item.status] = counts.get(item.status, 0) + 1
+        return {
+            "pending": counts["Pending"] + counts["Processing"],
+            "completed": counts["Completed"],
+            "failed": counts["Failed"],
+        }
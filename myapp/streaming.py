@@ -0,0 +1,52 @@
+"""
+Server-sent events for streamed LLM output.
+
+Each chunk goes out as `data: {"text": ...}`. The stream ends with an
+`event: done` carrying the final payload, or `event: error` when the model
+call fails part way. Under ASGI the async generator is sent chunk by chunk,
+so the client sees text as soon as Gemini produces it.
+"""
+import inspect
+import json
+
+from django.http import StreamingHttpResponse
+
+from . import llm
+
+
+def sse_event(data, event=None):
+    lines = f"event: {event}\n" if event else ""
+    return f"{lines}data: {json.dumps(data)}\n\n"
+
+
+async def _events(chunks, done):
+    parts = []
+    try:
+        async for text in chunks:
+            parts.append(text)
+            yield sse_event({"text": text})
+    except llm.LLMError as e:
+        yield sse_event({"error": str(e)}, event="error")
+        return
+    payload = done("".join(parts))
+    if inspect.isawaitable(payload):
+        payload = await payload
+    yield sse_event(payload, event="done")
+
+
+def sse_response(chunks, done):
+    """
+    Stream `chunks` (an async iterator of text) as SSE. `done` receives the
+    full text and returns (or, when it needs the database, awaits) the
+    payload of the closing `done` event.
+    """
+    response = StreamingHttpResponse(_events(chunks, done), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
+
+
+def wants_stream(request):
+    """True when the client asked for `stream=true` in the query string or body."""
+    value = request.query_params.get('stream', request.data.get('stream', ''))
+    return str(value).lower() in ('1', 'true', 'yes')
@@ -1,3 +1,1713 @@
-from django.test import TestCase
+import asyncio
+import json
+import importlib.util
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from celery.backends.cache import CacheBackend
+from celery.exceptions import Retry
+from django.conf import settings
+from django.core import mail as django_mail
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (chat, documents, emotion_backends, face_analysis, llm, llm_quota, mail, resume_heuristics, resume_sections,
+               resumes, tasks, utils)
+from .models import (Candidate, ChatSession, OutboundEmail, Photo, PhotoAnalysis, Question, QuestionAnswer, Requirement,
+                     ResumeExtractionCache, ResumeIngestJob, User)
+from .question_bank import import_questions, sample_question_ids
+
+
+def _installed(*modules):
+    try:
+        return all(importlib.util.find_spec(module) is not None for module in modules)
+    except ModuleNotFoundError:
+        return False
+
+
+HAS_CV2 = face_analysis.cv2 is not None
+HAS_FER = HAS_CV2 and _installed("fer", "tensorflow")
+HAS_LITERT = _installed("ai_edge_litert") or _installed("tflite_runtime") or _installed("tensorflow")
+# TFLiteBackend falls back to the model file shipped in the fer package
+TFLITE_MODEL_PATH = settings.EMOTION_MODEL_PATH if str(settings.EMOTION_MODEL_PATH or "").endswith(".tflite") else None
+HAS_TFLITE = HAS_CV2 and HAS_LITERT and (TFLITE_MODEL_PATH is not None or _installed("fer"))
+HAS_ONNX = _installed("onnxruntime") and str(settings.EMOTION_MODEL_PATH or "").endswith(".onnx")
+# The quota script runs in fakeredis, which needs lupa for Lua
+HAS_FAKEREDIS_LUA = _installed("fakeredis", "lupa")
+
+# Parity of a lightweight emotion backend with the FER reference is checked on
+# fixed face boxes, so face detection plays no part in the comparison.
+BOXES = [(60, 40, 120, 120), (250, 150, 90, 110), (0, 0, 60, 60), (330, 10, 110, 80)]
+TOLERANCE = 0.01
+
+
+def _test_image():
+    np = face_analysis.np
+    rng = np.random.default_rng(7)
+    image = rng.integers(0, 256, size=(320, 480, 3), dtype=np.uint8)
+    # Smooth the noise so crops are not all classified the same way
+    return face_analysis.cv2.GaussianBlur(image, (9, 9), 0)
+
+
+class _FakeBackend:
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, faces):
+        self.batches.append(faces)
+        return [[0.1, 0.0, 0.0, 0.7, 0.0, 0.0, 0.2] for _ in faces]
+
+
+class EmotionBackendTests(SimpleTestCase):
+
+    def assert_matches_fer(self, backend, use_tflite):
+        image = _test_image()
+        reference = face_analysis.get_fer_class()(mtcnn=False, use_tflite=use_tflite)
+        expected = reference.detect_emotions(image, face_rectangles=BOXES)
+        scores = emotion_backends.classify_faces(backend, [(image, box) for box in BOXES])
+
+        self.assertEqual(len(expected), len([face for face in scores if face]))
+        for face, emotions in zip(expected, [face for face in scores if face]):
+            self.assertEqual(set(face["emotions"]), set(emotions))
+            for label, score in face["emotions"].items():
+                self.assertAlmostEqual(score, emotions[label], delta=TOLERANCE, msg=label)
+
+    @unittest.skipUnless(HAS_FER and HAS_TFLITE, "fer, TensorFlow and a TFLite interpreter are needed")
+    def test_tflite_backend_matches_fer(self):
+        self.assert_matches_fer(emotion_backends.TFLiteBackend(TFLITE_MODEL_PATH), use_tflite=True)
+
+    @unittest.skipUnless(HAS_FER and HAS_ONNX, "fer, TensorFlow, onnxruntime and an .onnx EMOTION_MODEL_PATH are needed")
+    def test_onnx_backend_matches_fer(self):
+        self.assert_matches_fer(emotion_backends.OnnxBackend(settings.EMOTION_MODEL_PATH), use_tflite=False)
+
+    @unittest.skipUnless(HAS_CV2, "OpenCV is not installed")
+    def test_all_crops_are_classified_in_one_call(self):
+        backend = _FakeBackend()
+        images = [_test_image(), _test_image()]
+        # The last box lies outside the padded image, so FER would skip that face
+        faces = [(image, box) for image in images for box in BOXES] + [(images[0], (900, 900, 50, 50))]
+
+        scores = emotion_backends.classify_faces(backend, faces)
+
+        self.assertEqual(len(backend.batches), 1)
+        batch = backend.batches[0]
+        self.assertEqual(batch.shape, (len(BOXES) * 2, 64, 64))
+        self.assertGreaterEqual(batch.min(), -1.0)
+        self.assertLessEqual(batch.max(), 1.0)
+        self.assertIsNone(scores[-1])
+        self.assertEqual(scores[0], dict(zip(emotion_backends.EMOTION_LABELS, [0.1, 0.0, 0.0, 0.7, 0.0, 0.0, 0.2])))
+
+    @unittest.skipUnless(HAS_TFLITE, "OpenCV, a TFLite interpreter and the fer model are needed")
+    def test_batch_matches_single_photo(self):
+        backend = emotion_backends.TFLiteBackend(TFLITE_MODEL_PATH)
+        images = [_test_image(), face_analysis.np.ascontiguousarray(_test_image()[:, ::-1])]
+        faces = [(image, box) for image in images for box in BOXES]
+
+        batch = emotion_backends.classify_faces(backend, faces)
+        single = [emotion_backends.classify_faces(backend, [face])[0] for face in faces]
+        self.assertEqual(len(batch), len(faces))
+        for one, batched in zip(single, batch):
+            for label, score in one.items():
+                self.assertAlmostEqual(score, batched[label], delta=TOLERANCE, msg=label)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            emotion_backends.load_backend("cuda")
+
+
+class QuestionSamplingTests(TestCase):
+
+    def make_questions(self, count, **fields):
+        return [Question.objects.create(text=f"{fields.get('technology')} question {i}", **fields) for i in range(count)]
+
+    def test_sample_is_uniform_across_id_gaps(self):
+        questions = self.make_questions(8, technology="python")
+        Question.objects.filter(id__in=[q.id for q in questions[1:4]]).delete()
+        remaining = [q.id for q in questions[:1] + questions[4:]]
+
+        random.seed(3)
+        draws = Counter()
+        for _ in range(500):
+            draws.update(sample_question_ids(Question.objects.filter(technology="python"), 1))
+
+        self.assertEqual(set(draws), set(remaining))
+        # 100 expected each; the row after the gap used to get most of the draws
+        self.assertLess(max(draws.values()), 140)
+        self.assertGreater(min(draws.values()), 60)
+
+    def test_sample_respects_filter_and_is_distinct(self):
+        python = self.make_questions(6, technology="python", difficulty_level="easy")
+        self.make_questions(6, technology="java", difficulty_level="easy")
+        queryset = Question.objects.filter(technology="python", difficulty_level="easy")
+
+        for seed in range(20):
+            random.seed(seed)
+            ids = sample_question_ids(queryset, 4)
+            self.assertEqual(len(set(ids)), 4)
+            self.assertTrue(set(ids) <= {q.id for q in python})
+
+    def test_dense_bank_takes_three_queries_without_count_or_offset(self):
+        Question.objects.bulk_create(
+            Question(text=f"Question {i}", technology="python", difficulty_level="easy") for i in range(3000)
+        )
+        random.seed(5)
+        with CaptureQueriesContext(connection) as queries:
+            ids = sample_question_ids(Question.objects.filter(technology="python"), 10)
+        self.assertEqual(len(set(ids)), 10)
+        self.assertEqual(len(queries), 3)  # first and last id, then one probe of random ids
+        for query in queries:
+            self.assertNotIn("COUNT", query["sql"].upper())
+            self.assertNotIn("OFFSET", query["sql"].upper())
+
+    def test_sparse_filter_falls_back_to_seeks(self):
+        Question.objects.bulk_create(Question(text=f"Question {i}", technology="java") for i in range(3000))
+        rare = self.make_questions(3, technology="python")
+        ids = sample_question_ids(Question.objects.filter(technology="python"), 10)
+        self.assertEqual(sorted(ids), [q.id for q in rare])
+
+    def test_small_bank_returns_everything(self):
+        questions = self.make_questions(3)
+        self.assertEqual(sorted(sample_question_ids(Question.objects.all(), 10)), [q.id for q in questions])
+        self.assertEqual(sample_question_ids(Question.objects.none(), 10), [])
+
+
+class QuestionImportTests(TestCase):
+
+    def setUp(self):
+        Question.objects.create(text="What is a decorator?", technology="python")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="hr", email="hr@example.com"))
+
+    def bank_texts(self):
+        return sorted(Question.objects.filter(requirement__isnull=True, candidate__isnull=True).values_list("text", flat=True))
+
+    def test_normalized_duplicates_are_skipped_per_file(self):
+        report = import_questions([
+            ("a.txt", ["1. what is a   decorator", "Explain the GIL.", "explain the gil"]),
+            ("b.txt", ["Q2) Explain the GIL?", "What is asyncio?"]),
+        ], extra_data={"technology": "python"})
+        self.assertEqual(report, [
+            {"file": "a.txt", "inserted": 1, "skipped": 2, "invalid": 0},
+            {"file": "b.txt", "inserted": 1, "skipped": 1, "invalid": 0},
+        ])
+        self.assertEqual(self.bank_texts(), ["Explain the GIL.", "What is a decorator?", "What is asyncio?"])
+
+    def test_invalid_rows_are_counted_and_not_inserted(self):
+        report = import_questions([("a.txt", ["What is a generator?"])], extra_data={"technology": "cobol"})
+        self.assertEqual(report, [{"file": "a.txt", "inserted": 0, "skipped": 0, "invalid": 1}])
+        self.assertEqual(self.bank_texts(), ["What is a decorator?"])
+
+    def test_rows_inserted_concurrently_are_ignored(self):
+        # Another import committed the same text after this one read the existing hashes
+        with mock.patch("myapp.question_bank._existing_hashes", return_value=set()):
+            report = import_questions([("a.txt", ["What is a decorator", "What is a metaclass?"])])
+        self.assertEqual(report[0]["inserted"], 2)
+        self.assertEqual(self.bank_texts(), ["What is a decorator?", "What is a metaclass?"])
+
+    def test_bank_text_is_unique_but_pool_rows_and_copies_may_repeat_it(self):
+        requirement = Requirement.objects.create(name="Backend")
+        candidate = Candidate.objects.create(name="Asha")
+        Question.objects.create(text="What is a decorator", requirement=requirement)
+        Question.objects.create(text="What is a decorator", candidate=candidate)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Question.objects.create(text="what is a decorator?")
+
+    def upload(self, *files):
+        uploads = [SimpleUploadedFile(name, "\n".join(lines).encode(), content_type="text/plain") for name, lines in files]
+        return self.client.post("/questions/", {"file": uploads, "bulk": "true", "technology": "python"}, format="multipart")
+
+    def test_bulk_upload_reports_per_file_and_skips_a_reupload(self):
+        files = [("a.txt", ["What is a decorator?", "Explain the GIL."]), ("b.txt", ["explain the GIL", "What is asyncio?"])]
+        response = self.upload(*files)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {
+            "files": [
+                {"file": "a.txt", "inserted": 1, "skipped": 1, "invalid": 0},
+                {"file": "b.txt", "inserted": 1, "skipped": 1, "invalid": 0},
+            ],
+            "inserted": 2,
+            "skipped": 2,
+        })
+
+        response = self.upload(*files)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["inserted"], response.data["skipped"]), (0, 4))
+        self.assertEqual(self.bank_texts(), ["Explain the GIL.", "What is a decorator?", "What is asyncio?"])
+        self.assertEqual(set(Question.objects.values_list("technology", flat=True)), {"python"})
+
+    def test_bulk_upload_rejects_unsupported_files(self):
+        response = self.client.post(
+            "/questions/", {"file": SimpleUploadedFile("a.csv", b"x"), "bulk": "true"}, format="multipart",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Unsupported file type: a.csv. Please upload .txt or .pdf"})
+
+    def test_single_question_already_in_the_bank_is_rejected(self):
+        response = self.client.post("/questions/", {"text": "what is a Decorator"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "This question is already in the question bank."})
+
+
+class _Interrupted(BaseException):
+    """Stands in for GeneratorExit / CancelledError / KeyboardInterrupt reaching a call."""
+
+
+def _half_open_breaker():
+    breaker = llm.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker._opened_at -= breaker.reset_timeout
+    return breaker
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = llm.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertFalse(breaker.before_call())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(llm.LLMUnavailableError):
+            breaker.before_call()
+
+    def test_half_open_trial_success_closes(self):
+        breaker = _half_open_breaker()
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.before_call())
+        with self.assertRaises(llm.LLMUnavailableError):
+            breaker.before_call()  # one trial at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertFalse(breaker.before_call())
+
+    def test_half_open_trial_failure_reopens(self):
+        breaker = _half_open_breaker()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+    def test_interrupted_trial_is_released(self):
+        breaker = _half_open_breaker()
+
+        def call(request_options):
+            raise _Interrupted()
+
+        with mock.patch.object(llm, "breaker", breaker), mock.patch.object(llm, "_acquire_quota"):
+            with self.assertRaises(_Interrupted):
+                llm._call_with_retries(call, retries=0)
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.before_call())  # the next call gets to be the trial
+
+    def test_open_circuit_fails_before_taking_quota(self):
+        breaker = llm.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        call = mock.Mock()
+        with mock.patch.object(llm, "breaker", breaker), mock.patch.object(llm, "_acquire_quota") as acquire:
+            with self.assertRaises(llm.LLMUnavailableError):
+                llm._call_with_retries(call, retries=0)
+        acquire.assert_not_called()
+        call.assert_not_called()
+
+    def test_quota_timeout_releases_the_trial(self):
+        breaker = _half_open_breaker()
+        with mock.patch.object(llm, "breaker", breaker), \
+                mock.patch.object(llm, "_acquire_quota", side_effect=llm.LLMQuotaError("no capacity")):
+            with self.assertRaises(llm.LLMQuotaError):
+                llm._call_with_retries(mock.Mock(), retries=0)
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.before_call())
+
+    def test_unknown_error_leaves_the_breaker_alone(self):
+        def call(request_options):
+            raise ValueError("unexpected")
+
+        breaker = llm.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        with mock.patch.object(llm, "breaker", breaker), mock.patch.object(llm, "_acquire_quota"):
+            with self.assertRaises(llm.LLMError):
+                llm._call_with_retries(call, retries=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")  # the earlier failure still counts
+
+        breaker = _half_open_breaker()
+        with mock.patch.object(llm, "breaker", breaker), mock.patch.object(llm, "_acquire_quota"):
+            with self.assertRaises(llm.LLMError):
+                llm._call_with_retries(call, retries=0)
+        self.assertEqual(breaker.state, "half-open")
+
+    def test_trial_through_gateway_closes(self):
+        breaker = _half_open_breaker()
+        with mock.patch.object(llm, "breaker", breaker), mock.patch.object(llm, "_acquire_quota"):
+            self.assertEqual(llm._call_with_retries(lambda request_options: "ok", retries=0), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+
+class _FakeStream:
+    def __init__(self, texts):
+        self.texts = texts
+        self.usage_metadata = None
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for text in self.texts:
+            yield mock.Mock(text=text)
+
+
+class _FakeModel:
+    async def generate_content_async(self, contents, stream=False, request_options=None):
+        return _FakeStream(["Hello", " world"])
+
+
+class StreamBreakerTests(SimpleTestCase):
+
+    def patch_llm(self, breaker):
+        return mock.patch.multiple(
+            llm, breaker=breaker, _acquire_quota=mock.DEFAULT, get_model=mock.Mock(return_value=_FakeModel()),
+        )
+
+    async def test_completed_stream_closes_breaker(self):
+        breaker = _half_open_breaker()
+        with self.patch_llm(breaker):
+            chunks = [chunk async for chunk in llm.stream("prompt")]
+        self.assertEqual(chunks, ["Hello", " world"])
+        self.assertEqual(breaker.state, "closed")
+
+    async def test_disconnect_releases_trial(self):
+        breaker = _half_open_breaker()
+        with self.patch_llm(breaker):
+            chunks = llm.stream("prompt")
+            self.assertEqual(await chunks.__anext__(), "Hello")
+            await chunks.aclose()  # client went away mid-stream
+        self.assertTrue(breaker.before_call())
+
+
+class AsyncGatewayBreakerTests(SimpleTestCase):
+
+    async def test_open_circuit_fails_before_taking_quota(self):
+        breaker = llm.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        with mock.patch.multiple(llm, breaker=breaker, _acquire_quota=mock.DEFAULT) as patched:
+            with self.assertRaises(llm.LLMUnavailableError):
+                await llm._acall_with_retries(mock.AsyncMock(), retries=0)
+            with self.assertRaises(llm.LLMUnavailableError):
+                await llm.stream("prompt").__anext__()
+        patched["_acquire_quota"].assert_not_called()
+
+    async def test_cancelled_trial_is_released(self):
+        breaker = _half_open_breaker()
+        started = asyncio.Event()
+
+        async def call(request_options):
+            started.set()
+            await asyncio.sleep(60)
+
+        with mock.patch.multiple(llm, breaker=breaker, _acquire_quota=mock.DEFAULT):
+            task = asyncio.create_task(llm._acall_with_retries(call, retries=0))
+            await started.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertTrue(breaker.before_call())
+
+    async def test_trial_success_closes(self):
+        breaker = _half_open_breaker()
+
+        async def call(request_options):
+            return "ok"
+
+        with mock.patch.multiple(llm, breaker=breaker, _acquire_quota=mock.DEFAULT):
+            self.assertEqual(await llm._acall_with_retries(call, retries=0), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+
+@override_settings(CHAT_HISTORY_TOKEN_BUDGET=40)
+class ChatSessionTests(TestCase):
+
+    def test_concurrent_turns_are_all_kept(self):
+        session = ChatSession.objects.create()
+        first = ChatSession.objects.get(pk=session.pk)
+        second = ChatSession.objects.get(pk=session.pk)  # loaded before the first turn is saved
+
+        with mock.patch.object(tasks.compact_chat_session, "delay"):
+            chat.record_turn(first, "one", "reply one")
+            chat.record_turn(second, "two", "reply two")
+
+        session.refresh_from_db()
+        self.assertEqual([turn["text"] for turn in session.history], ["one", "reply one", "two", "reply two"])
+        self.assertEqual(session.turn_count, 2)
+
+    def test_compaction_is_queued_not_run_in_request(self):
+        session = ChatSession.objects.create()
+        with mock.patch.object(llm, "generate") as generate, \
+                mock.patch.object(tasks.compact_chat_session, "delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                chat.record_turn(session, "short", "short")
+            delay.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                chat.record_turn(session, "word " * 60, "word " * 60)
+        generate.assert_not_called()
+        delay.assert_called_once_with(str(session.pk))
+
+    def test_compaction_keeps_turns_recorded_meanwhile(self):
+        session = ChatSession.objects.create(history=[
+            {"role": "user", "text": "old " * 60},
+            {"role": "model", "text": "old reply " * 30},
+            {"role": "user", "text": "recent"},
+            {"role": "model", "text": "recent reply"},
+        ])
+
+        def summarize(prompt, **kwargs):
+            # Another request adds a turn while the summary is being generated
+            with mock.patch.object(tasks.compact_chat_session, "delay"):
+                chat.record_turn(ChatSession.objects.get(pk=session.pk), "new", "new reply")
+            return "They talked about old things."
+
+        with mock.patch.object(llm, "generate", side_effect=summarize):
+            chat.compact_session(session.pk)
+
+        session.refresh_from_db()
+        self.assertEqual(session.summary, "They talked about old things.")
+        self.assertEqual(
+            [turn["text"] for turn in session.history], ["recent", "recent reply", "new", "new reply"],
+        )
+
+
+class QuestionPoolTaskTests(TestCase):
+
+    def setUp(self):
+        self.requirement = Requirement.objects.create(name="Backend", experience="3 years", technology="Python")
+        self.candidate = Candidate.objects.create(name="Asha", technology="Python", requirement=self.requirement, is_quick=True)
+        for i in range(12):
+            Question.objects.create(text=f"Bank question {i}", technology="python")
+        Question.objects.create(text="Java question", technology="java")
+
+    def run_task(self, responses):
+        with mock.patch.object(llm, "generate", side_effect=responses) as generate:
+            tasks.generate_requirement_question_pool.apply(args=[str(self.requirement.id), [str(self.candidate.id)]])
+        return generate
+
+    def test_malformed_json_is_retried(self):
+        generate = self.run_task(["not json", '{"questions": ["What is a decorator?", "Explain the GIL."]}'])
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(self.requirement.question_pool.count(), 2)
+        self.assertEqual(
+            set(self.candidate.questions.values_list("text", flat=True)), {"What is a decorator?", "Explain the GIL."},
+        )
+
+    def test_waiting_candidates_fall_back_to_the_bank(self):
+        generate = self.run_task(["not json", '{"questions": []}', "[]", llm.LLMError("down")])
+        self.assertEqual(generate.call_count, 4)
+        self.assertFalse(self.requirement.question_pool.exists())
+        questions = self.candidate.questions.all()
+        self.assertEqual(len(questions), 10)
+        self.assertEqual({q.technology for q in questions}, {"python"})
+
+    def queue(self, candidate):
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.queue_question_pool(self.requirement, candidate_ids=[str(candidate.id)])
+
+    def test_one_generation_per_requirement_serves_every_waiting_candidate(self):
+        cache.clear()
+        other = Candidate.objects.create(name="Ben", technology="Python", requirement=self.requirement, is_quick=True)
+        with mock.patch.object(tasks.generate_requirement_question_pool, "delay") as delay:
+            self.queue(self.candidate)
+            self.queue(other)
+        delay.assert_called_once_with(str(self.requirement.id), [str(self.candidate.id)])
+
+        self.run_task(['{"questions": ["What is a decorator?", "Explain the GIL."]}'])
+        self.assertEqual(other.questions.count(), 2)
+        self.assertEqual(self.candidate.questions.count(), 2)
+        self.assertIsNone(cache.get(tasks._question_pool_lock_key(self.requirement)))
+
+    def test_marker_is_kept_across_retries(self):
+        cache.clear()
+        with mock.patch.object(tasks.generate_requirement_question_pool, "delay"):
+            self.queue(self.candidate)
+        lock_key = tasks._question_pool_lock_key(self.requirement)
+        with mock.patch.object(llm, "generate", side_effect=llm.LLMError("down")):
+            with mock.patch.object(tasks.generate_requirement_question_pool, "retry", side_effect=Retry()):
+                with self.assertRaises(Retry):
+                    tasks.generate_requirement_question_pool(str(self.requirement.id), [str(self.candidate.id)])
+        self.assertIsNotNone(cache.get(lock_key))
+
+    def test_edited_requirement_queues_its_own_generation(self):
+        cache.clear()
+        with mock.patch.object(tasks.generate_requirement_question_pool, "delay") as delay:
+            self.queue(self.candidate)
+            self.requirement.technology = "Python, Django"
+            self.requirement.save()
+            self.queue(self.candidate)
+        self.assertEqual(delay.call_count, 2)
+
+
+class WorkerWarmUpTests(SimpleTestCase):
+
+    @override_settings(EMOTION_MODEL_WARMUP=False)
+    def test_no_warm_up_when_disabled(self):
+        with mock.patch.object(tasks, "warm_up_configured_models") as warm_up:
+            tasks.warm_up_worker_models()
+        warm_up.assert_not_called()
+
+    @override_settings(EMOTION_MODEL_WARMUP=True)
+    def test_warm_up_when_enabled(self):
+        with mock.patch.object(tasks, "warm_up_configured_models") as warm_up:
+            tasks.warm_up_worker_models()
+        warm_up.assert_called_once_with()
+
+
+def _noise_png(seed):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new("L", (64, 48))
+    image.putdata([rng.randrange(256) for _ in range(64 * 48)])
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class PhotoTestMixin:
+    """Candidates with real photo files under a temporary MEDIA_ROOT; FER itself is faked."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.candidate = Candidate.objects.create(name="Ravi")
+        self.batches = []
+
+    def add_photo(self, seed):
+        photo = Photo.objects.create(image=ContentFile(_noise_png(seed), name=f"frame{seed}.png"))
+        self.candidate.photos.add(photo)
+        return photo
+
+    def fake_analyze_photo_batch(self, paths, **options):
+        self.batches.append(len(paths))
+        return [{"faces": 1, "emotions": ["happy"], "detector": "haar", "stages": []} for _ in paths]
+
+    def patch_fer(self):
+        return mock.patch.object(utils, "analyze_photo_batch", side_effect=self.fake_analyze_photo_batch)
+
+
+@override_settings(EMOTION_ANALYSIS_PHOTOS_PER_TASK=2, PHOTO_DEDUPE_MAX_DISTANCE=4)
+class CandidatePhotoFanOutTests(PhotoTestMixin, TestCase):
+
+    def run_task(self):
+        # Eager run; the in-memory result backend stands in for Redis when the group is frozen
+        app = tasks.analyze_candidate_photos.app
+        backend = CacheBackend(app=app, backend="memory")
+        with self.patch_fer(), mock.patch.object(tasks, "emotion_analysis_available", return_value=True), \
+                mock.patch.object(type(app), "backend", new_callable=mock.PropertyMock, return_value=backend):
+            return tasks.analyze_candidate_photos.apply(args=[str(self.candidate.id)]).get()
+
+    def test_many_photos_fan_out_to_celery_tasks(self):
+        photos = [self.add_photo(seed) for seed in range(5)]
+        duplicate = self.add_photo(0)
+
+        with mock.patch.object(tasks.analyze_photos, "run", wraps=tasks.analyze_photos.run) as analyze_photos:
+            self.assertEqual(self.run_task(), {"step": "facial", "ok": True})
+
+        self.assertEqual(analyze_photos.call_count, 3)
+        self.assertEqual(sorted(self.batches), [1, 2, 2])
+        # The two identical frames: one went through FER, the other copied it
+        pair = PhotoAnalysis.objects.filter(photo__in=[photos[0], duplicate])
+        self.assertEqual(sorted(str(analysis.reused_from_id) for analysis in pair if analysis.reused_from_id),
+                         [str(analysis.id) for analysis in pair if not analysis.reused_from_id])
+        self.candidate.refresh_from_db()
+        self.assertEqual(self.candidate.emotion_summary["total_photos"], 6)
+        self.assertEqual(self.candidate.emotion_summary["emotion_counts"], {"happy": 6})
+        self.assertEqual(self.candidate.evaluation_progress, tasks.EVALUATION_STEP_PROGRESS)
+
+    def test_few_photos_are_analyzed_in_the_task(self):
+        self.add_photo(1)
+        self.add_photo(2)
+        with mock.patch.object(tasks.analyze_photos, "run", wraps=tasks.analyze_photos.run) as analyze_photos:
+            self.assertEqual(self.run_task(), {"step": "facial", "ok": True})
+        self.assertEqual(analyze_photos.call_count, 1)
+        self.assertEqual(self.batches, [2])
+
+    def test_analyzed_photos_are_not_analyzed_again(self):
+        for seed in range(3):
+            self.add_photo(seed)
+        self.run_task()
+        self.run_task()
+        self.assertEqual(sum(self.batches), 3)
+        self.candidate.refresh_from_db()
+        self.assertEqual(self.candidate.emotion_summary["total_photos"], 3)
+
+
+class CandidateListingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        question = Question.objects.create(text="What is a closure?")
+        for i in range(6):
+            candidate = Candidate.objects.create(name=f"Candidate {i}", base_text="resume " * 200)
+            QuestionAnswer.objects.create(candidate=candidate, question=question, answer_text=f"Answer {i}")
+
+    def query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_cursor_pages_cover_every_candidate_once(self):
+        names = []
+        url = "/hr/?page_size=4"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 4)
+            names += [candidate["name"] for candidate in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(sorted(names), [f"Candidate {i}" for i in range(6)])
+
+    def test_query_count_does_not_grow_with_candidates(self):
+        small = self.query_count("/hr/?page_size=2")
+        self.assertEqual(self.query_count("/hr/?page_size=6"), small)
+        full = self.query_count("/hr/")
+        Candidate.objects.create(name="One more")
+        self.assertEqual(self.query_count("/hr/"), full)
+
+    def test_fields_projection_reads_only_those_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/hr/?fields=id,name")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data[0]), {"id", "name"})
+        self.assertNotIn("base_text", queries[0]["sql"])
+
+    def test_expand_answers(self):
+        response = self.client.get("/hr/?fields=name&expand=answers&page_size=10")
+        self.assertEqual(response.status_code, 200)
+        candidate = response.data["results"][0]
+        self.assertEqual(set(candidate), {"name", "answers"})
+        self.assertEqual(candidate["answers"][0]["question"]["text"], "What is a closure?")
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get("/hr/?fields=name,password&expand=secrets")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("password", response.data["error"])
+        self.assertIn("secrets", response.data["error"])
+
+    def test_requirement_projection_with_candidates(self):
+        requirement = Requirement.objects.create(name="Backend", technology="Python", base_text="jd " * 200)
+        Candidate.objects.filter(name="Candidate 0").update(requirement=requirement)
+        self.client.force_authenticate(User.objects.create(username="hr", email="hr@example.com"))
+
+        response = self.client.get("/requirement/?fields=id,name&expand=candidates")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data[0]), {"id", "name", "candidates"})
+        self.assertEqual([candidate["name"] for candidate in response.data[0]["candidates"]], ["Candidate 0"])
+
+
+class DocumentTextTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_text_is_cached_by_content_hash(self):
+        first = ContentFile(b"Jane Doe\nPython developer", name="a.txt")
+        renamed = ContentFile(b"Jane Doe\nPython developer", name="b.TXT")
+        extractor = mock.Mock(wraps=documents._txt_text)
+        with mock.patch.dict(documents.EXTRACTORS, txt=extractor):
+            self.assertEqual(documents.extract_document_text(first, ["txt"]), "Jane Doe\nPython developer")
+            self.assertEqual(documents.extract_document_text(renamed, ["txt"]), "Jane Doe\nPython developer")
+            documents.extract_document_text(ContentFile(b"Someone else", name="c.txt"), ["txt"])
+        self.assertEqual(extractor.call_count, 2)
+
+    def test_file_is_rewound_for_saving(self):
+        upload = ContentFile(b"resume body", name="cv.txt")
+        documents.extract_document_text(upload, ["txt"])
+        self.assertEqual(upload.read(), b"resume body")
+
+    def test_docx_text(self):
+        document = documents.docx.Document()
+        document.add_paragraph("Senior engineer")
+        document.add_paragraph("   ")
+        document.add_paragraph("Django, Celery")
+        buffer = BytesIO()
+        document.save(buffer)
+        upload = ContentFile(buffer.getvalue(), name="cv.docx")
+        self.assertEqual(documents.extract_document_text(upload, ["docx"]), "Senior engineer\nDjango, Celery\n")
+
+    def test_disallowed_extension(self):
+        with self.assertRaises(documents.UnsupportedDocumentError):
+            documents.extract_document_text(ContentFile(b"x", name="cv.txt"), ["pdf", "docx"])
+        with self.assertRaises(documents.UnsupportedDocumentError):
+            documents.extract_document_text(ContentFile(b"x", name="cv.exe"), ["exe"])
+
+    def test_cache_outage_still_extracts(self):
+        with mock.patch.object(documents, "cache") as broken:
+            broken.get.side_effect = ConnectionError("down")
+            broken.set.side_effect = ConnectionError("down")
+            text = documents.extract_document_text(ContentFile(b"plain", name="cv.txt"), ["txt"])
+        self.assertEqual(text, "plain")
+
+
+def _docx_upload(name, *lines):
+    document = documents.docx.Document()
+    for line in lines:
+        document.add_paragraph(line)
+    buffer = BytesIO()
+    document.save(buffer)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+def _fake_extraction(prompt, **kwargs):
+    """llm.generate stand-in that 'extracts' the email line of the resume."""
+    resume = prompt.rsplit("Resume text:", 1)[1]
+    email = next(word for word in resume.split() if "@" in word)
+    return json.dumps({"name": email.split("@")[0], "email": email, "technology": "Python", "companies": []})
+
+
+class ResumeUploadTestMixin:
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="hr", email="hr@example.org"))
+
+
+class ResumeIngestJobTests(ResumeUploadTestMixin, TestCase):
+
+    def test_async_upload_creates_candidates_in_the_worker(self):
+        files = [
+            _docx_upload("jane.docx", "Jane", "jane@example.com"),
+            _docx_upload("again.docx", "Jane again", "jane@example.com"),
+        ]
+        task = tasks.process_resume_ingest_item
+        with mock.patch.object(llm, "generate", side_effect=_fake_extraction), \
+                mock.patch.object(task, "delay", side_effect=task) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post("/hr/", {"upload_doc": files, "async": "true"}, format="multipart")
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response.data["status"], "Pending")
+                self.assertEqual(response.data["progress"], {"pending": 2, "completed": 0, "failed": 0})
+                delay.assert_not_called()  # queued only once the upload is committed
+
+        job = self.client.get(f"/hr/ingest/{response.data['id']}/").data
+        self.assertEqual(job["status"], "Completed")
+        self.assertEqual(job["progress"], {"pending": 0, "completed": 1, "failed": 1})
+        by_name = {item["file_name"]: item for item in job["items"]}
+        self.assertEqual(by_name["jane.docx"]["status"], "Completed")
+        self.assertEqual(Candidate.objects.get(pk=by_name["jane.docx"]["candidate"]).email, "jane@example.com")
+        self.assertEqual(by_name["again.docx"]["status"], "Failed")
+        self.assertEqual(by_name["again.docx"]["error"], "Email already exists.")
+
+    def test_unreadable_file_fails_only_its_item(self):
+        job = ResumeIngestJob.objects.create(total_files=1)
+        item = job.items.create(file=ContentFile(b"not a resume", name="notes.txt"), file_name="notes.txt")
+        tasks.process_resume_ingest_item(str(item.id))
+
+        item.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual(item.status, "Failed")
+        self.assertIn("Unsupported file type", item.error)
+        self.assertEqual(job.status, "Completed")
+
+    def test_unknown_job(self):
+        response = self.client.get("/hr/ingest/00000000-0000-0000-0000-000000000000/")
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(RESUME_EXTRACTION_CONCURRENCY=3)
+class ResumeUploadTests(ResumeUploadTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # The in-memory SQLite test database locks tables across the pool threads;
+        # the extraction cache has its own tests
+        self.enterContext(mock.patch.object(resumes, "get_cached_extraction", return_value=None))
+        self.enterContext(mock.patch.object(resumes, "store_extraction"))
+
+    def test_extractions_run_concurrently_and_keep_order(self):
+        # Every call waits for the other two, so a sequential loop would time out
+        barrier = threading.Barrier(3, timeout=5)
+
+        def extract(text, priority):
+            barrier.wait()
+            return {"email": text}, None
+
+        with mock.patch.object(resumes, "_llm_extract", side_effect=extract):
+            results = resumes.extract_many_resume_fields(["a@x.io", "b@x.io", "c@x.io"])
+        self.assertEqual([data["email"] for data in results], ["a@x.io", "b@x.io", "c@x.io"])
+
+    def test_failed_extraction_is_returned_in_place(self):
+        with mock.patch.object(resumes, "extract_resume_fields",
+                               side_effect=[{"email": "a@x.io"}, resumes.ResumeError("bad")]):
+            first, second = resumes.extract_many_resume_fields(["a", "b"])
+        self.assertEqual(first, {"email": "a@x.io"})
+        self.assertIsInstance(second, resumes.ResumeError)
+
+    def test_upload_creates_all_candidates_with_share_links(self):
+        files = [_docx_upload(f"{name}.docx", name, f"{name}@example.com") for name in ("ann", "bob", "cai")]
+        with mock.patch.object(llm, "generate", side_effect=_fake_extraction):
+            response = self.client.post("/hr/", {"upload_doc": files}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([record["email"] for record in response.data["records"]],
+                         ["ann@example.com", "bob@example.com", "cai@example.com"])
+        for candidate in Candidate.objects.all():
+            self.assertEqual(candidate.shine_link, f"{resumes.FRONTEND_BASE}/{candidate.id}/")
+
+    def test_duplicate_within_upload_creates_nothing(self):
+        files = [_docx_upload(f"{name}.docx", name, "same@example.com") for name in ("ann", "bob")]
+        with mock.patch.object(llm, "generate", side_effect=_fake_extraction):
+            response = self.client.post("/hr/", {"upload_doc": files}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Email already exists.")
+        self.assertFalse(Candidate.objects.exists())
+
+
+def _without(data, *keys):
+    return {key: value for key, value in data.items() if key not in keys}
+
+
+class AsyncViewTests(TestCase):
+    """The async/ endpoints answer like their sync counterparts; the LLM gateway is faked."""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        # The sync resume upload extracts in a thread pool, which the in-memory SQLite test database can't share
+        self.enterContext(mock.patch.object(resumes, "get_cached_extraction", return_value=None))
+        self.enterContext(mock.patch.object(resumes, "store_extraction"))
+        user = User.objects.create(username="hr", email="hr@example.org")
+        self.auth = {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    def post_both(self, path, make_data=dict, headers=None, **kwargs):
+        """POST to /<path> and /async/<path>; `make_data` builds a fresh body (uploads are read once)."""
+        headers = self.auth if headers is None else headers
+        sync_response = self.client.post(f"/{path}", make_data(), headers=headers, **kwargs)
+        async_response = async_to_sync(self.async_client.post)(f"/async/{path}", make_data(), headers=headers, **kwargs)
+        return sync_response, async_response
+
+    def fake_llm(self, **kwargs):
+        self.enterContext(mock.patch.object(llm, "generate", **kwargs))
+        self.enterContext(mock.patch.object(llm, "agenerate", **kwargs))
+
+    def assertSameResponse(self, sync_response, async_response, status_code, ignore=()):
+        self.assertEqual((sync_response.status_code, async_response.status_code), (status_code, status_code))
+        self.assertEqual(_without(async_response.json(), *ignore), _without(sync_response.json(), *ignore))
+
+    def test_unauthenticated_requests_are_rejected(self):
+        for path in ("hr/", "requirement/", "jd-assistant/analyze/"):
+            with self.subTest(path=path):
+                sync_response, async_response = self.post_both(path, headers={})
+                self.assertSameResponse(sync_response, async_response, 401)
+                self.assertEqual(async_response.json(), {"detail": "Authentication credentials were not provided."})
+                self.assertEqual(async_response["WWW-Authenticate"], sync_response["WWW-Authenticate"])
+
+    def test_invalid_token_is_rejected_even_where_login_is_optional(self):
+        for path in ("chat/", "requirement/"):
+            with self.subTest(path=path):
+                sync_response, async_response = self.post_both(
+                    path, lambda: {"question": "Hi"}, headers={"Authorization": "Bearer not-a-token"},
+                )
+                self.assertSameResponse(sync_response, async_response, 401)
+
+    def test_chat(self):
+        self.enterContext(mock.patch.object(llm, "send_chat", return_value="Hello! "))
+        self.enterContext(mock.patch.object(llm, "asend_chat", return_value="Hello! "))
+        sync_response, async_response = self.post_both("chat/", lambda: {"question": "Hi"}, headers={})
+        self.assertEqual((sync_response.status_code, async_response.status_code), (200, 200))
+        self.assertEqual(
+            _without(async_response.json()["data"], "session_id"), {"question": "Hi", "response": "Hello! "},
+        )
+        self.assertEqual(_without(sync_response.json()["data"], "session_id"), {"question": "Hi", "response": "Hello! "})
+        session = ChatSession.objects.get(pk=async_response.json()["data"]["session_id"])
+        self.assertEqual([turn["text"] for turn in session.history], ["Hi", "Hello! "])
+
+        sync_response, async_response = self.post_both(
+            "chat/", lambda: {"question": "Again", "session_id": str(session.pk)}, content_type="application/json",
+        )
+        self.assertEqual(async_response.json()["data"]["session_id"], str(session.pk))
+        self.assertEqual(sync_response.status_code, 200)
+
+    def test_chat_errors(self):
+        sync_response, async_response = self.post_both("chat/", lambda: {}, content_type="application/json")
+        self.assertSameResponse(sync_response, async_response, 400)
+
+        sync_response, async_response = self.post_both(
+            "chat/", lambda: {"question": "Hi", "session_id": "00000000-0000-0000-0000-000000000000"},
+            content_type="application/json",
+        )
+        self.assertSameResponse(sync_response, async_response, 404)
+
+        self.enterContext(mock.patch.object(llm, "send_chat", side_effect=llm.LLMError("down")))
+        self.enterContext(mock.patch.object(llm, "asend_chat", side_effect=llm.LLMError("down")))
+        sync_response, async_response = self.post_both("chat/", lambda: {"question": "Hi"})
+        self.assertSameResponse(sync_response, async_response, 503)
+        self.assertEqual(async_response.json(), {"error": "Chat failed: down"})
+
+    def upload_requirement(self):
+        return {"file": _docx_upload("jd.docx", "Backend developer", "3 years of Python")}
+
+    def test_requirement_upload(self):
+        self.fake_llm(return_value='{"name": "Backend Developer", "experience": "3 years", "technology": "Python"}')
+        sync_response, async_response = self.post_both("requirement/", self.upload_requirement)
+        self.assertSameResponse(sync_response, async_response, 201, ignore=("id", "file", "created_at", "updated_at"))
+        self.assertEqual(async_response.json()["technology"], "Python")
+        self.assertEqual(Requirement.objects.filter(base_text__contains="3 years of Python").count(), 2)
+
+    def test_requirement_upload_errors(self):
+        sync_response, async_response = self.post_both("requirement/")
+        self.assertSameResponse(sync_response, async_response, 400)
+
+        sync_response, async_response = self.post_both("requirement/", lambda: {"file": SimpleUploadedFile("jd.txt", b"x")})
+        self.assertSameResponse(sync_response, async_response, 400)
+
+        self.fake_llm(return_value='{"name": null}')
+        sync_response, async_response = self.post_both("requirement/", self.upload_requirement)
+        self.assertSameResponse(sync_response, async_response, 422)
+
+    def test_requirement_upload_with_the_llm_down(self):
+        self.fake_llm(side_effect=llm.LLMError("down"))
+        sync_response, async_response = self.post_both("requirement/", self.upload_requirement)
+        self.assertSameResponse(sync_response, async_response, 503)
+        self.assertFalse(Requirement.objects.exists())
+
+    def test_jd_assistant(self):
+        self.fake_llm(return_value='{"status": "complete", "fields": {"technology": "Python"}}')
+        sync_response, async_response = self.post_both(
+            "jd-assistant/analyze/", lambda: {"message": "Python dev"}, content_type="application/json",
+        )
+        self.assertSameResponse(sync_response, async_response, 200)
+
+        self.fake_llm(return_value=" A job description. ")
+        fields = {"experience": "3 years", "technology": "Python"}
+        sync_response, async_response = self.post_both(
+            "jd-assistant/generate/", lambda: {"fields": fields}, content_type="application/json",
+        )
+        self.assertSameResponse(sync_response, async_response, 200)
+        self.assertEqual(
+            async_response.json(), {"fields": {**fields, "name": "Python Developer"}, "jd_text": "A job description."},
+        )
+
+        sync_response, async_response = self.post_both(
+            "jd-assistant/save/", lambda: {"fields": dict(fields), "jd_text": "A job description."},
+            content_type="application/json",
+        )
+        self.assertSameResponse(sync_response, async_response, 201, ignore=("id", "created_at", "updated_at"))
+        self.assertEqual(async_response.json()["name"], "Python Developer")
+
+        for body in ({"fields": {}}, {"message": ""}):
+            action = "save" if "fields" in body else "analyze"
+            sync_response, async_response = self.post_both(
+                f"jd-assistant/{action}/", lambda: body, content_type="application/json",
+            )
+            self.assertSameResponse(sync_response, async_response, 400)
+        sync_response, async_response = self.post_both("jd-assistant/publish/", content_type="application/json")
+        self.assertSameResponse(sync_response, async_response, 400)
+
+    def upload_resumes(self, *emails):
+        return lambda: {"upload_doc": [_docx_upload(f"{email}.docx", email) for email in emails]}
+
+    def test_resume_upload_matches_the_sync_view(self):
+        self.fake_llm(side_effect=_fake_extraction)
+        ignore = ("id", "shine_link", "upload_doc", "created_at", "updated_at", "email", "name", "base_text")
+        sync_response = self.client.post("/hr/", self.upload_resumes("ann@example.com", "bob@example.com")(), headers=self.auth)
+        async_response = async_to_sync(self.async_client.post)(
+            "/async/hr/", self.upload_resumes("cai@example.com", "dee@example.com")(), headers=self.auth,
+        )
+        self.assertEqual((sync_response.status_code, async_response.status_code), (201, 201))
+        sync_records, async_records = sync_response.json()["records"], async_response.json()["records"]
+        self.assertEqual([record["email"] for record in async_records], ["cai@example.com", "dee@example.com"])
+        self.assertEqual([_without(r, *ignore) for r in async_records], [_without(r, *ignore) for r in sync_records])
+        for record in async_records:
+            self.assertEqual(record["shine_link"], f"{resumes.FRONTEND_BASE}/{record['id']}/")
+
+    def test_resume_upload_errors(self):
+        sync_response, async_response = self.post_both("hr/")
+        self.assertSameResponse(sync_response, async_response, 400)
+
+        self.fake_llm(side_effect=_fake_extraction)
+        sync_response, async_response = self.post_both("hr/", self.upload_resumes("same@example.com", "same@example.com"))
+        self.assertSameResponse(sync_response, async_response, 400)
+        self.assertEqual(async_response.json()["error"], "Email already exists.")
+        self.assertFalse(Candidate.objects.exists())
+
+
+class ResumeExtractionCacheTests(TestCase):
+    RESUME = "Jane Doe\njane@example.com\nPython developer at Acme Ltd"
+
+    def extract(self, text=RESUME, reply='{"name": "Jane Doe", "email": "jane@example.com"}'):
+        with mock.patch.object(llm, "generate", return_value=reply) as generate:
+            data = resumes.extract_resume_fields(text)
+        return data, generate.call_count
+
+    def test_reupload_skips_the_llm(self):
+        self.assertEqual(self.extract(), ({"name": "Jane Doe", "email": "jane@example.com"}, 1))
+        # Same resume re-exported with different whitespace
+        data, calls = self.extract("  Jane Doe\n\njane@example.com   Python developer at Acme Ltd ")
+        self.assertEqual((data["name"], calls), ("Jane Doe", 0))
+        self.assertEqual(ResumeExtractionCache.objects.get().hits, 1)
+
+    def test_prompt_version_change_misses(self):
+        self.extract()
+        with mock.patch.object(resumes, "RESUME_PROMPT_VERSION", "edited-prompt"):
+            self.assertEqual(self.extract()[1], 1)
+        self.assertEqual(ResumeExtractionCache.objects.count(), 2)
+
+    def test_heuristic_fallback_is_not_cached(self):
+        data, _ = self.extract(reply="not json")
+        self.assertEqual(data["email"], "jane@example.com")
+        self.assertFalse(ResumeExtractionCache.objects.exists())
+
+    def test_expired_entries_are_ignored(self):
+        self.extract()
+        ResumeExtractionCache.objects.update(created_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(self.extract()[1], 1)
+
+    @override_settings(RESUME_EXTRACTION_CACHE_MAX_ENTRIES=3)
+    def test_least_recently_used_entries_are_evicted(self):
+        for i in range(3):
+            self.extract(f"Resume {i}")
+            ResumeExtractionCache.objects.filter(text_hash=resumes.resume_text_hash(f"Resume {i}")).update(
+                last_used_at=timezone.now() - timedelta(minutes=10 - i),
+            )
+        resumes.get_cached_extraction(resumes.resume_text_hash("Resume 0"))  # touch the oldest
+        self.extract("Resume 3")
+
+        kept = set(ResumeExtractionCache.objects.values_list("text_hash", flat=True))
+        self.assertEqual(kept, {resumes.resume_text_hash(f"Resume {i}") for i in (0, 2, 3)})
+
+
+class ResumeHeuristicsTests(SimpleTestCase):
+    RESUME = (
+        "Jane Doe\njane@example.com\n+91 98765 43210\nSkills: React, Java, Python\n\n"
+        "Experience\nAcme Technologies\nSoftware Engineer, Jan 2019 - Dec 2021\n"
+        "Worked at Globex Solutions from 2022\nacme technologies, 2018\n"
+    )
+
+    def test_fields(self):
+        data = resume_heuristics.extract_fields(self.RESUME)
+        self.assertEqual(data["name"], "Jane Doe")
+        self.assertEqual(data["email"], "jane@example.com")
+        self.assertEqual(data["phone"], "+91 98765 43210")
+        self.assertEqual(data["technology"], "python")  # keyword priority, not position in the text
+
+    def test_companies_are_deduplicated_and_capped(self):
+        names = [company["company_name"] for company in resume_heuristics.find_companies(self.RESUME)]
+        self.assertIn("Acme Technologies", names)
+        self.assertIn("Globex Solutions", names)
+        self.assertEqual(len({name.lower() for name in names}), len(names))
+
+        many = "\n".join(f"Company{i} Solutions, 2020" for i in range(10))
+        self.assertEqual(len(resume_heuristics.find_companies(many)), resume_heuristics.MAX_COMPANIES)
+
+    def test_overlong_lines_are_not_scanned_for_companies(self):
+        dump = "worked at Acme Ltd " + "x" * resume_heuristics.MAX_LINE_LENGTH
+        self.assertEqual(resume_heuristics.find_companies(dump), [])
+
+    def test_run_together_text_stays_fast(self):
+        # Each of these backtracked for seconds to minutes with the old whole-document patterns
+        words = ["experience", "company", "solutions", "project", "developer", "systems", "team", "2021"]
+        rng = random.Random(7)
+        samples = [
+            " ".join(rng.choice(words) for _ in range(20000)),
+            ("Acme " * 3000) + "\n" + ("1 2 3 4 5 6 7 8 9 " * 500),
+            "company " + "a " * 20000,
+        ]
+        for text in samples:
+            start = time.perf_counter()
+            resume_heuristics.extract_fields(text)
+            self.assertLess(time.perf_counter() - start, 1.0)
+
+
+class ResumeSectionTests(SimpleTestCase):
+    RESUME = (
+        "Jane Doe | jane@example.com\n"
+        "Hobbies\nChess, hiking\n"
+        "Work Experience\nAcme Ltd, 2019 - 2021\nJane Doe - Resume\n"
+        "Technical Skills: Python, Django\n"
+        "Jane Doe - Resume\n"
+        "Education\nB.Tech 2018\nJane Doe - Resume\n"
+        "References\nAvailable on request\n"
+        "Declaration\nI hereby declare that the above is true.\n"
+    )
+
+    def test_sections_are_split_on_headings(self):
+        sections = dict(resume_sections.split_sections(self.RESUME))
+        self.assertEqual(sections["contact"], "Jane Doe | jane@example.com")
+        self.assertEqual(sections["skills"], "Technical Skills: Python, Django")
+        # The repeated page header is kept once
+        self.assertEqual(self.RESUME.count("Jane Doe - Resume"), 3)
+        self.assertEqual(sum(body.count("Jane Doe - Resume") for body in sections.values()), 1)
+
+    def test_irrelevant_sections_are_dropped_in_document_order(self):
+        trimmed = resume_sections.trim_resume(self.RESUME, 60)
+        for dropped in ("Chess", "Available on request", "hereby declare"):
+            self.assertNotIn(dropped, trimmed)
+        positions = [trimmed.index(text) for text in ("jane@example.com", "Acme Ltd", "Python", "B.Tech")]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_budget_keeps_the_most_important_sections(self):
+        resume = "Jane Doe\nEducation\n" + "B.Tech " * 100 + "\nExperience\nAcme Ltd 2019 - 2021\n"
+        trimmed = resume_sections.trim_resume(resume, 20)
+        self.assertIn("Acme Ltd", trimmed)
+        self.assertLessEqual(len(trimmed), 20 * 4 + 4)
+
+    def test_text_without_headings_is_truncated(self):
+        self.assertEqual(resume_sections.trim_resume("x" * 100, 10), "x" * 40)
+
+    def test_resume_within_budget_is_sent_as_is(self):
+        self.assertEqual(resume_sections.trim_resume(self.RESUME, 1000), self.RESUME)
+
+    def test_personal_details_at_the_end_are_kept(self):
+        resume = (
+            "Jane Doe\nWork Experience\nAcme Ltd, 2019 - 2021\n" + "Built billing services. " * 20 + "\n"
+            "Hobbies\n" + "Chess, hiking. " * 20 + "\n"
+            "Personal Details\nEmail: jane@example.com\nPhone: +91 98765 43210\n"
+        )
+        trimmed = resume_sections.trim_resume(resume, 150)
+        self.assertLess(len(trimmed), len(resume))
+        self.assertNotIn("Chess", trimmed)
+        self.assertIn("Email: jane@example.com", trimmed)
+        self.assertIn("Phone: +91 98765 43210", trimmed)
+
+    @override_settings(RESUME_PROMPT_TOKEN_BUDGET=60)
+    def test_extraction_prompt_uses_the_trimmed_resume(self):
+        with mock.patch.object(llm, "generate", return_value="{}") as generate:
+            resumes._llm_extract(self.RESUME)
+        prompt = generate.call_args.args[0]
+        self.assertIn("Acme Ltd", prompt)
+        self.assertNotIn("Chess", prompt)
+
+
+class LLMResponseCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        caches[settings.LLM_CACHE_ALIAS].clear()
+        self.model = mock.Mock()
+        self.model.generate_content.return_value = mock.Mock(text=" answer ", usage_metadata=None)
+        self.enterContext(mock.patch.multiple(
+            llm, breaker=llm.CircuitBreaker(5, 30), _acquire_quota=mock.DEFAULT,
+            get_model=mock.Mock(return_value=self.model),
+        ))
+
+    def test_repeated_low_temperature_call_is_served_from_cache(self):
+        self.assertEqual(llm.generate("prompt", temperature=0, cache=True), "answer")
+        self.assertEqual(llm.generate("prompt", temperature=0, cache=True), "answer")
+        self.assertEqual(self.model.generate_content.call_count, 1)
+        self.assertEqual(llm.cache_stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_key_covers_prompt_model_and_config(self):
+        llm.generate("prompt", temperature=0, cache=True)
+        llm.generate("other prompt", temperature=0, cache=True)
+        llm.generate("prompt", model=llm.LITE_MODEL, temperature=0, cache=True)
+        llm.generate("prompt", temperature=0.1, cache=True)
+        llm.generate("prompt", temperature=0, response_mime_type="application/json", cache=True)
+        self.assertEqual(self.model.generate_content.call_count, 5)
+
+    @override_settings(LLM_CACHE_MAX_TEMPERATURE=0.2)
+    def test_creative_and_opted_out_calls_are_not_cached(self):
+        for _ in range(2):
+            llm.generate("prompt", temperature=0.3, cache=True)
+            llm.generate("prompt", temperature=0)
+        self.assertEqual(self.model.generate_content.call_count, 4)
+        self.assertEqual(llm.cache_stats()["hits"] + llm.cache_stats()["misses"], 0)
+
+    def test_empty_response_is_not_cached(self):
+        self.model.generate_content.return_value = mock.Mock(text="", usage_metadata=None)
+        llm.generate("prompt", temperature=0, cache=True)
+        llm.generate("prompt", temperature=0, cache=True)
+        self.assertEqual(self.model.generate_content.call_count, 2)
+
+    def test_cache_outage_falls_through_to_the_model(self):
+        broken = mock.Mock(**{
+            "get.side_effect": ConnectionError("down"), "set.side_effect": ConnectionError("down"),
+            "add.side_effect": ConnectionError("down"), "get_many.side_effect": ConnectionError("down"),
+        })
+        with mock.patch.object(llm, "caches", {settings.LLM_CACHE_ALIAS: broken}):
+            self.assertEqual(llm.generate("prompt", temperature=0, cache=True), "answer")
+            self.assertEqual(llm.cache_stats(), {"hits": 0, "misses": 0, "hit_rate": None})
+
+    async def test_async_calls_share_the_cache(self):
+        self.model.generate_content_async = mock.AsyncMock(return_value=mock.Mock(text="answer", usage_metadata=None))
+        llm.generate("prompt", temperature=0, cache=True)
+        self.assertEqual(await llm.agenerate("prompt", temperature=0, cache=True), "answer")
+        self.model.generate_content_async.assert_not_called()
+
+
+@unittest.skipUnless(HAS_FAKEREDIS_LUA, "needs fakeredis and lupa")
+class TokenBucketLimiterTests(SimpleTestCase):
+
+    def limiter(self, requests_per_minute=10, tokens_per_minute=1000, background_reserve=0.0):
+        import fakeredis
+
+        limiter = llm_quota.TokenBucketLimiter("redis://unused", requests_per_minute, tokens_per_minute, background_reserve)
+        limiter._script = fakeredis.FakeRedis().register_script(llm_quota.TOKEN_BUCKET_SCRIPT)
+        return limiter
+
+    def test_requests_bucket_runs_dry(self):
+        limiter = self.limiter(requests_per_minute=2)
+        limiter.acquire(10, max_wait=0)
+        limiter.acquire(10, max_wait=0)
+        with self.assertRaises(llm_quota.QuotaWaitTimeout):
+            limiter.acquire(10, max_wait=0)
+
+    def test_tokens_bucket_runs_dry(self):
+        limiter = self.limiter(tokens_per_minute=1000)
+        limiter.acquire(900, max_wait=0)
+        with self.assertRaises(llm_quota.QuotaWaitTimeout):
+            limiter.acquire(200, max_wait=0)
+
+    def test_caller_waits_for_the_refill(self):
+        limiter = self.limiter(requests_per_minute=60)  # one request a second
+        for _ in range(60):
+            limiter.acquire(1, max_wait=0)
+        waited = limiter.acquire(1, max_wait=5)
+        self.assertGreater(waited, 0.5)
+
+    def test_background_leaves_the_reserve_to_interactive(self):
+        limiter = self.limiter(requests_per_minute=10, background_reserve=0.5)
+        for _ in range(5):
+            limiter.acquire(1, priority=llm_quota.BACKGROUND, max_wait=0)
+        with self.assertRaises(llm_quota.QuotaWaitTimeout):
+            limiter.acquire(1, priority=llm_quota.BACKGROUND, max_wait=0)
+        for _ in range(5):
+            limiter.acquire(1, priority=llm_quota.INTERACTIVE, max_wait=0)
+
+    def test_oversized_call_is_capped_to_the_bucket(self):
+        limiter = self.limiter(tokens_per_minute=1000)
+        limiter.acquire(50000, max_wait=0)
+        self.assertLess(limiter.usage()["tokens"]["available"], 10)
+
+    def test_debit_corrects_the_token_estimate(self):
+        limiter = self.limiter(tokens_per_minute=1000)
+        limiter.acquire(600, max_wait=0)
+        limiter.debit(-500)  # the call used 100 tokens
+        self.assertGreaterEqual(limiter.usage()["tokens"]["available"], 900)
+        limiter.debit(800)
+        usage = limiter.usage()
+        self.assertLess(usage["tokens"]["available"], 200)
+        self.assertEqual(usage["requests"]["available"], 9)
+
+    def test_buckets_are_shared_between_limiters(self):
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        limiters = []
+        for _ in range(2):
+            limiter = llm_quota.TokenBucketLimiter("redis://unused", 2, 1000)
+            limiter._script = fakeredis.FakeRedis(server=server).register_script(llm_quota.TOKEN_BUCKET_SCRIPT)
+            limiters.append(limiter)
+        limiters[0].acquire(1, max_wait=0)
+        limiters[1].acquire(1, max_wait=0)
+        with self.assertRaises(llm_quota.QuotaWaitTimeout):
+            limiters[0].acquire(1, max_wait=0)
+
+
+class TokenBucketFailOpenTests(SimpleTestCase):
+
+    def test_unreachable_redis_allows_calls(self):
+        limiter = llm_quota.TokenBucketLimiter("redis://127.0.0.1:1/0", 1, 1)
+        self.assertEqual(limiter.acquire(100, max_wait=0), 0.0)
+        self.assertEqual(limiter.acquire(100, max_wait=0), 0.0)
+        limiter.debit(50)
+        self.assertIsNone(limiter.usage())
+
+
+class EvaluationChordTests(TestCase):
+
+    def setUp(self):
+        self.candidate = Candidate.objects.create(name="Meera", interview_status="Scheduled")
+        question = Question.objects.create(text="Describe a project you led.")
+        QuestionAnswer.objects.create(candidate=self.candidate, question=question, answer_text="I led the migration.")
+        app = tasks.evaluate_communication.app
+        self.addCleanup(setattr, app.conf, "task_always_eager", app.conf.task_always_eager)
+        app.conf.task_always_eager = True
+        self.enterContext(mock.patch.object(
+            type(app), "backend", new_callable=mock.PropertyMock, return_value=CacheBackend(app=app, backend="memory"),
+        ))
+        self.enterContext(mock.patch.object(tasks, "emotion_analysis_available", return_value=True))
+
+    def complete_interview(self, generate):
+        with mock.patch.object(llm, "generate", side_effect=generate) as llm_call:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = APIClient().put(f"/hr/{self.candidate.id}/", {"interview_status": "Completed"}, format="json")
+                self.assertEqual(response.status_code, 200)
+                # The request only queues the evaluation
+                llm_call.assert_not_called()
+                self.candidate.refresh_from_db()
+                self.assertEqual((self.candidate.evaluation_status, self.candidate.evaluation_progress), ("Pending", 0))
+        self.candidate.refresh_from_db()
+
+    def test_steps_run_in_the_background_and_finalize(self):
+        self.complete_interview(lambda *args, **kwargs: '{"communication_point": 7}')
+        self.assertEqual(self.candidate.communication, 7)
+        self.assertEqual((self.candidate.evaluation_status, self.candidate.evaluation_progress), ("Completed", 100))
+
+    def test_one_failed_step_still_completes(self):
+        self.complete_interview(llm.LLMError("down"))
+        self.assertEqual((self.candidate.evaluation_status, self.candidate.evaluation_progress), ("Completed", 100))
+
+    def test_all_steps_failed(self):
+        with mock.patch.object(tasks, "plan_photo_analysis", side_effect=RuntimeError("no models")):
+            self.complete_interview(llm.LLMError("down"))
+        self.assertEqual((self.candidate.evaluation_status, self.candidate.evaluation_progress), ("Failed", 100))
+
+    def test_no_answers_no_evaluation(self):
+        self.candidate.answers.all().delete()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = APIClient().put(f"/hr/{self.candidate.id}/", {"interview_status": "Completed"}, format="json")
+        self.assertEqual(response.data, {"message": "No answers found"})
+        self.assertEqual(callbacks, [])
+
+
+class _BouncingEmailBackend(LocMemEmailBackend):
+    """locmem backend that rejects one address and counts opened connections."""
+    opened = 0
+
+    def open(self):
+        type(self).opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any("bounce@example.com" in message.to for message in messages):
+            raise ConnectionRefusedError("550 mailbox unavailable")
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="myapp.tests._BouncingEmailBackend", EMAIL_OUTBOX_BATCH_SIZE=3)
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _BouncingEmailBackend.opened = 0
+
+    def queue(self, *recipients):
+        return [OutboundEmail.objects.create(subject="Interview", body="Hello", to=[to]) for to in recipients]
+
+    def test_queueing_schedules_one_drain_per_burst(self):
+        with mock.patch.object(tasks.drain_email_outbox, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(3):
+                    mail.queue_email("Interview", "Hello", [f"c{i}@example.com"])
+        apply_async.assert_called_once_with(countdown=settings.EMAIL_OUTBOX_DELAY)
+        self.assertEqual(len(django_mail.outbox), 0)  # nothing is sent inside the request
+        self.assertEqual(OutboundEmail.objects.filter(status="Pending").count(), 3)
+
+    def test_batch_is_sent_over_one_connection(self):
+        self.queue("a@example.com", "b@example.com")
+        self.assertEqual(mail.send_pending_emails(), 2)
+        self.assertEqual(_BouncingEmailBackend.opened, 1)
+        self.assertEqual(sorted(message.to[0] for message in django_mail.outbox), ["a@example.com", "b@example.com"])
+        self.assertFalse(OutboundEmail.objects.exclude(status="Sent").exists())
+
+    def test_rejected_address_is_retried_with_backoff(self):
+        self.queue("a@example.com", "bounce@example.com")
+        mail.send_pending_emails()
+
+        bounced = OutboundEmail.objects.get(to=["bounce@example.com"])
+        self.assertEqual((bounced.status, bounced.attempts), ("Pending", 1))
+        self.assertIn("550", bounced.last_error)
+        delay = (bounced.send_after - timezone.now()).total_seconds()
+        self.assertAlmostEqual(delay, settings.EMAIL_OUTBOX_RETRY_BASE, delta=5)
+        self.assertEqual(OutboundEmail.objects.get(to=["a@example.com"]).status, "Sent")
+        # Not due yet
+        self.assertEqual(mail.send_pending_emails(), 0)
+
+        OutboundEmail.objects.filter(pk=bounced.pk).update(send_after=timezone.now(), attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS - 1)
+        mail.send_pending_emails()
+        self.assertEqual(OutboundEmail.objects.get(pk=bounced.pk).status, "Failed")
+
+    def test_claims_respect_the_limit_and_reclaim_stale_rows(self):
+        stale, fresh, future, *due = self.queue("s@example.com", "f@example.com", "l@example.com", "1@x.io", "2@x.io")
+        OutboundEmail.objects.filter(pk=stale.pk).update(status="Sending", updated_at=timezone.now() - timedelta(hours=1))
+        OutboundEmail.objects.filter(pk=fresh.pk).update(status="Sending")
+        OutboundEmail.objects.filter(pk=future.pk).update(send_after=timezone.now() + timedelta(hours=1))
+
+        first = mail.claim_batch(2)
+        second = mail.claim_batch(2)
+        claimed = {email.pk for email in first + second}
+        self.assertEqual(len(first), 2)
+        self.assertEqual(claimed, {stale.pk} | {email.pk for email in due})
+        self.assertEqual(mail.claim_batch(2), [])
+        self.assertEqual(OutboundEmail.objects.get(pk=stale.pk).attempts, 1)
+
+    def test_drain_sends_every_batch_and_schedules_the_next_retry(self):
+        self.queue(*[f"c{i}@example.com" for i in range(7)], "bounce@example.com")
+        with mock.patch.object(tasks, "schedule_email_drain") as schedule:
+            tasks.drain_email_outbox()
+        self.assertEqual(len(django_mail.outbox), 7)
+        self.assertEqual(_BouncingEmailBackend.opened, 3)
+        schedule.assert_called_once()
+        self.assertAlmostEqual(schedule.call_args.kwargs["delay"], settings.EMAIL_OUTBOX_RETRY_BASE, delta=5)
+
+
+HAPPY_FACE = {"faces": 1, "emotions": ["happy"], "detector": "haar", "stages": []}
+
+
+class PhotoUploadAnalysisTests(PhotoTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(tasks, "emotion_analysis_available", return_value=True))
+
+    def upload(self, seed, result=HAPPY_FACE):
+        image = SimpleUploadedFile(f"frame{seed}.png", _noise_png(seed), content_type="image/png")
+        task = tasks.analyze_photo
+        with mock.patch.object(utils, "analyze_photo_file", return_value=result), \
+                mock.patch.object(task, "delay", side_effect=task) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = APIClient().post(f"/photo/{self.candidate.id}/", {"image": image}, format="multipart")
+                delay.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.candidate.refresh_from_db()
+        return PhotoAnalysis.objects.get(photo_id=response.data["id"])
+
+    def test_each_upload_updates_the_running_summary(self):
+        first = self.upload(1)
+        self.assertEqual((first.status, first.face_count, first.emotions), ("Completed", 1, ["happy"]))
+        self.assertEqual(self.candidate.emotion_summary["total_photos"], 1)
+
+        self.upload(2, {"faces": 2, "emotions": ["sad", "neutral"], "detector": "mtcnn", "stages": []})
+        summary = self.candidate.emotion_summary
+        self.assertEqual((summary["total_photos"], summary["total_faces"]), (2, 3))
+        self.assertEqual(summary["emotion_counts"], {"happy": 1, "sad": 1, "neutral": 1})
+        self.assertEqual(summary["title_summary"], {"Good": 1, "Neutral": 1, "Bad": 1})
+
+    def test_unreadable_photo_is_counted_without_faces(self):
+        analysis = self.upload(3, None)  # analyze_photo_file could not read it
+        self.assertEqual(analysis.status, "Failed")
+        self.assertEqual(self.candidate.emotion_summary["total_photos"], 1)
+        self.assertEqual(self.candidate.emotion_summary["total_faces"], 0)
+
+    def test_photo_is_recorded_once(self):
+        analysis = self.upload(1)
+        self.assertFalse(utils.record_photo_analysis(analysis.id, HAPPY_FACE))
+        self.candidate.refresh_from_db()
+        self.assertEqual(self.candidate.emotion_summary["total_photos"], 1)
+
+    def test_pre_existing_summary_is_replaced(self):
+        Candidate.objects.filter(pk=self.candidate.pk).update(
+            emotion_summary={"total_photos": 40, "total_faces": 40, "emotion_counts": {"happy": 40}},
+        )
+        self.upload(1)
+        self.assertEqual(self.candidate.emotion_summary["total_photos"], 1)
+
+    def test_photo_stays_pending_without_models(self):
+        tasks.emotion_analysis_available.return_value = False
+        analysis = self.upload(1)
+        self.assertEqual(analysis.status, "Pending")
+        # analyze_candidate_photos picks it up when the interview completes
+        to_analyze, _ = utils.plan_photo_analysis(self.candidate, utils.candidate_photos(self.candidate))
+        self.assertEqual(to_analyze, [str(analysis.id)])
+
+
+def _brightened_png(seed, amount):
+    from PIL import Image, ImageEnhance
+
+    with Image.open(BytesIO(_noise_png(seed))) as image:
+        brighter = ImageEnhance.Brightness(image).enhance(amount)
+    buffer = BytesIO()
+    brighter.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@override_settings(PHOTO_DEDUPE_MAX_DISTANCE=4)
+class PhotoDedupeTests(PhotoTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(tasks, "emotion_analysis_available", return_value=True))
+        self.analyze = self.enterContext(mock.patch.object(utils, "analyze_photo_file", return_value=HAPPY_FACE))
+
+    def analyze_upload(self, data, name="frame.png"):
+        photo = Photo.objects.create(image=ContentFile(data, name=name))
+        self.candidate.photos.add(photo)
+        analysis = PhotoAnalysis.objects.create(photo=photo, candidate=self.candidate)
+        tasks.analyze_photo(str(analysis.id))
+        analysis.refresh_from_db()
+        return analysis
+
+    def test_dhash_distance(self):
+        def dhash(data):
+            return int(face_analysis.image_dhash(BytesIO(data)), 16)
+
+        frame = dhash(_noise_png(1))
+        self.assertEqual(dhash(_noise_png(1)), frame)
+        self.assertLessEqual((dhash(_brightened_png(1, 1.05)) ^ frame).bit_count(), 4)
+        self.assertGreater((dhash(_noise_png(2)) ^ frame).bit_count(), 16)
+
+    def test_dhash_of_unreadable_file(self):
+        upload = BytesIO(b"not an image")
+        self.assertIsNone(face_analysis.image_dhash(upload))
+        self.assertEqual(upload.tell(), 0)
+
+    def test_near_duplicate_frame_reuses_the_analysis(self):
+        first = self.analyze_upload(_noise_png(1))
+        second = self.analyze_upload(_brightened_png(1, 1.05))
+        other = self.analyze_upload(_noise_png(2))
+
+        self.assertEqual(self.analyze.call_count, 2)
+        self.assertEqual(second.reused_from_id, first.id)
+        self.assertEqual((second.status, second.emotions), ("Completed", ["happy"]))
+        self.assertIsNone(other.reused_from_id)
+        # The copied frame still counts in the summary
+        self.candidate.refresh_from_db()
+        self.assertEqual(self.candidate.emotion_summary["total_faces"], 3)
+
+    def test_missing_hash_is_backfilled(self):
+        analysis = self.analyze_upload(_noise_png(1))
+        self.assertEqual(analysis.photo.phash, face_analysis.image_dhash(BytesIO(_noise_png(1))))
+
+    @override_settings(PHOTO_DEDUPE_MAX_DISTANCE=-1)
+    def test_dedupe_can_be_disabled(self):
+        self.analyze_upload(_noise_png(1))
+        second = self.analyze_upload(_noise_png(1))
+        self.assertEqual(self.analyze.call_count, 2)
+        self.assertIsNone(second.reused_from_id)
+
+    def test_upload_stores_the_hash(self):
+        image = SimpleUploadedFile("frame.png", _noise_png(3), content_type="image/png")
+        with mock.patch("myapp.views.queue_photo_analysis"):
+            response = APIClient().post(f"/photo/{self.candidate.id}/", {"image": image}, format="multipart")
+        self.assertEqual(response.data["phash"], face_analysis.image_dhash(BytesIO(_noise_png(3))))
+        # Hashing rewinds the upload, so the stored file is complete
+        with Photo.objects.get(pk=response.data["id"]).image.open("rb") as stored:
+            self.assertEqual(stored.read(), _noise_png(3))
+
+
+def _faces(*scores):
+    """Detected faces whose top emotion scores are `scores`."""
+    return [{"box": [0, 0, 10, 10], "emotions": {"happy": score, "sad": score / 2}} for score in scores]
+
+
+class DetectorCascadeTests(SimpleTestCase):
+    CASCADE = [
+        {"detector": "fer", "min_faces": 1, "min_emotion_score": 0.5},
+        {"detector": "haar", "min_faces": 2, "min_emotion_score": 0.5},
+        {"detector": "mtcnn", "min_confidence": 0.9},
+    ]
+
+    def run_cascade(self, cascade=CASCADE, **outcomes):
+        detectors = {}
+        for name, outcome in outcomes.items():
+            detectors[name] = mock.Mock(**{"side_effect" if isinstance(outcome, Exception) else "return_value": outcome})
+        with mock.patch.dict(face_analysis.DETECTORS, detectors):
+            faces, used, stages = face_analysis.detect_emotions("image", cascade)
+        return faces, used, [(stage["detector"], stage["faces"], stage["accepted"]) for stage in stages], detectors
+
+    def test_cheap_stage_that_qualifies_ends_the_cascade(self):
+        faces, used, stages, detectors = self.run_cascade(fer=_faces(0.9), haar=_faces(0.9), mtcnn=_faces(0.9))
+        self.assertEqual((used, stages), ("fer", [("fer", 1, True)]))
+        detectors["haar"].assert_not_called()
+        detectors["mtcnn"].assert_not_called()
+
+    def test_low_emotion_score_and_too_few_faces_escalate(self):
+        faces, used, stages, _ = self.run_cascade(fer=_faces(0.3), haar=_faces(0.9), mtcnn=_faces(0.6, 0.7))
+        self.assertEqual(used, "mtcnn")
+        self.assertEqual(stages, [("fer", 1, False), ("haar", 1, False), ("mtcnn", 2, True)])
+
+    def test_best_result_is_kept_when_no_stage_qualifies(self):
+        cascade = [stage | {"min_faces": 3} for stage in self.CASCADE]
+        faces, used, _, _ = self.run_cascade(cascade, fer=_faces(0.9), haar=_faces(0.2, 0.3), mtcnn=_faces(0.1, 0.4))
+        self.assertEqual((used, len(faces)), ("haar", 2))
+
+    def test_detector_confidence_is_used_where_reported(self):
+        unsure = [face | {"confidence": 0.6} for face in _faces(0.9)]
+        sure = [face | {"confidence": 0.99} for face in _faces(0.2)]
+        cascade = [{"detector": "mtcnn", "min_confidence": 0.9, "min_emotion_score": 0.5}, {"detector": "fer"}]
+        self.assertEqual(self.run_cascade(cascade, mtcnn=unsure, fer=[])[2], [("mtcnn", 1, False), ("fer", 0, False)])
+        self.assertEqual(self.run_cascade(cascade, mtcnn=sure, fer=[])[2], [("mtcnn", 1, True)])
+
+    def test_clear_face_with_mixed_emotions_stops_at_the_first_stage(self):
+        # Top score of a calm frame in photos/; the softmax spread is not a detection failure
+        faces, used, stages, _ = self.run_cascade(
+            settings.EMOTION_DETECTOR_CASCADE, fer=_faces(0.35), haar=_faces(0.42), mtcnn=_faces(0.4),
+        )
+        self.assertEqual((used, stages), ("fer", [("fer", 1, True)]))
+
+    def test_failing_detector_escalates(self):
+        faces, used, stages, _ = self.run_cascade(fer=RuntimeError("broken"), haar=[], mtcnn=_faces(0.2))
+        self.assertEqual(used, "mtcnn")
+        self.assertEqual(stages, [("fer", 0, False), ("haar", 0, False), ("mtcnn", 1, True)])
+
+    def test_batch_only_escalates_unresolved_images(self):
+        finders = {
+            "fer": mock.Mock(side_effect=lambda image: [(image, [0, 0, 10, 10], [0, 0, 10, 10], False, None)] if image == "face" else []),
+            "haar": mock.Mock(return_value=[]),
+            "mtcnn": mock.Mock(return_value=[]),
+        }
+        with mock.patch.dict(face_analysis.FACE_FINDERS, finders), \
+                mock.patch.object(emotion_backends, "classify_faces", return_value=[{"happy": 0.9, "sad": 0.1}]) as classify:
+            results = face_analysis.detect_emotions_batch(["face", "empty"], backend=None, cascade=self.CASCADE)
+
+        self.assertEqual([used for _, used, _ in results], ["fer", None])
+        self.assertEqual([call.args[0] for call in finders["haar"].call_args_list], ["empty"])
+        self.assertEqual([call.args[0] for call in finders["mtcnn"].call_args_list], ["empty"])
+        self.assertEqual(len(classify.call_args_list[0].args[1]), 1)
+
+    def test_batch_gates_mtcnn_faces_on_their_probability(self):
+        np = face_analysis.np
+        mtcnn = mock.Mock(**{"detect.return_value": (
+            np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=float), np.array([0.99, 0.7]),
+        )})
+        with mock.patch.object(face_analysis, "get_mtcnn", return_value=mtcnn), \
+                mock.patch.object(emotion_backends, "classify_faces", return_value=[{"happy": 0.3}, {"sad": 0.9}]):
+            [(faces, used, stages)] = face_analysis.detect_emotions_batch(
+                ["image"], backend=None, cascade=[{"detector": "mtcnn", "min_confidence": 0.9}],
+            )
+        self.assertEqual([(face["box"], face["confidence"]) for face in faces], [([0, 0, 10, 10], 0.99), ([20, 20, 10, 10], 0.7)])
+        self.assertEqual((used, stages[0]["accepted"]), ("mtcnn", False))
+
+
+@override_settings(EMOTION_DETECTOR_CASCADE=DetectorCascadeTests.CASCADE)
+class DetectorStatsTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_stage_counters(self):
+        utils.record_detector_stats({"stages": [
+            {"detector": "fer", "seconds": 0.010, "faces": 0, "accepted": False},
+            {"detector": "haar", "seconds": 0.030, "faces": 1, "accepted": True},
+        ]})
+        utils.record_detector_stats({"stages": [{"detector": "fer", "seconds": 0.020, "faces": 1, "accepted": True}]})
+        utils.record_detector_stats(None)  # unreadable photo
+
+        stats = utils.detector_stats()
+        self.assertEqual(stats["fer"], {
+            "runs": 2, "accepted": 1, "found": 1, "latency_ms": 30,
+            "accept_rate": 0.5, "found_rate": 0.5, "mean_latency_ms": 15.0,
+        })
+        self.assertEqual((stats["haar"]["runs"], stats["haar"]["accept_rate"]), (1, 1.0))
+        self.assertEqual(stats["mtcnn"]["runs"], 0)
+        self.assertIsNone(stats["mtcnn"]["accept_rate"])
+
+        utils.reset_detector_stats()
+        self.assertEqual(utils.detector_stats()["fer"]["runs"], 0)
+
+    def test_analysis_records_stats(self):
+        result = {"faces": 1, "emotions": ["happy"], "detector": "fer",
+                  "stages": [{"detector": "fer", "seconds": 0.004, "faces": 1, "accepted": True}]}
+        with mock.patch.object(utils, "analyze_photo_batch", return_value=[result, None]):
+            utils.analyze_photo_files(["a.png", "b.png"])
+        self.assertEqual(utils.detector_stats()["fer"]["accepted"], 1)
@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import AnswerSaveView, QuestionListAPIView, CandidateView, PhotoView, RequirementView, RegisterView, LoginView, ChatAiView, JDAssistantView
+from .async_views import AsyncCandidateView, AsyncChatAiView, AsyncJDAssistantView, AsyncRequirementView
+from .views import AnswerSaveView, QuestionListAPIView, CandidateView, PhotoView, RequirementView, ResumeIngestJobView, RegisterView, LoginView, ChatAiView, JDAssistantView, LLMUsageView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
@@ -10,9 +11,17 @@ urlpatterns = [
     path('answer/', AnswerSaveView.as_view(), name="answer"),
     path('hr/', CandidateView.as_view(), name="hr"),
     path('hr/<uuid:pk>/', CandidateView.as_view(), name="hr"),
+    path('hr/ingest/<uuid:pk>/', ResumeIngestJobView.as_view(), name="hr-ingest"),
     path('photo/<uuid:pk>/', PhotoView.as_view(), name="photo"),
     path('requirement/', RequirementView.as_view(), name="requirement"),
     path('requirement/<uuid:pk>/', RequirementView.as_view(), name="requirement"),
     path('chat/', ChatAiView.as_view(), name="chat"),
     path('jd-assistant/<str:action>/', JDAssistantView.as_view(), name="jd-assistant"),
+    path('llm/usage/', LLMUsageView.as_view(), name="llm-usage"),
+
+    # Async (ASGI) versions of the LLM-bound endpoints
+    path('async/hr/', AsyncCandidateView.as_view(), name="async-hr"),
+    path('async/requirement/', AsyncRequirementView.as_view(), name="async-requirement"),
+    path('async/chat/', AsyncChatAiView.as_view(), name="async-chat"),
+    path('async/jd-assistant/<str:action>/', AsyncJDAssistantView.as_view(), name="async-jd-assistant"),
 ]
\ No newline at end of file
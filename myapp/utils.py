@@ -1,201 +1,367 @@
 import json
 from openai import OpenAI
 from django.conf import settings
-from .models import Candidate, QuestionAnswer
-import time
+from django.db import transaction
+from .models import Candidate, PhotoAnalysis, QuestionAnswer
 from collections import Counter
+from django.core.cache import cache
 
-try:
-    from fer.fer import FER
-    import cv2
-except Exception as e:
-    print("FER/OpenCV import failed:", e)
-    FER = None
-    cv2 = None
+from .face_analysis import (analyze_photo_batch, analyze_photo_file, available as face_analysis_available, image_dhash,
+                            warm_up_emotion_models)
 
+FINISHED_ANALYSIS_STATUSES = ("Completed", "Failed")
 
-def analyze_facial_expressions(hr_obj):
-    """
-    Analyze facial expressions for all photos attached to the given Candidate record
-    using FER (mtcnn=True). Looks at ALL detected faces in every image.
 
-    Saves a structured summary to `Candidate.emotion_summary` and returns it, for example:
-    {
-        "total_photos": 3,
-        "total_faces": 5,
-        "emotion_counts": {"happy": 2, "neutral": 2, "angry": 1},
-        "title_summary": {"Good": 2, "Neutral": 2, "Bad": 1},
-        "report_lines": ["Good (40%): Facial expressions showed strong focus and interest.", ...]
+def emotion_analysis_options():
+    """Detector cascade and emotion backend from settings, as passed to face_analysis."""
+    return {
+        "cascade": settings.EMOTION_DETECTOR_CASCADE,
+        "backend": settings.EMOTION_BACKEND,
+        "model_path": settings.EMOTION_MODEL_PATH,
     }
-    """
-    # Verify dependencies
-    if FER is None or cv2 is None:
-        print("FER/OpenCV not available. Please install 'fer', 'opencv-python', and 'mtcnn'.")
-        return None
 
-    photos_qs = getattr(hr_obj, "photos", None)
-    if not photos_qs:
-        return None
 
-    photos = list(photos_qs.all())
-    if not photos:
-        return None
+def emotion_analysis_available():
+    return face_analysis_available(settings.EMOTION_BACKEND)
 
-    # Initialize FER detectors (primary with MTCNN, fallback without)
-    detector = FER(mtcnn=True)
-    try:
-        fallback_detector = FER(mtcnn=False)
-    except Exception:
-        fallback_detector = None
 
-    # Store all detected emotions across all faces and photos
-    all_emotions: list[str] = []
-    total_faces = 0
+def warm_up_configured_models():
+    return warm_up_emotion_models(**emotion_analysis_options())
 
-    for photo in photos:
-        # Resolve image path from Photo model
-        try:
-            img_path = photo.image.path
-        except Exception:
-            continue
 
-        img = cv2.imread(img_path)
-        if img is None:
-            continue
+DETECTOR_STATS_FIELDS = ("runs", "accepted", "found", "latency_ms")
 
-        # Convert BGR (OpenCV) to RGB (expected by FER/MTCNN)
-        try:
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        except Exception:
-            img_rgb = img
-
-        # Resize very large images to speed up and help detection; upscale very small ones
-        try:
-            h, w = img_rgb.shape[:2]
-            max_side = max(h, w)
-            min_side = min(h, w)
-            # downscale overly large images
-            if max_side > 1280:
-                scale = 1280.0 / max_side
-                new_w, new_h = int(w * scale), int(h * scale)
-                img_rgb = cv2.resize(img_rgb, (new_w, new_h))
-            # upscale very small images to help detectors
-            elif min_side < 400:
-                scale = 400.0 / float(min_side)
-                new_w, new_h = int(w * scale), int(h * scale)
-                img_rgb = cv2.resize(img_rgb, (new_w, new_h))
-        except Exception:
-            pass
-
-        try:
-            results = detector.detect_emotions(img_rgb)  # list of faces with emotions
-        except Exception:
-            results = []
-
-        # Fallback: retry without MTCNN if nothing found
-        if not results and fallback_detector is not None:
-            try:
-                results = fallback_detector.detect_emotions(img_rgb)
-                print("fallback_without_mtcnn_faces", len(results))
-            except Exception:
-                pass
 
-        # Second fallback: Haar Cascade face detection + per-face emotion on crops
-        if not results:
+def _detector_stats_key(detector, field):
+    return f"emotion-detector:{detector}:{field}"
+
+
+def record_detector_stats(result):
+    """Add the per-stage timings of an analyze_photo_file result to the counters shared through the cache."""
+    for stage in (result or {}).get("stages", []):
+        counts = {
+            "runs": 1,
+            "accepted": int(stage["accepted"]),
+            "found": int(stage["faces"] > 0),
+            "latency_ms": round(stage["seconds"] * 1000),
+        }
+        for field, amount in counts.items():
+            if not amount:
+                continue
+            key = _detector_stats_key(stage["detector"], field)
             try:
-                face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-                gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
-                faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
-                print("haar_faces", len(faces))
-                crop_results = []
-                for (x, y, w, h) in faces:
-                    # pad a bit to include context
-                    pad = int(0.1 * max(w, h))
-                    x0 = max(0, x - pad)
-                    y0 = max(0, y - pad)
-                    x1 = min(img_rgb.shape[1], x + w + pad)
-                    y1 = min(img_rgb.shape[0], y + h + pad)
-                    face_crop = img_rgb[y0:y1, x0:x1]
-                    if face_crop.size == 0:
-                        continue
-                    # Use the best available FER (fallback without mtcnn preferred on crops)
-                    emotion = None
-                    score = 0.0
-                    try:
-                        if fallback_detector is not None:
-                            emotion, score = fallback_detector.top_emotion(face_crop)
-                        else:
-                            emotion, score = detector.top_emotion(face_crop)
-                    except Exception:
-                        pass
-                    if emotion:
-                        crop_results.append({"box": [int(x0), int(y0), int(x1 - x0), int(y1 - y0)], "emotions": {emotion: score}})
-                if crop_results:
-                    results = crop_results
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, amount)
             except Exception as e:
-                print("haar_fallback_error", e)
+                print("Detector stats unavailable:", e)
+                return
 
-        # Count faces in this image
-        total_faces += len(results)
-        print("detected_faces_count", len(results))
 
-        # Collect top emotion for each detected face
-        for face in results:
-            emotions = face.get("emotions", {})
-            if not emotions:
-                continue
-            top_emotion = max(emotions, key=emotions.get)
-            all_emotions.append(top_emotion)
+def detector_stats():
+    """
+    Per-detector counters: how often each cascade stage ran, found faces,
+    was accepted (ended the cascade), and its mean latency.
+    """
+    detectors = [stage["detector"] for stage in settings.EMOTION_DETECTOR_CASCADE]
+    keys = [_detector_stats_key(d, field) for d in detectors for field in DETECTOR_STATS_FIELDS]
+    try:
+        counters = cache.get_many(keys)
+    except Exception as e:
+        print("Detector stats unavailable:", e)
+        counters = {}
+    stats = {}
+    for detector in detectors:
+        values = {field: counters.get(_detector_stats_key(detector, field), 0) for field in DETECTOR_STATS_FIELDS}
+        runs = values["runs"]
+        stats[detector] = {
+            **values,
+            "accept_rate": round(values["accepted"] / runs, 4) if runs else None,
+            "found_rate": round(values["found"] / runs, 4) if runs else None,
+            "mean_latency_ms": round(values["latency_ms"] / runs, 1) if runs else None,
+        }
+    return stats
+
+
+def reset_detector_stats():
+    cache.delete_many([
+        _detector_stats_key(stage["detector"], field)
+        for stage in settings.EMOTION_DETECTOR_CASCADE for field in DETECTOR_STATS_FIELDS
+    ])
+
+
+def analyze_photo_path(path):
+    """analyze_photo_file with the configured cascade and backend, recording its stage stats."""
+    result = analyze_photo_file(path, **emotion_analysis_options())
+    record_detector_stats(result)
+    return result
+
+
+def _batches(paths, size):
+    return [paths[start:start + size] for start in range(0, len(paths), size)]
+
+
+def analyze_photo_files(paths):
+    """
+    analyze_photo_path for every path, in order, in batches of
+    EMOTION_ANALYSIS_BATCH_SIZE photos (one classifier call per detector stage
+    and batch with the lightweight backends). Parallelism comes from Celery:
+    tasks.analyze_candidate_photos spreads large sets over analyze_photos tasks.
+    """
+    options = emotion_analysis_options()
+    results = [
+        result
+        for batch in _batches(paths, settings.EMOTION_ANALYSIS_BATCH_SIZE)
+        for result in analyze_photo_batch(batch, **options)
+    ]
+    for result in results:
+        record_detector_stats(result)
+    return results
+
 
-    # Prepare the result structure
+def build_emotion_summary(total_photos, total_faces, emotion_counts):
+    """The Candidate.emotion_summary structure for the given face and emotion counts."""
     if total_faces == 0:
-        result_data = {
-            "total_photos": len(photos),
+        return {
+            "total_photos": total_photos,
             "total_faces": 0,
             "emotion_counts": {},
             "title_summary": {},
             "report_lines": ["No faces detected in the images."],
         }
-    else:
-        # Count each emotion across all faces
-        emotion_counts = Counter(all_emotions)
-
-        # Define 3 main titles mapping
-        main_titles = {
-            "Good": ["happy", "surprise"],               # Positive / focused
-            "Neutral": ["neutral"],                        # Calm / composed
-            "Bad": ["sad", "angry", "fear", "disgust"],   # Negative / distracted
-        }
 
-        # Prepare summary counts for the three buckets
-        title_summary = {}
-        for title, emotions in main_titles.items():
-            count = sum(emotion_counts.get(e, 0) for e in emotions)
-            title_summary[title] = count
-
-        # Generate human-readable report lines
-        total_expressions = sum(title_summary.values()) or 1
-        report_lines = []
-        for title, count in title_summary.items():
-            if count > 0:
-                percentage = round((count / total_expressions) * 100)
-                if title == "Good":
-                    comment = "Facial expressions showed strong focus and interest."
-                elif title == "Neutral":
-                    comment = "Facial expressions were calm and composed."
-                else:
-                    comment = "Facial expressions indicated distraction or stress."
-                report_lines.append(f"{title} ({percentage}%): {comment}")
-
-        result_data = {
-            "total_photos": len(photos),
-            "total_faces": total_faces,
-            "emotion_counts": dict(emotion_counts),
-            "title_summary": title_summary,
-            "report_lines": report_lines,
-        }
+    # Define 3 main titles mapping
+    main_titles = {
+        "Good": ["happy", "surprise"],               # Positive / focused
+        "Neutral": ["neutral"],                        # Calm / composed
+        "Bad": ["sad", "angry", "fear", "disgust"],   # Negative / distracted
+    }
+
+    # Prepare summary counts for the three buckets
+    title_summary = {}
+    for title, emotions in main_titles.items():
+        count = sum(emotion_counts.get(e, 0) for e in emotions)
+        title_summary[title] = count
+
+    # Generate human-readable report lines
+    total_expressions = sum(title_summary.values()) or 1
+    report_lines = []
+    for title, count in title_summary.items():
+        if count > 0:
+            percentage = round((count / total_expressions) * 100)
+            if title == "Good":
+                comment = "Facial expressions showed strong focus and interest."
+            elif title == "Neutral":
+                comment = "Facial expressions were calm and composed."
+            else:
+                comment = "Facial expressions indicated distraction or stress."
+            report_lines.append(f"{title} ({percentage}%): {comment}")
+
+    return {
+        "total_photos": total_photos,
+        "total_faces": total_faces,
+        "emotion_counts": dict(emotion_counts),
+        "title_summary": title_summary,
+        "report_lines": report_lines,
+    }
+
+
+def photo_phash(photo):
+    """The photo's perceptual hash, computed and stored now for photos uploaded without one."""
+    if not photo.phash:
+        path = _photo_path(photo)
+        photo.phash = image_dhash(path) if path else None
+        if photo.phash:
+            photo.save(update_fields=["phash"])
+    return photo.phash
+
+
+def _nearest_frame(frames, phash):
+    """The value of the first (hash, value) pair within PHOTO_DEDUPE_MAX_DISTANCE bits of `phash`."""
+    max_distance = settings.PHOTO_DEDUPE_MAX_DISTANCE
+    if not phash or max_distance < 0:
+        return None
+    bits = int(phash, 16)
+    for frame_hash, value in frames:
+        if (bits ^ frame_hash).bit_count() <= max_distance:
+            return value
+    return None
+
+
+def analyzed_frames(candidate_id):
+    """(hash, analysis) of the candidate's photos that went through FER, newest first, for _nearest_frame."""
+    analyses = (
+        PhotoAnalysis.objects.filter(candidate_id=candidate_id, status="Completed", reused_from__isnull=True)
+        .exclude(photo__phash__isnull=True)
+        .select_related("photo")
+        .order_by("-created_at")
+    )
+    return [(int(analysis.photo.phash, 16), analysis) for analysis in analyses]
+
+
+def find_similar_analysis(candidate_id, phash):
+    """An analyzed photo of the candidate that is a near-duplicate of `phash`, or None."""
+    if not phash or settings.PHOTO_DEDUPE_MAX_DISTANCE < 0:
+        return None
+    return _nearest_frame(analyzed_frames(candidate_id), phash)
+
+
+def reused_result(source):
+    return {"faces": source.face_count, "emotions": source.emotions, "detector": source.detector}
+
+
+def record_photo_analysis(analysis_id, result, reused_from=None):
+    """
+    Store one photo's analysis (an analyze_photo_file result, None for an
+    unreadable image) and add it to the candidate's running emotion_summary.
+    A near-duplicate frame passes the analysis it copied as `reused_from`; its
+    faces still count, so a long still stretch keeps its weight in the summary.
+    Both rows are locked, so concurrent photos of one candidate cannot lose
+    counts; returns False when the photo had already been recorded.
+    """
+    with transaction.atomic():
+        analysis = PhotoAnalysis.objects.select_for_update().get(id=analysis_id)
+        if analysis.status in FINISHED_ANALYSIS_STATUSES:
+            return False
+        candidate = Candidate.objects.select_for_update().only("id", "emotion_summary").get(id=analysis.candidate_id)
+
+        # A summary written before per-photo analysis existed is not a running total; start over
+        summary = {}
+        if PhotoAnalysis.objects.filter(candidate_id=candidate.id, status__in=FINISHED_ANALYSIS_STATUSES).exists():
+            summary = candidate.emotion_summary or {}
+        total_faces = summary.get("total_faces", 0)
+        emotion_counts = Counter(summary.get("emotion_counts") or {})
+
+        if result is None:
+            analysis.status = "Failed"
+            analysis.error = "Image could not be read"
+        else:
+            analysis.status = "Completed"
+            analysis.face_count = result["faces"]
+            analysis.emotions = result["emotions"]
+            analysis.detector = result["detector"]
+            analysis.reused_from_id = reused_from
+            total_faces += result["faces"]
+            emotion_counts.update(result["emotions"])
+        analysis.save()
+
+        candidate.emotion_summary = build_emotion_summary(summary.get("total_photos", 0) + 1, total_faces, emotion_counts)
+        candidate.save(update_fields=["emotion_summary"])
+    return True
+
+
+def _photo_path(photo):
+    try:
+        return photo.image.path
+    except Exception:
+        return None
+
+
+def candidate_photos(hr_obj):
+    photos_qs = getattr(hr_obj, "photos", None)
+    if not photos_qs:
+        return []
+    return list(photos_qs.all())
+
+
+def plan_photo_analysis(hr_obj, photos):
+    """
+    Sort the candidate's photos that have no finished analysis yet. Returns
+    (ids of the analyses to run FER for, [(analysis id, id of the analysis
+    it copies)] for near-duplicate frames). Missing analysis rows are
+    created and photos without a readable file are recorded as failed.
+    """
+    analyses = {analysis.photo_id: analysis for analysis in PhotoAnalysis.objects.filter(candidate=hr_obj)}
+    pending = []
+    for photo in photos:
+        analysis = analyses.get(photo.id) or PhotoAnalysis.objects.create(photo=photo, candidate=hr_obj)
+        if analysis.status not in FINISHED_ANALYSIS_STATUSES:
+            pending.append((analysis, photo))
+
+    # Only frames that differ from every analyzed frame go through FER; the rest
+    # copy the result of their near-duplicate, which may itself be in this batch
+    frames = analyzed_frames(hr_obj.id)
+    to_analyze = []
+    duplicates = []
+    for analysis, photo in pending:
+        if not _photo_path(photo):
+            record_photo_analysis(analysis.id, None)
+            continue
+        phash = photo_phash(photo)
+        source = _nearest_frame(frames, phash)
+        if source is not None:
+            duplicates.append((str(analysis.id), str(source.id)))
+            continue
+        to_analyze.append(str(analysis.id))
+        if phash:
+            frames.append((int(phash, 16), analysis))
+    return to_analyze, duplicates
+
+
+def analyze_pending_photos(analysis_ids):
+    """Run FER for the given photo analyses that are still unfinished and record their results."""
+    to_analyze = []
+    for analysis in PhotoAnalysis.objects.filter(id__in=analysis_ids).select_related("photo"):
+        if analysis.status in FINISHED_ANALYSIS_STATUSES:
+            continue
+        path = _photo_path(analysis.photo)
+        if path:
+            to_analyze.append((analysis, path))
+        else:
+            record_photo_analysis(analysis.id, None)
+    for (analysis, _), result in zip(to_analyze, analyze_photo_files([path for _, path in to_analyze])):
+        record_photo_analysis(analysis.id, result)
+
+
+def record_duplicate_analyses(duplicates):
+    """Record near-duplicate frames once the frames they copy (plan_photo_analysis) have been analyzed."""
+    sources = {
+        str(source.id): source
+        for source in PhotoAnalysis.objects.filter(id__in=[source_id for _, source_id in duplicates])
+    }
+    for analysis_id, source_id in duplicates:
+        source = sources.get(str(source_id))
+        if source is not None and source.status == "Completed":
+            record_photo_analysis(analysis_id, reused_result(source), reused_from=source.id)
+        else:
+            # Near-duplicate of a frame that turned out unreadable; analyze it on its own
+            analysis = PhotoAnalysis.objects.select_related("photo").get(id=analysis_id)
+            record_photo_analysis(analysis_id, analyze_photo_path(_photo_path(analysis.photo)))
+
+
+def current_emotion_summary(hr_obj):
+    hr_obj.refresh_from_db(fields=["emotion_summary"])
+    result_data = hr_obj.emotion_summary
+    if result_data and result_data.get("total_faces"):
         print("result_data", result_data)
-    # Save to model and return
-    hr_obj.emotion_summary = result_data
-    hr_obj.save(update_fields=["emotion_summary"])
-    return result_data
\ No newline at end of file
+    return result_data
+
+
+def analyze_facial_expressions(hr_obj):
+    """
+    Bring `Candidate.emotion_summary` up to date and return it. Photos are
+    normally analyzed one by one as they are uploaded (tasks.analyze_photo);
+    this only analyzes the ones that were not, for example uploads from
+    before per-photo analysis or whose task was lost, serially in this
+    process (tasks.analyze_candidate_photos fans large sets out instead).
+    Every detected face counts, for example:
+    {
+        "total_photos": 3,
+        "total_faces": 5,
+        "emotion_counts": {"happy": 2, "neutral": 2, "angry": 1},
+        "title_summary": {"Good": 2, "Neutral": 2, "Bad": 1},
+        "report_lines": ["Good (40%): Facial expressions showed strong focus and interest.", ...]
+    }
+    """
+    # Verify dependencies
+    if not emotion_analysis_available():
+        print("FER/OpenCV not available. Please install 'fer', 'opencv-python', and 'mtcnn'.")
+        return None
+
+    photos = candidate_photos(hr_obj)
+    if not photos:
+        return None
+
+    to_analyze, duplicates = plan_photo_analysis(hr_obj, photos)
+    analyze_pending_photos(to_analyze)
+    record_duplicate_analyses(duplicates)
+    return current_emotion_summary(hr_obj)
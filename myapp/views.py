@@ -1,45 +1,63 @@
-import random
 import re
 import json
-import time
-import tempfile
-import os
-import docx
+from functools import partial
 
-from .models import Question, Requirement, QuestionAnswer, User, Candidate
+from asgiref.sync import sync_to_async
+
+from .models import Question, Requirement, QuestionAnswer, User, Candidate, ResumeIngestJob, ResumeIngestItem
 from .serializers import (AnswerSerializer, 
                           QuestionSerializer, 
                           HrSerializer, 
+                          CandidateListSerializer,
                           PhotoSerializer, 
                           RequirementSerializer, 
+                          RequirementListSerializer,
                           PublicCandidateSerializer, 
                           RegisterSerializer, 
                           LoginSerializer,
-                          ChatAiSerializer
+                          ChatAiSerializer,
+                          ResumeIngestJobSerializer,
+                          CANDIDATE_SUMMARY_FIELDS,
+                          CANDIDATE_EXPANDABLE_FIELDS,
+                          REQUIREMENT_SUMMARY_FIELDS,
+                          REQUIREMENT_EXPANDABLE_FIELDS,
                         )          
-from .utils import analyze_facial_expressions
-from .tasks import rate_answer
+from . import chat, llm
+from .documents import UnsupportedDocumentError, extract_document_text, file_extension
+from .face_analysis import image_dhash
+from .mail import queue_email
+from .pagination import CandidateCursorPagination
+from .prompts import (REQUIREMENT_FIELDS, jd_analysis_prompt, jd_field_extraction_prompt, jd_fields_from_request,
+                      jd_generation_prompt, merge_missing_fields, parse_json_response, requirement_extraction_prompt,
+                      short_technology)
+from .question_bank import assign_pool_questions, import_questions, question_pool_is_current, sample_questions
+from .streaming import sse_response, wants_stream
+from .resumes import ResumeError, create_candidates, ensure_email_available, extract_many_resume_fields, read_resume_text
+from .tasks import (process_resume_ingest_item, queue_photo_analysis, queue_question_pool, rate_answer,
+                    start_candidate_evaluation)
 
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from openai import OpenAI
-from PyPDF2 import PdfReader
 from django.conf import settings
-from django.core.mail import send_mail
 from django.core.exceptions import ValidationError
-from io import BytesIO
-import google.generativeai as genai
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.contrib.auth import authenticate, login as auth_login
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
 
-client = OpenAI(
-                base_url=settings.OPENROUTER_BASE_URL,
-                api_key=settings.OPENROUTER_API_KEY,
-            )
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+def _csv_query_param(request, name):
+    """Split a comma-separated query parameter such as ?fields=name,email into a list."""
+    raw = request.query_params.get(name, '')
+    return [part.strip() for part in raw.split(',') if part.strip()]
+
+
+def _unknown_fields(fields, model):
+    """Return the names in `fields` that are not concrete columns of `model`."""
+    concrete = {f.name for f in model._meta.concrete_fields}
+    return [f for f in fields if f not in concrete]
 
 
 class RegisterView(APIView):
@@ -127,35 +145,66 @@ class QuestionListAPIView(APIView):
                 serializer = QuestionSerializer(question, many=True)
                 return Response(serializer.data)
             else:
-                questions = list(Question.objects.all().exclude(candidate=candidate))
-                if not questions:
+                # Requirement pool rows are reserved for quick interviews
+                questions = Question.objects.exclude(candidate=candidate).filter(requirement__isnull=True)
+                technology = request.query_params.get('technology')
+                difficulty_level = request.query_params.get('difficulty_level')
+                if technology:
+                    questions = questions.filter(technology=technology)
+                if difficulty_level:
+                    questions = questions.filter(difficulty_level=difficulty_level)
+
+                random_questions = sample_questions(questions, 10)
+                if not random_questions:
                     return Response({"message": "No questions available."}, status=404)
-                random_questions = random.sample(questions, min(len(questions), 10))
 
                 serializer = QuestionSerializer(random_questions, many=True)
                 return Response(serializer.data)
         return Response({"error": "Candidate not found."}, status=status.HTTP_404_NOT_FOUND)
 
+    @staticmethod
+    def _extract_questions(file):
+        """Split an uploaded .txt/.pdf question bank into question texts, or return None if unsupported."""
+        try:
+            text = extract_document_text(file, ('txt', 'pdf'))
+        except UnsupportedDocumentError:
+            return None
+        if file_extension(file) == 'txt':
+            return [q.strip() for q in text.split('\n') if q.strip()]
+        questions = re.split(r'\n\s*\d+[\).]|\n*Q\d+[\).]?', text)
+        return [q.strip() for q in questions if len(q.strip()) > 5]
+
     def post(self, request):
         file = request.FILES.get('file')
-        
+        bulk = str(request.data.get('bulk', '')).lower() in ('1', 'true', 'yes')
+
+        if file and bulk:
+            # Bulk import: validate in memory, dedupe by content hash, insert in batches
+            files_questions = []
+            try:
+                for upload in request.FILES.getlist('file'):
+                    questions = self._extract_questions(upload)
+                    if questions is None:
+                        return Response({"error": f"Unsupported file type: {upload.name}. Please upload .txt or .pdf"}, status=status.HTTP_400_BAD_REQUEST)
+                    files_questions.append((upload.name, questions))
+            except Exception as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            extra_data = {key: request.data.get(key) for key in ('technology', 'difficulty_level') if request.data.get(key)}
+            report = import_questions(files_questions, extra_data=extra_data)
+            return Response(
+                {
+                    "files": report,
+                    "inserted": sum(item["inserted"] for item in report),
+                    "skipped": sum(item["skipped"] for item in report),
+                },
+                status=status.HTTP_201_CREATED,
+            )
+
         if file:
             try:
-                filename = file.name.lower()
-                questions = []
-
-                if filename.endswith('.txt'):
-                    file_content = file.read().decode('utf-8', errors='ignore')
-                    questions = [q.strip() for q in file_content.split('\n') if q.strip()]
-
-                elif filename.endswith('.pdf'):
-                    pdf_reader = PdfReader(file)
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-                    questions = re.split(r'\n\s*\d+[\).]|\n*Q\d+[\).]?', text)
-                    questions = [q.strip() for q in questions if len(q.strip()) > 5]
-                else:
+                questions = self._extract_questions(file)
+                if questions is None:
                     return Response({"error": "Unsupported file type. Please upload .txt or .pdf"}, status=status.HTTP_400_BAD_REQUEST)
 
                 saved_questions = []
@@ -167,7 +216,11 @@ class QuestionListAPIView(APIView):
 
                     serializer = QuestionSerializer(data=question_data)
                     if serializer.is_valid():
-                        serializer.save()
+                        try:
+                            with transaction.atomic():
+                                serializer.save()
+                        except IntegrityError:
+                            continue  # already in the bank
                         saved_questions.append(serializer.data)
 
                 if not saved_questions:
@@ -180,7 +233,11 @@ class QuestionListAPIView(APIView):
         
         serializer = QuestionSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            try:
+                with transaction.atomic():
+                    serializer.save()
+            except IntegrityError:
+                return Response({"error": "This question is already in the question bank."}, status=status.HTTP_400_BAD_REQUEST)
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
@@ -224,8 +281,38 @@ class CandidateView(APIView):
             serializer = PublicCandidateSerializer(hr_objects)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            hr_objects = Candidate.objects.all().order_by('-created_at')
-            serializer = HrSerializer(hr_objects, many=True)
+            fields = _csv_query_param(request, 'fields')
+            expand = _csv_query_param(request, 'expand')
+            if fields or expand:
+                # Projected listing: only the requested columns are read from the database
+                unknown = _unknown_fields(fields, Candidate) + [e for e in expand if e not in CANDIDATE_EXPANDABLE_FIELDS]
+                if unknown:
+                    return Response({"error": f"Unknown fields: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+                fields = fields or CANDIDATE_SUMMARY_FIELDS
+                hr_objects = Candidate.objects.only(*fields, 'created_at')
+                if 'answers' in expand:
+                    hr_objects = hr_objects.prefetch_related(
+                        Prefetch('answers', queryset=QuestionAnswer.objects.select_related('question'))
+                    )
+                if 'photos' in expand:
+                    hr_objects = hr_objects.prefetch_related('photos')
+                serializer_class = partial(CandidateListSerializer, fields=fields + expand)
+            else:
+                hr_objects = Candidate.objects.prefetch_related(
+                    Prefetch('answers', queryset=QuestionAnswer.objects.select_related('question')),
+                    'photos',
+                )
+                serializer_class = HrSerializer
+            hr_objects = hr_objects.order_by('-created_at')
+
+            # Cursor-paginated listing when the client asks for a page
+            if 'cursor' in request.query_params or 'page_size' in request.query_params:
+                paginator = CandidateCursorPagination()
+                page = paginator.paginate_queryset(hr_objects, request, view=self)
+                serializer = serializer_class(page, many=True)
+                return paginator.get_paginated_response(serializer.data)
+
+            serializer = serializer_class(hr_objects, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -233,196 +320,35 @@ class CandidateView(APIView):
         if not files:
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-        created_records = []
+        if str(request.data.get('async', '')).lower() in ('1', 'true', 'yes'):
+            # Save the files and let Celery workers parse them; the client polls the job
+            job = ResumeIngestJob.objects.create(total_files=len(files), created_by=request.user)
+            items = [
+                ResumeIngestItem.objects.create(job=job, file=file, file_name=file.name[:255])
+                for file in files
+            ]
+            for item in items:
+                transaction.on_commit(partial(process_resume_ingest_item.delay, str(item.id)))
+            serializer = ResumeIngestJobSerializer(job)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
-        for file in files:
-            text = ""
-            try:
-                filename = file.name.lower()
-                if filename.endswith('.pdf'):
-                    reader = PdfReader(file)
-                    for page in reader.pages:
-                        text += page.extract_text() + "\n"
-                elif filename.endswith('.docx'):
-                    document = docx.Document(file)
-                    for para in document.paragraphs:
-                        if para.text.strip():
-                            text += para.text + "\n"
-                else:
-                    return Response({"error": "Unsupported file type. Please upload .pdf or .docx"}, status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
-                return Response({"error": f"Failed to read resume: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
-
-            if not text.strip():
-                return Response({"error": "Could not extract any readable text from the uploaded document."}, status=status.HTTP_400_BAD_REQUEST)
-
-            prompt = f"""
-                    Extract the following fields from this resume text: 
-                    - name
-                    - email
-                    - phone
-                    - technology (take only one main technology)
-                    - experience (total experience)
-                    - companies (array of objects with company_name, start_date, end_date)
-                    
-                    Date Requirements:
-                    - Convert ALL dates to YYYY-MM format (e.g., 2024-07, 2025-03)
-                    - If only year is available, use YYYY format (e.g., 2024)
-                    - If date is unclear, use null
-                    - Handle various formats: "July 2024", "12/03/2022", "2022-2024", etc.
-                    - IMPORTANT: If candidate is currently working at company (end date shows "present", "current", "till date", "ongoing", etc.), set end_date = "running"
-                    
-                    Return only valid JSON (no explanations, no ```json blocks) with this format:
-                    {{
-                        "name": "John Doe",
-                        "email": "john@example.com",
-                        "phone": "+1234567890",
-                        "technology": "React",
-                        "experience": "2 years 3 months",
-                        "companies": [
-                            {{
-                                "company_name": "Tech Corp",
-                                "start_date": "2022-01",
-                                "end_date": "2024-03"
-                            }},
-                            {{
-                                "company_name": "Current Company Inc",
-                                "start_date": "2024-04",
-                                "end_date": "running"
-                            }}
-                        ]
-                    }}
-                    
-                    Resume text:
-                    {text}
-                """
-            print(prompt)
-
-            # Try LLM with simple retries
-            result_text = None
-            last_error = None
-            for attempt in range(3):
-                try:
-                    # Create the model instance
-                    model = genai.GenerativeModel("models/gemini-2.5-flash")
-                    # Generate content
-                    response = model.generate_content(
-                        prompt,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.1,
-                            response_mime_type="application/json",  # or "text/plain" if you want plain text
-                        ),
-                    )
-                    # Extract text safely
-                    result_text = getattr(response, "text", None)
-                    print("===================")
-                    # print(result_text)
-                    if result_text:
-                        result_text = result_text.strip()
-                    break  # exit loop on success
-
-                except Exception as e:
-                    last_error = str(e)
-                    # If it's a quota error, don't retry
-                    if "429" in last_error or "quota" in last_error.lower():
-                        break
-                    print(f"Attempt {attempt+1} failed: {e}")
-                    time.sleep(1.0)  # backoff before retrying
-
-            data = None
-            if result_text:
-                try:
-                    clean_text = re.sub(r"```json|```", "", result_text).strip()
-                    print(clean_text)
-                    data = json.loads(clean_text)
-                except Exception as e:
-                    # fall back to heuristic parsing if LLM output is malformed
-                    last_error = e
-
-            fallback_used = False
-            if not data:
-                fallback_used = True
-                lowered = text.lower()
-                email_match = re.search(r"[\w\.-]+@[\w\.-]+\.[a-zA-Z]{2,}", text)
-                phone_match = re.search(r"(\+?\d[\d\s\-\(\)]{7,}\d)", text)
-                first_line = next((ln.strip() for ln in text.splitlines() if ln and len(ln.strip()) > 1), "")
-                tech_map = ["python", ".net", "java", "react"]
-                tech = next((t for t in tech_map if t in lowered), "")
-                
-                # Extract companies using regex in fallback
-                companies = []
-                # Look for company names patterns
-                company_patterns = [
-                    r"(?:worked at|employed by|experience at|company|private|limited|ltd|inc|corp|technologies|solutions|systems|services)\s+([A-Za-z0-9\s&]+?)(?:\n|,|\.|\s+from|\s+since|\s+to|\s+till|\s+-|\s*\(|\s*[0-9]{4})",
-                    r"([A-Za-z0-9\s&]+?(?:technologies|solutions|systems|services|limited|ltd|inc|corp))\s*(?:\n|,|\.|\s+from|\s+since|\s+to|\s+till|\s+-|\s*\(|\s*[0-9]{4})",
-                    r"^\s*([A-Za-z0-9\s&]{2,50})\s*\n.*?(?:[0-9]{4}|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)"
-                ]
-                
-                for pattern in company_patterns:
-                    matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
-                    for match in matches:
-                        company_name = match.strip() if isinstance(match, str) else match[0].strip() if match else ""
-                        if len(company_name) > 2 and len(company_name) < 100:
-                            # Avoid duplicates
-                            if not any(comp.get("company_name", "").lower() == company_name.lower() for comp in companies):
-                                companies.append({
-                                    "company_name": company_name,
-                                    "start_date": None,
-                                    "end_date": None
-                                })
-                
-                # Limit to first 5 companies to avoid too much data
-                companies = companies[:5]
-                
-                data = {
-                    "name": first_line[:100],
-                    "email": email_match.group(0) if email_match else "",
-                    "phone": phone_match.group(0) if phone_match else "",
-                    "technology": tech,
-                    "companies": companies,
-                }
-                if not any([data.get("name"), data.get("email"), data.get("phone"), data.get("technology")]):
-                    # If even fallback got nothing useful, respond gracefully with 503 if provider failed, else 422
-                    status_code = status.HTTP_503_SERVICE_UNAVAILABLE if last_error else status.HTTP_422_UNPROCESSABLE_ENTITY
-                    return Response(
-                        {
-                            "error": "Could not extract fields from resume.",
-                            "details": str(last_error) if last_error else "",
-                        },
-                        status=status_code,
-                    )
-            email = data.get("email")
-            if email and Candidate.objects.filter(email=email).exists():
-                return Response(
-                    {
-                        "error": "Email already exists.",
-                        "details": "Email already exists.",
-                    },
-                    status=400,
-                )
+        try:
+            texts = [read_resume_text(file) for file in files]
+        except ResumeError as e:
+            return Response(e.as_response_data(), status=e.status_code)
 
-            # Store raw extracted document text in base_text
-            llm_response = data if not fallback_used else {"fallback": True, "data": data}
-            
-            # Debug logging
-            print(f"Extracted companies: {data.get('companies', [])}")
-            print(f"Number of companies: {len(data.get('companies', []))}")
-            
-            hr_obj = Candidate.objects.create(
-                upload_doc=file,
-                name=data.get("name", ""),
-                email=data.get("email", ""),
-                phone=data.get("phone", ""),
-                experience=data.get("experience", ""),
-                technology=data.get("technology", ""),
-                company=data.get("companies", []),
-                base_text=text,  # Store raw document text instead of LLM response
-            )
-            frontend_base = "http://localhost:5173"
-            hr_obj.shine_link = f"{frontend_base}/{hr_obj.id}/"
-            hr_obj.save(update_fields=['shine_link'])
-            created_records.append(hr_obj)
+        # LLM extraction fans out across a bounded pool; rows are written afterwards in one transaction
+        results = extract_many_resume_fields(texts)
+        seen_emails = set()
+        try:
+            for data in results:
+                if isinstance(data, ResumeError):
+                    raise data
+                ensure_email_available(data, seen_emails)
+        except ResumeError as e:
+            return Response(e.as_response_data(), status=e.status_code)
 
+        created_records = create_candidates(list(zip(files, texts, results)))
 
         serializer = HrSerializer(created_records, many=True)
         return Response({"records": serializer.data}, status=status.HTTP_201_CREATED)
@@ -463,129 +389,25 @@ class CandidateView(APIView):
                 )
 
                 if hr_obj.email:
-                    try:
-                        send_mail(
-                            subject=subject,
-                            message=message,
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[hr_obj.email],
-                            fail_silently=False,
-                        )
-                    except Exception as e:
-                        print(f"Email sending failed: {e}")
+                    # Sent in the background by the email outbox (myapp/mail.py)
+                    queue_email(subject, message, [hr_obj.email])
 
                 return Response(serializer.data, status=status.HTTP_200_OK)
+            evaluate = False
             if interview_status == "Completed":
-                print("hr_obj:", hr_obj)
-                print("hr_obj.id:", hr_obj.id)
-                answers = list(
-                    QuestionAnswer.objects.filter(candidate_id=hr_obj.id)
-                    .values_list("answer_text", flat=True)
-                )
-                print("Answer------=-", answers)
-                if not answers:
+                if not QuestionAnswer.objects.filter(candidate_id=hr_obj.id).exists():
                     return Response({"message": "No answers found"}, status=200)
-
-                prompt = (
-                    "Evaluate the candidate's communication skills based on the provided answers.\n"
-                    "Return ONLY a valid JSON object named communication_point containing:\n"
-                    "- Grammar: integer score (0-10)\n"
-                    "- ProfessionalLanguage: integer score (0-10)\n"
-                    "- OverallGrammarExplanation: short paragraph explaining the grammar score.\n"
-                    "- OverallProfessionalLanguageExplanation: short paragraph explaining the professional language score.\n"
-                    "- OverallLanguageUsed: describe which language(s) the candidate used (e.g., English, Hindi, mixed).\n\n"
-                    "Example format:\n"
-                    "{\n"
-                    '  "communication_point": {\n'
-                    '    "Grammar": 8,\n'
-                    '    "ProfessionalLanguage": 7,\n'
-                    '    "OverallGrammarExplanation": "Grammar was mostly correct, with few minor sentence structure issues.",\n'
-                    '    "OverallProfessionalLanguageExplanation": "The candidate used formal language but with occasional informal phrases.",\n'
-                    '    "OverallLanguageUsed": "English"\n'
-                    "  }\n"
-                    "}\n\n"
-                    f"Answers: {json.dumps(answers)}"
-                )
-
-                try:
-                    model = genai.GenerativeModel("models/gemini-2.5-flash-lite")
-
-                    # Generate JSON response
-                    response = model.generate_content(
-                        prompt,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.1,
-                            response_mime_type="application/json",
-                        ),
-                    )
-                    result_text = response.text.strip()
-                except Exception as e:
-                    print("error", e)
-                    result_text = None
-
-                print("Result Text", result_text)
-                if not result_text:
-                    return Response({"error": "Failed to generate communication evaluation"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-                result_json = json.loads(result_text)
-                if "communication_point" in result_json:
-                    result_json = result_json["communication_point"]
-                    hr_obj.communication = result_json
-                    hr_obj.save(update_fields=["communication"])
-                
-                facial = analyze_facial_expressions(hr_obj)
-
-            if interview_quick and str(hr_obj.requirement) != str(requirement):
-                try:
-                    prompt = f"""
-                    You are an expert technical interviewer.
-
-                    Generate 10 short, clear, challenging interview questions based on:
-
-                    ### Requirement / Job Description
-                    {requirement.base_text}
-
-                    ### Candidate Information
-                    Name: {hr_obj.name}
-                    Email: {hr_obj.email}
-                    Experience: {hr_obj.experience} years
-                    Technology: {hr_obj.technology}
-
-                    ### Rules:
-                    - Focus questions on required technologies, tools, frameworks & experience level
-                    - Include mix of theoretical + practical scenario questions
-                    - Make questions specific, not generic
-                    - Avoid yes/no questions
-                    - Do NOT repeat similar questions
-                    - Keep each question under 20 words
-
-                    ### Output JSON Format ONLY:
-                    {{
-                    "questions": [
-                        "Question 1 tell me about yourself",
-                        "Question 2",
-                        ...
-                        "Question 10"
-                    ]
-                    }}
-                    """
-                    model = genai.GenerativeModel("models/gemini-2.5-flash-lite")
-                    response = model.generate_content(
-                        prompt,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.1,
-                            response_mime_type="application/json",
-                        ),
-                    )
-
-                    result = json.loads(response.text)
-                    questions = result.get("questions", [])
-
-                    question_objs = [Question(candidate=hr_obj, text=q) for q in questions ]
-
-                    Question.objects.bulk_create(question_objs)
-                except Exception as e:
-                    print(f"Failed to generate questions: {e}")
+                # Communication scoring and facial analysis run in Celery; poll evaluation_progress
+                evaluate = True
+
+            if interview_quick and requirement and str(hr_obj.requirement) != str(requirement):
+                # Copy questions from the requirement's pregenerated pool; no LLM call here
+                if not assign_pool_questions(requirement, hr_obj, settings.QUICK_INTERVIEW_QUESTION_COUNT):
+                    # Saved first: a pool generation already in flight finds waiting candidates by requirement
+                    hr_obj.requirement = requirement
+                    hr_obj.is_quick = True
+                    hr_obj.save(update_fields=["requirement", "is_quick", "updated_at"])
+                    queue_question_pool(requirement, candidate_ids=[str(hr_obj.id)])
             if is_selected == True or is_selected == False:
                 hr_obj.save(update_fields=["is_selected"])
                 serializer.save()
@@ -608,24 +430,32 @@ class CandidateView(APIView):
                         f"HR Team."
                     )
                 if hr_obj.email:
-                    try:
-                        send_mail(
-                            subject=subject,
-                            message=message,
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[hr_obj.email],
-                            fail_silently=False,
-                        )
-                    except Exception as e:
-                        print(f"Email sending failed: {e}")
+                    # Sent in the background by the email outbox (myapp/mail.py)
+                    queue_email(subject, message, [hr_obj.email])
 
+                if evaluate:
+                    start_candidate_evaluation(hr_obj)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             serializer.save()
+            if evaluate:
+                start_candidate_evaluation(hr_obj)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ResumeIngestJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            job = ResumeIngestJob.objects.prefetch_related('items').get(pk=pk)
+        except ResumeIngestJob.DoesNotExist:
+            return Response({"error": "Ingest job not found"}, status=status.HTTP_404_NOT_FOUND)
+        serializer = ResumeIngestJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class PhotoView(APIView):
     def get(self, request, pk):
         try:
@@ -642,8 +472,10 @@ class PhotoView(APIView):
             return Response({"error": "Candidate not found"}, status=status.HTTP_404_NOT_FOUND)
         serializer = PhotoSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(phash=image_dhash(serializer.validated_data['image']))
             hr_obj.photos.add(serializer.instance)
+            # Analyzed now rather than all at once when the interview completes
+            queue_photo_analysis(serializer.instance, hr_obj)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -651,6 +483,21 @@ class PhotoView(APIView):
 class RequirementView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
+        fields = _csv_query_param(request, 'fields')
+        expand = _csv_query_param(request, 'expand')
+        if fields or expand:
+            unknown = _unknown_fields(fields, Requirement) + [e for e in expand if e not in REQUIREMENT_EXPANDABLE_FIELDS]
+            if unknown:
+                return Response({"error": f"Unknown fields: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+            fields = fields or REQUIREMENT_SUMMARY_FIELDS
+            requirement_objects = Requirement.objects.only(*fields, 'created_at').order_by('-created_at')
+            if 'candidates' in expand:
+                requirement_objects = requirement_objects.prefetch_related(
+                    Prefetch('candidates', queryset=Candidate.objects.only(*CANDIDATE_SUMMARY_FIELDS))
+                )
+            serializer = RequirementListSerializer(requirement_objects, many=True, fields=fields + expand)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
         requirement_objects = Requirement.objects.all().order_by('-created_at')
         serializer = RequirementSerializer(requirement_objects, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -661,96 +508,27 @@ class RequirementView(APIView):
             return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
             
         try:
-            file_data = file.read()
-            filename = file.name
-            file_extension = filename.split('.')[-1].lower()
-
-            text = ""
-
-            # Handle DOCX files
-            if file_extension == 'docx':
-                docx_file = BytesIO(file_data)
-                doc = docx.Document(docx_file)
-                for para in doc.paragraphs:
-                    if para.text.strip():
-                        text += para.text + "\n"
-
-            # Handle DOC files (requires textract)
-            elif file_extension == 'doc':
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.doc') as temp_file:
-                    temp_file.write(file_data)
-                    temp_file_path = temp_file.name
-
-                try:
-                    text = textract.process(temp_file_path).decode('utf-8')
-                finally:
-                    if os.path.exists(temp_file_path):
-                        os.unlink(temp_file_path)
-            # Handle PDF files
-            elif file_extension == 'pdf':
-                try:
-                    pdf_reader = PdfReader(BytesIO(file_data))
-                    for page in pdf_reader.pages:
-                        extracted = page.extract_text()
-                        if extracted:
-                            text += extracted + "\n"
-                except Exception as e:
-                    return Response({"error": f"Failed to read PDF: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                return Response({"error": "Unsupported file type. Please upload .docx, .doc, or .pdf"}, status=status.HTTP_400_BAD_REQUEST)
-            if not text.strip():
-                return Response({"error": "Could not extract any text from the uploaded file"}, 
-                             status=status.HTTP_400_BAD_REQUEST)
-
-            # Prepare the prompt for OpenAI
-            prompt = """
-            Extract the following fields from the given job requirement text:
-            - name: Job title/requirement name
-            - experience: Required experience (e.g., "2-5 years")
-            - technology: Main technology/stack required (e.g., "Python", "React")
-            - No_of_openings: Number of open positions (extract as integer)
-            - notice_period: Notice period in days (extract as integer)
-            - priority: Boolean indicating if this is a high priority requirement (true/false)
-
-            Return only a valid JSON object with these fields. If a field cannot be determined, use null.
-            Example output:
-            {
-                "name": "Senior Python Developer",
-                "experience": "2-5 years",
-                "technology": "Python",
-                "No_of_openings": 3,    
-                "notice_period": 30,
-                "priority": true
-            }
+            text = extract_document_text(file, ('docx', 'doc', 'pdf'))
+        except UnsupportedDocumentError:
+            return Response({"error": "Unsupported file type. Please upload .docx, .doc, or .pdf"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": f"Failed to read document: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not text.strip():
+            return Response({"error": "Could not extract any text from the uploaded file"}, 
+                         status=status.HTTP_400_BAD_REQUEST)
 
-            Here is the requirement text to analyze:
-            """ + text
-
-            # Call OpenAI API
-            model = genai.GenerativeModel("models/gemini-2.5-flash")
-            # Generate JSON response
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.1,
-                    response_mime_type="application/json",
-                ),
-            )
-            result_text = response.text.strip()
-            
-            # Parse the response
-            clean_text = re.sub(r'```json|```', '', result_text).strip()
-            data = json.loads(clean_text)
+        try:
+            prompt = requirement_extraction_prompt(text)
+            result_text = llm.generate(prompt, response_mime_type="application/json", cache=True)
+            data = parse_json_response(result_text)
 
-            if not any([data.get("name"), data.get("experience"), data.get("technology"), data.get("No_of_openings"), data.get("notice_period"), data.get("priority")]):
-                # If even fallback got nothing useful, respond gracefully with 503 if provider failed, else 422
-                status_code = status.HTTP_503_SERVICE_UNAVAILABLE if last_error else status.HTTP_422_UNPROCESSABLE_ENTITY
+            if not any(data.get(key) for key in REQUIREMENT_FIELDS):
                 return Response(
                     {
                         "error": "Could not extract fields from Document.",
-                        "details": str(last_error) if last_error else "",
+                        "details": "",
                     },
-                    status=status_code,
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 )
             
             # Create the requirement with extracted data
@@ -764,7 +542,8 @@ class RequirementView(APIView):
                 notice_period=data.get('notice_period'),
                 priority=bool(data.get('priority', False))
             )
-            
+            queue_question_pool(requirement)
+
             serializer = RequirementSerializer(requirement)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
@@ -773,6 +552,11 @@ class RequirementView(APIView):
                 {"error": f"Failed to parse AI response: {str(e)}", "raw_response": result_text},
                 status=status.HTTP_422_UNPROCESSABLE_ENTITY
             )
+        except llm.LLMError as e:
+            return Response(
+                {"error": f"Failed to process requirement: {str(e)}"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
             return Response(
                 {"error": f"Failed to process requirement: {str(e)}"},
@@ -792,6 +576,8 @@ class RequirementView(APIView):
 
         if serializer.is_valid():
             serializer.save()
+            if not question_pool_is_current(requirement):
+                queue_question_pool(requirement)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -822,58 +608,12 @@ class JDAssistantView(APIView):
         if not message:
             return Response({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        prompt = f"""
-        Analyze this job description request and extract structured information.
-        
-        Required fields to extract:
-        - name (Job title/position name)  -- this is OPTIONAL, you may infer it from technology/experience
-        - experience (Required experience in years or range)
-        - technology (Primary technology stack)
-        - No_of_openings (Number of positions, integer)
-        - notice_period (Notice period in days, integer)
-        - priority (Boolean: true if urgent/high priority)
-        
-        User message: "{message}"
-        
-        Return only valid JSON with this format:
-        {{
-            "status": "ready" or "need_more_info",
-            "fields": {{
-                "name": "extracted JD name or null",
-                "experience": "extracted value or null", 
-                "technology": "extracted value or null",
-                "No_of_openings": extracted_integer_or_null,
-                "notice_period": extracted_integer_or_null,
-                "priority": true_or_false_or_null
-            }},
-            "missing_fields": ["list", "of", "missing", "field", "names"]
-        }}
-        
-        Rules:
-        - REQUIRED fields are only: experience and technology
-        - The JD name (field "name") is OPTIONAL. If possible, infer a good JD name, otherwise leave it null.
-        - Set status to "ready" only if experience AND technology are provided
-        - Set status to "need_more_info" if either experience or technology is missing
-        - For No_of_openings, notice_period: extract numbers or set null
-        - For priority: detect words like "urgent", "immediate", "high priority" as true
-        - Include ONLY the actually missing required fields (experience, technology) in missing_fields array
-        """
-        
+        prompt = jd_analysis_prompt(message)
+
         try:
-            model = genai.GenerativeModel("models/gemini-2.5-flash")
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.1,
-                    response_mime_type="application/json",
-                ),
-            )
-            
-            result_text = getattr(response, "text", None)
+            result_text = llm.generate(prompt, response_mime_type="application/json", cache=True)
             if result_text:
-                result_text = result_text.strip()
-                clean_text = re.sub(r"```json|```", "", result_text).strip()
-                data = json.loads(clean_text)
+                data = parse_json_response(result_text)
                 return Response(data, status=status.HTTP_200_OK)
             else:
                 return Response({"error": "Failed to analyze input"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -883,29 +623,10 @@ class JDAssistantView(APIView):
     
     def generate_jd(self, request):
         """Generate complete job description based on provided fields"""
-        # Accept either `fields` (preferred) or `analysis_data` (from frontend)
-        raw_fields = request.data.get('fields')
-        analysis_data = request.data.get('analysis_data')
-
-        # If analysis_data is present, support both:
-        # 1) { status, fields: {...}, missing_fields }
-        # 2) { name, experience, technology, No_of_openings, ... } (flat shape from frontend)
-        if not raw_fields and isinstance(analysis_data, dict):
-            inner_fields = analysis_data.get('fields')
-            if isinstance(inner_fields, dict):
-                raw_fields = inner_fields
-            else:
-                # Fallback: treat the full analysis_data as the fields dict
-                raw_fields = analysis_data
-
-        fields = raw_fields or {}
+        fields = jd_fields_from_request(request.data)
 
         # Only experience and technology are required; name is optional and can be auto-suggested
-        name = fields.get('name')
-        experience = fields.get('experience')
-        technology = fields.get('technology')
-
-        if not experience or not technology:
+        if not fields.get('experience') or not fields.get('technology'):
             return Response(
                 {
                     "error": "Missing required fields",
@@ -914,42 +635,16 @@ class JDAssistantView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Auto-suggest JD name if not provided
-        if not name and technology:
-            name = f"{technology} Developer"
-            fields["name"] = name
-
-        prompt = f"""
-        Generate a comprehensive job description based on these details:
-
-        Job Title: {name}
-        Experience Required: {experience}
-        Technology: {technology}
-        Number of Openings: {fields.get('No_of_openings', 'Not specified')}
-        Notice Period: {fields.get('notice_period', 'Not specified')} days
-        Priority: {'High Priority' if fields.get('priority') else 'Normal'}
-
-        Generate a complete job description with:
-        1. Job Summary
-        2. Responsibilities  
-        3. Requirements (technical and soft skills)
-        4. Nice-to-have skills
-        5. What we offer
-
-        Format as clean text without markdown formatting.
-        """
+        prompt = jd_generation_prompt(fields)
 
-        try:
-            model = genai.GenerativeModel("models/gemini-2.5-flash")
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,
-                    response_mime_type="text/plain",
-                ),
+        if wants_stream(request):
+            return sse_response(
+                llm.stream(prompt, temperature=0.3),
+                lambda jd_text: {"fields": fields, "jd_text": jd_text.strip()},
             )
 
-            jd_text = getattr(response, "text", None)
+        try:
+            jd_text = llm.generate(prompt, temperature=0.3, response_mime_type="text/plain")
             if jd_text:
                 return Response(
                     {
@@ -980,52 +675,12 @@ class JDAssistantView(APIView):
 
         # If required fields are missing, try to extract them from jd_text using Gemini
         if (not experience or not technology) and jd_text:
-            extract_prompt = f"""
-            From the following job description text, extract structured fields.
-
-            VERY IMPORTANT INSTRUCTIONS FOR THE "technology" FIELD:
-            - Return ONLY the 1 to 3 MAIN technologies / stacks.
-            - Each technology name must be short (for example: "Python", "AWS", "React").
-            - Do NOT include versions, frameworks in brackets, long tool lists or full stacks.
-            - Do NOT return more than 3 items.
-            - If there are many skills, pick only the top 2-3 most central technologies.
-            - Join them in a single short comma-separated string, for example: "Python, AWS".
-
-            JD Text:
-            {jd_text}
-
-            Return ONLY valid JSON in this format:
-            {{
-                "name": "Job title or null",
-                "experience": "Experience requirement or null",
-                "technology": "1-3 short main technologies as a comma-separated string or null",
-                "No_of_openings": integer_or_null,
-                "notice_period": integer_or_null,
-                "priority": true_or_false_or_null
-            }}
-            """
+            extract_prompt = jd_field_extraction_prompt(jd_text)
 
             try:
-                model = genai.GenerativeModel("models/gemini-2.5-flash")
-                response = model.generate_content(
-                    extract_prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.1,
-                        response_mime_type="application/json",
-                    ),
-                )
-
-                result_text = getattr(response, "text", None)
+                result_text = llm.generate(extract_prompt, response_mime_type="application/json", cache=True)
                 if result_text:
-                    result_text = result_text.strip()
-                    clean_text = re.sub(r"```json|```", "", result_text).strip()
-                    extracted = json.loads(clean_text)
-
-                    # Merge extracted values into fields if missing
-                    for key in ["name", "experience", "technology", "No_of_openings", "notice_period", "priority"]:
-                        if not fields.get(key) and extracted.get(key) is not None:
-                            fields[key] = extracted.get(key)
-
+                    merge_missing_fields(fields, parse_json_response(result_text))
                     experience = fields.get('experience')
                     technology = fields.get('technology')
             except Exception as e:
@@ -1048,13 +703,7 @@ class JDAssistantView(APIView):
 
         try:
             # Ensure technology is short and focused (fits into CharField(max_length=50))
-            if isinstance(technology, str):
-                # Keep at most 3 comma-separated items and trim each
-                parts = [p.strip() for p in technology.split(',') if p.strip()]
-                parts = parts[:3]
-                # Limit each part length a bit to avoid one very long label
-                parts = [p[:20] for p in parts]
-                technology = ", ".join(parts)[:50]
+            technology = short_technology(technology)
 
             requirement = Requirement.objects.create(
                 name=fields.get('name', ''),
@@ -1065,7 +714,8 @@ class JDAssistantView(APIView):
                 priority=fields.get('priority', False),
                 base_text=jd_text  # Store final JD text (including user edits)
             )
-            
+            queue_question_pool(requirement)
+
             serializer = RequirementSerializer(requirement)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
@@ -1079,17 +729,41 @@ class ChatAiView(APIView):
         serializer = ChatAiSerializer(data=request.data)
         if serializer.is_valid():
             user_message = serializer.validated_data['question']
+            session_id = serializer.validated_data.get('session_id')
 
-            # Generate response using the model
-            model = genai.GenerativeModel("models/gemini-2.5-flash")
-            chat = model.start_chat()
-            response = chat.send_message(user_message)
+            if session_id:
+                session = chat.get_session(session_id, request.user)
+                if session is None:
+                    return Response({"error": "Chat session not found"}, status=status.HTTP_404_NOT_FOUND)
+            else:
+                session = chat.create_session(request.user)
+
+            if wants_stream(request):
+                async def finish(reply):
+                    reply = reply.strip()
+                    await sync_to_async(chat.record_turn)(session, user_message, reply)
+                    return {"data": {"session_id": str(session.id), "question": user_message, "response": reply}}
+
+                return sse_response(llm.stream(chat.prompt_contents(session, user_message)), finish)
+
+            try:
+                reply = llm.send_chat(user_message, history=chat.history_contents(session))
+            except llm.LLMError as e:
+                return Response({"error": f"Chat failed: {str(e)}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            chat.record_turn(session, user_message, reply)
 
             data = {
+                "session_id": str(session.id),
                 "question": user_message,
-                "response": response.text,
+                "response": reply,
             }
 
             return Response({"data": data}, status=status.HTTP_200_OK)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class LLMUsageView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(llm.usage(), status=status.HTTP_200_OK)